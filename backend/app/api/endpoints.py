@@ -1,64 +1,399 @@
-from fastapi import APIRouter, HTTPException, Header, Query
-from backend.app.models.schemas import AnalysisRequest, AnalysisResponse
+from fastapi import APIRouter, HTTPException, Path, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from backend.app.models.schemas import (
+    AnalysisRequest, AnalysisResponse, LeanAnalysisResponse, BatchAnalysisRequest, BatchAnalysisItem, MediaMetadata,
+    PlaylistInfo, JobRequest, JobStatus,
+)
 from backend.app.services.extractor import extractor
 from backend.app.services.streamer import stream_proxy
-from backend.app.services.jobs import job_controller
+from backend.app.services.segments import segment_cache
+from backend.app.services.parallel import parallel_downloader
+from backend.app.services.muxer import dash_muxer, MUX_SCHEME
+from backend.app.services.hls import hls_proxy, HLS_SCHEME, HlsError
+from backend.app.services.batch import batch_runner
+from backend.app.services.playlists import playlist_manager
+from backend.app.services.refresher import refresher, extract_and_cache
+from backend.app.services.jobs import job_controller, emit_event, JobQueueFull
+from backend.app.services.thumbnails import (
+    thumbnail_cache, with_thumbnails, playlist_with_thumbnails, negotiate, snap_width, ThumbnailError,
+)
+from backend.app.services.tokens import format_tokens, TokenError
+from backend.app.services.http_pool import http_pool
+from backend.app.services.cache import metadata_cache
+from backend.app.services.executor import EngineSaturated
+from backend.app.services.breakers import breaker_board, UpstreamsUnavailable
+from backend.app.services.urls import route
+from backend.app.core.config import settings
+from backend.app.core.log import get_logger
+from backend.app.core.metrics import ANALYZE_REQUESTS
+from backend.app.core.responses import FastJSONResponse
 import asyncio
-import uuid
-from typing import Optional
+import json
+import time
+import httpx
+from typing import Optional, Union
 
 router = APIRouter()
+log = get_logger("api")
 
-# Temporary store for metadata
-metadata_store = {}
-url_cache = {}
+async def _analyze_playlist(url: str, cache_key: str) -> AnalysisResponse:
+    """Lists the first page of a playlist; entries are resolved later, on demand or by prefetch."""
+    job_id, task, _ = job_controller.start_or_join(
+        f"playlist:{cache_key}", lambda: playlist_manager.open(url, extractor.playlist_opts())
+    )
+    try:
+        session = await asyncio.shield(task)
+        page = await playlist_manager.page(session, 0, settings.PLAYLIST_PAGE_SIZE, prefetch=_analyze)
+    except asyncio.CancelledError:
+        if not task.cancelled() or asyncio.current_task().cancelling():
+            raise
+        return AnalysisResponse(success=False, error="Analysis was cancelled.")
+    except Exception as e:
+        log.warning("Playlist listing failed for %s: %s", url, e)
+        return AnalysisResponse(success=False, error=f"Playlist error: {str(e)}")
+    log.info("Playlist %s: %d entries listed for %s", session.title, len(page.entries), url)
+    return AnalysisResponse(success=True, data=await with_thumbnails(MediaMetadata(
+        id=session.id, title=session.title, thumbnail=session.thumbnail or (page.entries[0].thumbnail if page.entries else None),
+        uploader=session.uploader, platform=session.platform, original_url=url, playlist=page,
+    )))
+
+async def _analyze(url: str) -> AnalysisResponse:
+    """Cache lookup, then a coalesced extraction; raises EngineSaturated when no worker is free."""
+    target = route(url)
+    if target.kind == "playlist":
+        return await _analyze_playlist(url, target.url)
 
-@router.post("/analyze", response_model=AnalysisResponse)
-async def analyze_url(request: AnalysisRequest):
-    print(f"\n{'='*60}")
-    print(f"[ANALYZE] Received URL: {request.url}")
-    print(f"{'='*60}\n")
-    
     # Cache hit
-    cached_id = url_cache.get(request.url)
-    if cached_id and cached_id in metadata_store:
-        print(f"[CACHE HIT] Returning cached result for: {request.url}")
-        return AnalysisResponse(success=True, data=metadata_store[cached_id])
-
-    job_id = str(uuid.uuid4())
-    task = asyncio.create_task(extractor.extract_info(request.url))
-    job_controller.register_job(job_id, task)
+    cache_key = target.url
+    cached = await metadata_cache.get_entry(cache_key)
+    if cached:
+        log.debug("Cache hit for %s", cache_key)
+        ANALYZE_REQUESTS.inc(result="cache_hit")
+        emit_event("cache_hit")
+        # Counts toward refresh priority, and revalidates in the background if close to expiry
+        refresher.on_hit(cache_key, url, *cached)
+        return AnalysisResponse(success=True, data=await with_thumbnails(cached[0]))
+
+    # Join an in-flight extraction of the same media instead of starting another
+    job_id, task, is_leader = job_controller.start_or_join(
+        cache_key, lambda: extract_and_cache(url, cache_key)
+    )
+    if not is_leader:
+        log.debug("Waiting on in-flight job %s for %s", job_id, cache_key)
+        ANALYZE_REQUESTS.inc(result="coalesced")
+        emit_event("coalesced", extraction=job_id)
     
     try:
-        metadata = await task
+        # Shield so a disconnecting client does not cancel work other callers share
+        metadata = await asyncio.shield(task)
         if metadata:
-            print(f"[SUCCESS] Analysis completed for: {request.url}")
-            print(f"[SUCCESS] Title: {metadata.title}")
-            print(f"[SUCCESS] Platform: {metadata.platform}")
-            print(f"[SUCCESS] Formats: {len(metadata.formats)}")
-            metadata_store[metadata.id] = metadata
-            url_cache[request.url] = metadata.id
-            return AnalysisResponse(success=True, data=metadata)
+            if is_leader:
+                ANALYZE_REQUESTS.inc(result="extracted")
+            log.info("Analysis completed for %s: %r on %s, %d formats",
+                     url, metadata.title, metadata.platform, len(metadata.formats))
+            return AnalysisResponse(success=True, data=await with_thumbnails(metadata))
         
         # If metadata is None, it means all strategies failed
-        print(f"[FAILED] All extraction strategies failed for: {request.url}")
+        ANALYZE_REQUESTS.inc(result="failed")
+        log.warning("All extraction strategies failed for %s", url)
         return AnalysisResponse(
             success=False, 
             error="Analysis failed. The link might be private, restricted, or unsupported. Try a different link."
         )
+    except asyncio.CancelledError:
+        # Only swallow cancellation of the shared job itself, never our own
+        if not task.cancelled() or asyncio.current_task().cancelling():
+            raise
+        log.info("Job %s was cancelled for %s", job_id, url)
+        return AnalysisResponse(success=False, error="Analysis was cancelled.")
+    except UpstreamsUnavailable as e:
+        ANALYZE_REQUESTS.inc(result="circuit_open")
+        log.warning("%s, rejecting %s", e, url)
+        raise
+    except EngineSaturated:
+        ANALYZE_REQUESTS.inc(result="busy")
+        log.warning("Extraction engine saturated, rejecting %s", url)
+        raise
     except Exception as e:
-        print(f"[!] Endpoint Exception for {request.url}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        ANALYZE_REQUESTS.inc(result="error")
+        log.exception("Analysis of %s raised", url)
         return AnalysisResponse(success=False, error=f"Analysis error: {str(e)}")
 
-@router.get("/stream")
+@router.post("/analyze", response_model=Union[AnalysisResponse, LeanAnalysisResponse])
+async def analyze_url(request: AnalysisRequest, lean: bool = Query(False)):
+    """With ?lean=1, formats carry /stream tokens instead of signed URLs and null fields are omitted."""
+    log.info("Analyze request for %s", request.url)
+    try:
+        result = await _analyze(request.url)
+    except EngineSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    if lean:
+        return FastJSONResponse(await format_tokens.lean(result, route(request.url).url), exclude_none=True)
+    return FastJSONResponse(result)
+
+@router.post("/analyze/batch")
+async def analyze_batch(request: Request, batch: BatchAnalysisRequest, format: Optional[str] = Query(None),
+                        lean: bool = Query(False)):
+    """Streams one result per URL as each finishes: NDJSON by default, SSE with ?format=sse or Accept."""
+    if len(batch.urls) > settings.BATCH_MAX_URLS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_URLS} URLs per batch")
+    sse = format == "sse" or "text/event-stream" in request.headers.get("accept", "")
+    log.info("Batch of %d URLs received", len(batch.urls))
+
+    async def results():
+        runs = batch_runner.run(batch.urls, _analyze)
+        try:
+            async for indices, result in runs:
+                if lean:
+                    result = await format_tokens.lean(result, route(batch.urls[indices[0]]).url)
+                for i in indices:
+                    line = BatchAnalysisItem(index=i, url=batch.urls[i], result=result).model_dump_json(exclude_none=lean)
+                    yield f"data: {line}\n\n" if sse else line + "\n"
+            if sse:
+                yield "event: done\ndata: {}\n\n"
+        finally:
+            # A client that disconnects mid-batch stops the analyses still queued for it
+            await runs.aclose()
+
+    return StreamingResponse(
+        results(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _run_job(url: str) -> AnalysisResponse:
+    """Job body: like /analyze, but waits out engine saturation instead of rejecting."""
+    while True:
+        try:
+            return await _analyze(url)
+        except EngineSaturated as e:
+            emit_event("waiting_for_worker", retry_after=e.retry_after)
+            await asyncio.sleep(e.retry_after)
+
+def _job_status(job_id: str) -> JobStatus:
+    record = job_controller.get_record(job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return JobStatus(**record.to_dict())
+
+@router.post("/jobs", response_model=JobStatus, status_code=202)
+async def submit_job(request: JobRequest):
+    try:
+        record = job_controller.submit(request.url, lambda: _run_job(request.url), request.priority)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(settings.EXTRACTION_RETRY_AFTER)})
+    log.info("Job %s queued for %s", record.id, request.url)
+    return JobStatus(**record.to_dict())
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    return _job_status(job_id)
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent progress events, replayed from the start, ending with the final job status."""
+    record = job_controller.get_record(job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+
+    async def events():
+        seen = 0
+        while True:
+            await record.wait_for_change(seen)
+            for event in record.events[seen:]:
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+            seen = len(record.events)
+            if record.done:
+                yield f"event: result\ndata: {JobStatus(**record.to_dict()).model_dump_json()}\n\n"
+                return
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.delete("/jobs/{job_id}", response_model=JobStatus)
+async def cancel_job(job_id: str):
+    status = _job_status(job_id)
+    if job_controller.cancel_job(job_id):
+        # Let the job's task observe the cancellation before reporting
+        await asyncio.sleep(0)
+        status = _job_status(job_id)
+    return status
+
+@router.get("/playlist/{playlist_id}", response_model=PlaylistInfo)
+async def playlist_page(playlist_id: str, offset: int = Query(0, ge=0), limit: int = Query(None, ge=1)):
+    session = playlist_manager.get(playlist_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Playlist listing expired; analyze the URL again")
+    try:
+        page = await playlist_manager.page(session, offset, limit or settings.PLAYLIST_PAGE_SIZE, prefetch=_analyze)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Playlist error: {e}")
+    return await playlist_with_thumbnails(page) if settings.THUMB_ENABLED else page
+
+@router.get("/thumb")
+async def thumbnail(
+    request: Request,
+    src: Optional[str] = Query(None),
+    id: Optional[str] = Query(None, pattern="^[0-9a-f]{64}$"),
+    w: int = Query(320, ge=16),
+    fmt: Optional[str] = Query(None),
+):
+    """Resized, re-encoded thumbnail of `src` (fetched once) or of an inline image stored under `id`."""
+    if not settings.THUMB_ENABLED:
+        raise HTTPException(status_code=404, detail="Thumbnails are disabled")
+    try:
+        if id:
+            digest = id
+        elif src and src.startswith(("http://", "https://")):
+            digest = await thumbnail_cache.source_for_url(src)
+        else:
+            raise HTTPException(status_code=400, detail="Pass an http(s) `src` or an `id`")
+        path, etag, media_type = await thumbnail_cache.render(
+            digest, snap_width(w), negotiate(request.headers.get("accept", ""), fmt))
+    except ThumbnailError as e:
+        raise HTTPException(status_code=404 if id else 502, detail=str(e))
+
+    # The URL names the source and width, and the encoding depends on Accept
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=604800", "Vary": "Accept"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+@router.api_route("/stream", methods=["GET", "HEAD"])
 async def stream_media(
-    url: str = Query(...), 
+    request: Request,
+    url: Optional[str] = Query(None),
     filename: Optional[str] = Query(None),
-    range: Optional[str] = Header(None)
+    media_id: Optional[str] = Query(None),
+    format_id: Optional[str] = Query(None),
+    # From a lean analysis; replaces url, media_id and format_id
+    token: Optional[str] = Query(None),
 ):
+    started = time.perf_counter()
+    # Segment cache identity; only set when the server resolved the format itself
+    cache_id = None
+    if token:
+        try:
+            metadata, fmt = await format_tokens.resolve(token)
+        except TokenError as e:
+            raise HTTPException(status_code=e.status, detail=str(e))
+        except EngineSaturated as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        url, media_id, format_id = fmt.url, metadata.id, fmt.format_id
+        cache_id = f"{metadata.platform}:{metadata.id}"
+    elif not url:
+        raise HTTPException(status_code=400, detail="Pass a `url` or a `token`")
     try:
-        return await stream_proxy.proxy_stream(url, range, filename)
+        # Signed URLs held by the page may have expired since it was analyzed
+        url = await refresher.fresh_url(media_id, format_id, url)
+        # Lets an interrupted transfer continue on a re-resolved URL
+        resolve = (lambda: refresher.reresolve(media_id, format_id)) if media_id and format_id else None
+        if url.startswith(MUX_SCHEME):
+            return stream_proxy.metered(dash_muxer.stream(url, filename, method=request.method), "mux", started)
+        if url.startswith(HLS_SCHEME):
+            # A rewritten playlist for players; downloads get the segments concatenated
+            # Upstream headers are only honoured when the server resolved the format (token)
+            return stream_proxy.metered(await hls_proxy.open(url, filename, trusted=bool(token)), "hls", started)
+        # A whole-file download (not a player seeking) can be fetched over parallel ranges
+        parallel = bool(filename) and request.method == "GET" and "range" not in request.headers \
+            and settings.PARALLEL_DOWNLOADS_ENABLED
+        # Token-resolved formats go through the shared segment cache. A client-supplied url is proxied
+        # as-is: its media_id/format_id say nothing about the bytes behind it
+        if cache_id and request.method == "GET" and settings.SEGMENT_CACHE_ENABLED:
+            path = "segments"
+            response = await segment_cache.serve(cache_id, format_id, url, request.headers, filename, parallel, resolve)
+        elif parallel:
+            path = "parallel"
+            response = await parallel_downloader.download(url, request.headers, filename)
+        else:
+            path = "proxy"
+            response = await stream_proxy.proxy_stream(url, request.headers, filename, method=request.method, resolve=resolve)
+        return stream_proxy.metered(response, path, started)
+    except HlsError as e:
+        raise HTTPException(status_code=e.status, detail=str(e))
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Upstream error: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/hls/{session_id}/{kind}")
+async def hls_resource(
+    request: Request,
+    session_id: str,
+    kind: str = Path(..., pattern="^[ps]$"),
+    u: str = Query(...),
+):
+    """Playlist (p) or segment (s) of a proxied HLS stream; these URLs only come from rewritten playlists."""
+    session = hls_proxy.get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=410, detail="HLS session expired; reload the stream")
+    try:
+        return await hls_proxy.resource(session, kind, u, request.headers.get("range"))
+    except HlsError as e:
+        raise HTTPException(status_code=e.status, detail=str(e))
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Upstream error: {e}")
+
+@router.get("/stats/http")
+async def http_stats():
+    return http_pool.stats()
+
+@router.get("/stats/cache")
+async def cache_stats():
+    return metadata_cache.stats()
+
+@router.get("/stats/segments")
+async def segment_stats():
+    return segment_cache.stats()
+
+@router.get("/stats/downloads")
+async def download_stats():
+    return parallel_downloader.stats()
+
+@router.get("/stats/mux")
+async def mux_stats():
+    return dash_muxer.stats()
+
+@router.get("/stats/batch")
+async def batch_stats():
+    return batch_runner.stats()
+
+@router.get("/stats/playlists")
+async def playlist_stats():
+    return playlist_manager.stats()
+
+@router.get("/stats/refresh")
+async def refresh_stats():
+    return refresher.stats()
+
+@router.get("/stats/thumbs")
+async def thumb_stats():
+    return thumbnail_cache.stats()
+
+@router.get("/stats/tokens")
+async def token_stats():
+    return format_tokens.stats()
+
+@router.get("/stats/hls")
+async def hls_stats():
+    return hls_proxy.stats()
+
+@router.get("/stats/stream")
+async def stream_stats():
+    return stream_proxy.stats()
+
+@router.get("/stats/jobs")
+async def job_stats():
+    return job_controller.stats()
+
+@router.get("/stats/breakers")
+async def breaker_stats():
+    return breaker_board.stats()
+
+@router.get("/stats/executor")
+async def executor_stats():
+    return extractor.engine.stats()
+
+@router.get("/stats/strategies")
+async def strategy_stats():
+    return {**extractor.planner.stats(), **extractor.counters}
@@ -6,19 +6,181 @@ class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     CORS_ORIGINS: list[str] = ["*"]
     
+    # Log level of the `mediaflow` loggers; records are written by a background thread
+    LOG_LEVEL: str = "INFO"
+    # Prometheus text format at /metrics
+    METRICS_ENABLED: bool = True
+    # JSON bodies at least this large are brotli/gzip compressed when the client accepts it (0 disables)
+    RESPONSE_COMPRESS_MIN_BYTES: int = 1024
+    RESPONSE_GZIP_LEVEL: int = 6
+    RESPONSE_BROTLI_QUALITY: int = 5
+    # Lean analyses (?lean=1): format tokens stay resolvable this long after they are first issued
+    TOKEN_TTL: int = 24 * 3600
+    # Analyses too close to expiry for the cache are still kept locally this long (never past their
+    # URLs' expiry), so repeated /stream?token= calls don't each re-extract
+    TOKEN_UNCACHED_GRACE: int = 120
+
     # Storage settings
     DOWNLOAD_PATH: str = "downloads"
     
     # Extraction settings
     ANALYSIS_TIMEOUT: int = 15
+    # Strategy scheduler: rolling window per (domain, strategy) and hedging delays in seconds
+    STRATEGY_STATS_WINDOW: int = 200
+    # Domains with stats kept; the least recently analyzed are forgotten beyond this
+    STRATEGY_MAX_DOMAINS: int = 512
+    STRATEGY_HEDGE_DELAY: float = 1.5
+    STRATEGY_HEDGE_MIN_DELAY: float = 0.25
+    STRATEGY_HEDGE_MAX_DELAY: float = 6.0
+    # Cobalt-style resolver tried as a last resort (POST {"url": ...} -> {"url": ...})
+    FALLBACK_NODE_URL: str = "https://api.cobalt.tools/api/json"
+    # Circuit breaker per (strategy, upstream host): opens when at least BREAKER_MIN_CALLS calls in the
+    # last BREAKER_WINDOW seconds failed at BREAKER_FAILURE_RATE or worse; open strategies are skipped
+    BREAKER_ENABLED: bool = True
+    BREAKER_WINDOW: int = 60
+    BREAKER_MIN_CALLS: int = 5
+    BREAKER_FAILURE_RATE: float = 0.5
+    # Open time before one probe call is let through; doubles on each failed probe, up to the max
+    BREAKER_OPEN_SECONDS: float = 30.0
+    BREAKER_MAX_OPEN_SECONDS: float = 600.0
+    # +/- fraction applied to open times, so instances don't probe an upstream in lockstep
+    BREAKER_JITTER: float = 0.2
+    BREAKER_MAX_TRACKED: int = 1024
+    # Byte caps for streamed page scrapes
+    SCRAPE_MAX_BYTES: int = 512 * 1024
+    GOOGLE_SCAN_MAX_BYTES: int = 2 * 1024 * 1024
+
+    # Upstream HTTP pool settings
+    HTTP2_ENABLED: bool = True
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 20
+    HTTP_MAX_KEEPALIVE_PER_HOST: int = 10
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_MAX_HOSTS: int = 64
+
+    # Metadata cache settings
+    CACHE_MAX_ENTRIES: int = 2000
+    CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    CACHE_DEFAULT_TTL: int = 3600
+    CACHE_PLATFORM_TTLS: dict[str, int] = {
+        "Youtube": 4 * 3600,
+        "Instagram": 1800,
+        "RapidScrape": 1800,
+        "FallbackAPI": 600,
+        "DirectLink": 24 * 3600,
+    }
+    # Signed URLs are dropped this many seconds before their embedded expiry
+    CACHE_EXPIRY_MARGIN: int = 300
+    # Shared tier behind the in-process cache: "memory" (none), "sqlite" or "redis"
+    CACHE_BACKEND: str = "memory"
+    CACHE_SQLITE_PATH: str = ""
+    CACHE_SQLITE_MAX_ENTRIES: int = 50000
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    CACHE_KEY_PREFIX: str = "mediaflow:"
+
+    # yt-dlp extraction engine: "thread" pool or warm "process" pool
+    EXTRACTION_MODE: str = "thread"
+    EXTRACTION_WORKERS: int = 4
+    # Extractions allowed to wait for a worker before new ones are rejected
+    EXTRACTION_QUEUE_LIMIT: int = 16
+    EXTRACTION_RETRY_AFTER: int = 5
+    # Load yt-dlp on the workers in the background right after startup instead of on the first extraction
+    EXTRACTION_PREWARM: bool = True
+
+    # On-disk cache of proxied media, stored as fixed-size byte-range segments
+    SEGMENT_CACHE_ENABLED: bool = True
+    SEGMENT_SIZE: int = 1024 * 1024
+    SEGMENT_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+
+    # Downloads (?filename=) fetch this many byte ranges concurrently; some CDNs throttle per connection
+    PARALLEL_DOWNLOADS_ENABLED: bool = True
+    PARALLEL_CONNECTIONS: int = 4
+    # Per-host overrides, matched on the host or any parent domain
+    PARALLEL_HOST_CONNECTIONS: dict[str, int] = {"googlevideo.com": 6}
+    PARALLEL_PART_SIZE: int = 2 * 1024 * 1024
+    PARALLEL_PART_RETRIES: int = 2
+
+    # Remux YouTube's separate video/audio streams into HD formats (needs ffmpeg on PATH)
+    MUX_ENABLED: bool = True
+    FFMPEG_PATH: str = "ffmpeg"
+    MUX_MAX_PROCESSES: int = 2
+
+    # POST /analyze/batch
+    BATCH_MAX_URLS: int = 500
+    # Analyses running at once across all batches, and per domain
+    BATCH_CONCURRENCY: int = 8
+    BATCH_PER_DOMAIN_CONCURRENCY: int = 2
+    BATCH_SATURATED_RETRIES: int = 3
+
+    # Playlists and channels are listed lazily on their own small thread pool
+    PLAYLIST_WORKERS: int = 2
+    PLAYLIST_PAGE_SIZE: int = 50
+    PLAYLIST_MAX_PAGE_SIZE: int = 200
+    # Entries of each served page resolved in the background, and how many at once
+    PLAYLIST_PREFETCH: int = 5
+    PLAYLIST_PREFETCH_CONCURRENCY: int = 2
+    PLAYLIST_SESSION_TTL: int = 1800
+    PLAYLIST_MAX_SESSIONS: int = 100
+
+    # Async job API (POST /jobs): jobs running at once, waiting, and kept for polling
+    JOBS_MAX_CONCURRENT: int = 4
+    JOB_MAX_QUEUED: int = 200
+    JOB_MAX_RECORDS: int = 1000
+    JOB_RETENTION_SECONDS: int = 900
+    JOB_MAX_EVENTS: int = 100
+
+    # /thumb: resized, re-encoded thumbnails in a content-addressed disk cache (needs Pillow)
+    THUMB_ENABLED: bool = True
+    THUMB_WIDTHS: list[int] = [160, 320, 640, 960]
+    THUMB_QUALITY: int = 80
+    THUMB_AVIF: bool = True
+    THUMB_WORKERS: int = 2
+    THUMB_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    # Source URL -> stored image mappings kept (a tiny file each); signed URLs mint a new one per analysis
+    THUMB_MAX_REFS: int = 20000
+    THUMB_MAX_SOURCE_BYTES: int = 8 * 1024 * 1024
+    THUMB_FETCH_TIMEOUT: float = 10.0
+
+    # Background refresh of popular cached analyses before their signed URLs expire
+    REFRESH_ENABLED: bool = True
+    REFRESH_INTERVAL: int = 30
+    # Refresh entries whose cache expiry is this close (at most half their lifetime); a cache hit inside
+    # this window refreshes at once. Entries that live no longer than this are never refreshed
+    REFRESH_LEAD: int = 600
+    REFRESH_CONCURRENCY: int = 2
+    # Access score (decaying hit count) an entry needs to be refreshed by the background loop
+    REFRESH_MIN_SCORE: float = 2.0
+    REFRESH_HALF_LIFE: int = 1800
+    REFRESH_FORGET_AFTER: int = 6 * 3600
+    REFRESH_MAX_TRACKED: int = 5000
+    # /stream swaps in a refreshed URL when the requested one expires within this many seconds
+    REFRESH_STREAM_MARGIN: int = 30
+
+    # HLS (m3u8) formats: playlists are rewritten to point at /hls and fetched with the format's yt-dlp headers
+    HLS_ENABLED: bool = True
+    # Segments fetched ahead of the one being played, concurrently, into a bounded in-memory LRU
+    HLS_PREFETCH_SEGMENTS: int = 3
+    HLS_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    HLS_MAX_SEGMENT_BYTES: int = 16 * 1024 * 1024
+    # Each /stream of an HLS format opens its own session; idle ones expire, the oldest go past the cap
+    HLS_SESSION_TTL: int = 3600
+    HLS_MAX_SESSIONS: int = 256
+    # Playlists (master, renditions) remembered per session; the least recently fetched is forgotten
+    HLS_SESSION_MAX_PLAYLISTS: int = 32
+    # Downloads (?filename=) of a finished, unencrypted HLS stream concatenate its segments into one file
+    HLS_CONCAT_ENABLED: bool = True
+
+    # Resume a proxied transfer this many times (with exponential backoff) when the upstream drops
+    STREAM_RESUME_RETRIES: int = 3
+    STREAM_RESUME_BACKOFF: float = 0.5
     
     class Config:
         case_sensitive = True
 
 settings = Settings()
 
-# Ensure directories exist
+# Directories under DOWNLOAD_PATH are created by whatever first writes there, never at import
 if os.environ.get("VERCEL"):
     settings.DOWNLOAD_PATH = "/tmp/downloads"
-
-os.makedirs(settings.DOWNLOAD_PATH, exist_ok=True)
+    # A serverless instance may be frozen right after the response; don't spend it warming yt-dlp
+    if "EXTRACTION_PREWARM" not in os.environ:
+        settings.EXTRACTION_PREWARM = False
@@ -0,0 +1,35 @@
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Optional
+from backend.app.core.config import settings
+
+# Records are handed to a queue on the calling thread; one listener thread does the slow stdout writes
+_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def setup_logging():
+    """Routes the `mediaflow` logger through a non-blocking queue handler (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+    root = logging.getLogger("mediaflow")
+    root.setLevel(settings.LOG_LEVEL.upper())
+    root.propagate = False
+    if not root.handlers:
+        root.addHandler(logging.handlers.QueueHandler(_queue))
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+    _listener = logging.handlers.QueueListener(_queue, output)
+    _listener.start()
+
+def shutdown_logging():
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"mediaflow.{name}")
@@ -0,0 +1,154 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+# Seconds; spans from sub-millisecond cache work up to a full analysis timeout
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Bytes per second of a finished stream
+THROUGHPUT_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(8))
+
+LabelKey = Tuple[Tuple[str, str], ...]
+Sample = Tuple[Dict[str, str], float]
+
+def _key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _fmt_labels(key: Iterable[Tuple[str, str]]) -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in key]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _fmt_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_fmt_labels(k)} {_fmt_value(v)}" for k, v in self.values.items()]
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help = name, help
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., sum, count]
+        self.values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _key(labels)
+        row = self.values.get(key)
+        if row is None:
+            row = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+                break
+        row[-2] += value
+        row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall time of the block; `labels` may be updated inside it (e.g. the outcome)."""
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, row in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_fmt_labels(key + (('le', _fmt_value(bound)),))} {cumulative}")
+            # Observations above the last bound only show up in +Inf
+            lines.append(f"{self.name}_bucket{_fmt_labels(key + (('le', '+Inf'),))} {row[-1]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(key)} {row[-2]:.6f}")
+            lines.append(f"{self.name}_count{_fmt_labels(key)} {row[-1]}")
+        return lines
+
+class Collected:
+    """Gauge or counter whose samples are read from existing service stats at scrape time."""
+    def __init__(self, name: str, kind: str, help: str,
+                 fn: Callable[[], Union[float, Iterable[Sample]]]):
+        self.name, self.kind, self.help, self.fn = name, kind, help, fn
+
+    def render(self) -> List[str]:
+        samples = self.fn()
+        if isinstance(samples, (int, float)):
+            samples = [({}, samples)]
+        return [f"{self.name}{_fmt_labels(_key(labels))} {_fmt_value(value)}" for labels, value in samples]
+
+class Registry:
+    """Minimal Prometheus registry: recording is a dict update, formatting happens only on scrape."""
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._add(Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, buckets))
+
+    def collect(self, name: str, kind: str, help: str, fn: Callable[[], Union[float, Iterable[Sample]]]):
+        self._add(Collected(name, kind, help, fn))
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4."""
+        out = []
+        for metric in self.metrics.values():
+            try:
+                lines = metric.render()
+            except Exception as e:
+                # A broken collector must not take the whole scrape down
+                out.append(f"# {metric.name} collection failed: {_escape(str(e))}")
+                continue
+            out.append(f"# HELP {metric.name} {metric.help}")
+            out.append(f"# TYPE {metric.name} {metric.kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+registry = Registry()
+
+# Analysis
+ANALYZE_REQUESTS = registry.counter(
+    "mediaflow_analyze_requests_total", "Analyze lookups by how they were answered (cache_hit, coalesced, extracted, failed, busy, circuit_open, error).")
+ANALYZE_SECONDS = registry.histogram(
+    "mediaflow_analyze_seconds", "End-to-end extraction time of one URL, by outcome.")
+ANALYZE_STAGE_SECONDS = registry.histogram(
+    "mediaflow_analyze_stage_seconds", "Time spent in each analysis stage (url_clean, google_resolve, ydl_queue_wait, ydl_execution, parse_info).")
+STRATEGY_SECONDS = registry.histogram(
+    "mediaflow_strategy_seconds", "Latency of each extraction strategy attempt, by outcome.")
+
+# Stream proxy
+STREAM_TTFB_SECONDS = registry.histogram(
+    "mediaflow_stream_ttfb_seconds", "Time from /stream request to the first body byte, by serving path.")
+STREAM_BYTES = registry.counter(
+    "mediaflow_stream_bytes_total", "Body bytes sent to clients, by serving path.")
+STREAM_THROUGHPUT = registry.histogram(
+    "mediaflow_stream_throughput_bytes_per_second", "Average throughput of finished streams, by serving path.", THROUGHPUT_BUCKETS)
+
+# API responses
+JSON_RESPONSE_BYTES = registry.counter(
+    "mediaflow_json_response_bytes_total", "JSON response body bytes before (stage=raw) and after (stage=sent) compression, by encoding.")
@@ -0,0 +1,102 @@
+import gzip
+import json
+from typing import Any, Optional
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from backend.app.core.config import settings
+from backend.app.core.metrics import JSON_RESPONSE_BYTES
+
+try:
+    import orjson
+except ImportError:  # the stdlib encoder is slower but equivalent
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+class FastJSONResponse(JSONResponse):
+    """Compact JSON via pydantic's serializer for models and orjson for everything else.
+
+    Endpoints that return one directly also skip FastAPI's response_model re-validation.
+    """
+    def __init__(self, content: Any, *args, exclude_none: bool = False, **kwargs):
+        self.exclude_none = exclude_none
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.model_dump_json(exclude_none=self.exclude_none).encode()
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Best of br/gzip the client accepts (honouring q=0), or None for identity."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0)
+
+class CompressJSONMiddleware:
+    """Compresses complete JSON bodies of at least RESPONSE_COMPRESS_MIN_BYTES.
+
+    Media, event streams and anything sent in several chunks pass through untouched, so
+    proxied ranges keep their byte offsets and streamed lines are never held back.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or settings.RESPONSE_COMPRESS_MIN_BYTES <= 0:
+            return await self.app(scope, receive, send)
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        held: Optional[Message] = None
+
+        async def send_compressed(message: Message):
+            nonlocal held
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if headers.get("content-type", "").startswith("application/json") and "content-encoding" not in headers:
+                    # Wait for the body to decide; JSON responses arrive in one piece
+                    held = message
+                    return
+            elif held is not None:
+                start, held = held, None
+                body = message.get("body", b"")
+                headers = MutableHeaders(raw=start["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if encoding and not message.get("more_body") and len(body) >= settings.RESPONSE_COMPRESS_MIN_BYTES:
+                    compressed = compress(body, encoding)
+                    JSON_RESPONSE_BYTES.inc(len(body), stage="raw", encoding=encoding)
+                    JSON_RESPONSE_BYTES.inc(len(compressed), stage="sent", encoding=encoding)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(compressed))
+                    message = {**message, "body": compressed}
+                elif body:
+                    JSON_RESPONSE_BYTES.inc(len(body), stage="raw", encoding="identity")
+                    JSON_RESPONSE_BYTES.inc(len(body), stage="sent", encoding="identity")
+                await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -1,11 +1,49 @@
+import time
+# Measured from here so /metrics can report what a cold start spends importing the app
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from backend.app.api.endpoints import router as api_router
 from backend.app.core.config import settings
+from backend.app.core.log import setup_logging, shutdown_logging
+from backend.app.core.metrics import registry
+from backend.app.core.responses import FastJSONResponse, CompressJSONMiddleware
+from backend.app.services.http_pool import http_pool
+from backend.app.services.cache import metadata_cache
+from backend.app.services.breakers import breaker_board
+from backend.app.services.extractor import extractor
+from backend.app.services.jobs import job_controller
+from backend.app.services.playlists import playlist_manager
+from backend.app.services.refresher import refresher
+from backend.app.services.segments import segment_cache
+from backend.app.services.thumbnails import thumbnail_cache
+from backend.app.services.hls import hls_proxy
 import os
 
-app = FastAPI(title=settings.PROJECT_NAME)
+setup_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_logging()
+    refresher.start()
+    if settings.EXTRACTION_PREWARM:
+        extractor.engine.start_prewarm()
+    yield
+    await refresher.stop()
+    # Drain pooled upstream connections on shutdown
+    await http_pool.aclose()
+    await metadata_cache.aclose()
+    extractor.engine.shutdown()
+    playlist_manager.shutdown()
+    thumbnail_cache.shutdown()
+    hls_proxy.shutdown()
+    shutdown_logging()
+
+app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan, default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -14,14 +52,47 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressJSONMiddleware)
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
-# Static files mounting
-frontend_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "frontend")
-if os.path.exists(frontend_path):
-    app.mount("/", StaticFiles(directory=frontend_path, html=True), name="frontend")
+# Service state read at scrape time, so the hot paths keep their plain counters
+registry.collect("mediaflow_metadata_cache_lookups_total", "counter", "Metadata cache lookups by result.",
+                 lambda: [({"result": "hit"}, metadata_cache.counters["hits"]),
+                          ({"result": "miss"}, metadata_cache.counters["misses"])])
+registry.collect("mediaflow_extraction_queue_depth", "gauge", "yt-dlp extractions waiting for a worker.",
+                 lambda: extractor.engine.stats()["queued"])
+registry.collect("mediaflow_extraction_running", "gauge", "yt-dlp extractions running on a worker.",
+                 lambda: extractor.engine.stats()["running"])
+registry.collect("mediaflow_extraction_jobs_total", "counter", "yt-dlp extractions by final state.",
+                 lambda: [({"state": k}, extractor.engine.counters[k]) for k in ("completed", "failed", "rejected", "cancelled")])
+registry.collect("mediaflow_jobs_queued", "gauge", "Async jobs waiting for a slot.",
+                 lambda: job_controller.stats()["jobs_queued"])
+registry.collect("mediaflow_segment_cache_bytes_total", "counter", "Segment cache bytes served, by source.",
+                 lambda: [({"source": "disk"}, segment_cache.counters["bytes_from_disk"]),
+                          ({"source": "upstream"}, segment_cache.counters["bytes_from_upstream"])])
+registry.collect("mediaflow_circuit_breakers", "gauge", "Upstream circuit breakers by state.",
+                 lambda: [({"state": s}, n) for s, n in breaker_board.states().items()])
+registry.collect("mediaflow_circuit_rejected_total", "counter", "Strategy runs skipped because their circuit was open.",
+                 lambda: breaker_board.rejected)
+registry.collect("mediaflow_upstream_connections", "gauge", "Pooled upstream connections by state.",
+                 lambda: [({"state": s}, http_pool.stats()[s]) for s in ("idle", "active")])
+
+registry.collect("mediaflow_startup_import_seconds", "gauge", "Time spent importing the app at process start.",
+                 lambda: IMPORT_SECONDS)
+
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/api/health")
 async def health():
     return {"status": "online", "project": "MediaFlow"}
+
+# Static files last: a mount at "/" would otherwise shadow the routes above
+frontend_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "frontend")
+if os.path.exists(frontend_path):
+    app.mount("/", StaticFiles(directory=frontend_path, html=True), name="frontend")
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Union
 
 class MediaFormat(BaseModel):
     format_id: str
@@ -8,6 +8,28 @@ class MediaFormat(BaseModel):
     filesize: Optional[int] = None
     quality_label: Optional[str] = None
     url: Optional[str] = None
+    # "hls" when /stream answers with a playlist (needs an HLS-capable player); None for a plain file
+    protocol: Optional[str] = None
+
+class PlaylistEntry(BaseModel):
+    index: int
+    id: str
+    title: str
+    # Analyze this URL to resolve the entry's formats
+    url: str
+    duration: Optional[float] = None
+    thumbnail: Optional[str] = None
+
+class PlaylistInfo(BaseModel):
+    id: str
+    title: str
+    uploader: Optional[str] = None
+    # Unknown until the listing is exhausted, unless the site reports it up front
+    total: Optional[int] = None
+    offset: int = 0
+    entries: List[PlaylistEntry] = []
+    # Pass to GET /playlist/{id}?offset= for the next page; None on the last page
+    next_offset: Optional[int] = None
 
 class MediaMetadata(BaseModel):
     id: str
@@ -18,6 +40,8 @@ class MediaMetadata(BaseModel):
     platform: str
     formats: List[MediaFormat] = []
     original_url: str
+    # Set instead of formats when the URL is a playlist or channel
+    playlist: Optional[PlaylistInfo] = None
 
 class AnalysisRequest(BaseModel):
     url: str
@@ -26,3 +50,56 @@ class AnalysisResponse(BaseModel):
     success: bool
     data: Optional[MediaMetadata] = None
     error: Optional[str] = None
+
+class LeanFormat(BaseModel):
+    format_id: str
+    # Opaque handle for GET /stream?token=; the signed URL behind it stays server-side
+    token: str
+    extension: str
+    resolution: Optional[str] = None
+    filesize: Optional[int] = None
+    quality_label: Optional[str] = None
+    protocol: Optional[str] = None
+
+class LeanMetadata(BaseModel):
+    """MediaMetadata without upstream URLs: no original_url, and tokens in place of format URLs."""
+    id: str
+    title: str
+    thumbnail: Optional[str] = None
+    duration: Optional[float] = None
+    uploader: Optional[str] = None
+    platform: str
+    formats: List[LeanFormat] = []
+    playlist: Optional[PlaylistInfo] = None
+
+class LeanAnalysisResponse(BaseModel):
+    success: bool
+    data: Optional[LeanMetadata] = None
+    error: Optional[str] = None
+
+class JobRequest(BaseModel):
+    url: str
+    # Higher runs first; jobs of equal priority run in submission order
+    priority: int = 0
+
+class JobStatus(BaseModel):
+    id: str
+    url: str
+    # queued | running | succeeded | failed | cancelled
+    status: str
+    priority: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    queue_seconds: float
+    run_seconds: Optional[float] = None
+    result: Optional[AnalysisResponse] = None
+
+class BatchAnalysisRequest(BaseModel):
+    urls: List[str]
+
+class BatchAnalysisItem(BaseModel):
+    # Position of the URL in the request; duplicates get one item each
+    index: int
+    url: str
+    result: Union[AnalysisResponse, LeanAnalysisResponse]
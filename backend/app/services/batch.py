@@ -0,0 +1,86 @@
+import asyncio
+from typing import AsyncGenerator, Awaitable, Callable, Dict, Any, List, Optional, Tuple
+from backend.app.core.config import settings
+from backend.app.models.schemas import AnalysisResponse
+from backend.app.services.executor import EngineSaturated
+from backend.app.services.urls import route
+
+class BatchRunner:
+    """Runs many analyses under a process-wide and a per-domain concurrency limit."""
+    def __init__(self):
+        self._global: Optional[asyncio.Semaphore] = None
+        # Per-domain slots live only while some analysis for that domain is queued or running
+        self._domains: Dict[str, asyncio.Semaphore] = {}
+        self._domain_users: Dict[str, int] = {}
+        self.counters = {"batches": 0, "urls": 0, "duplicates": 0, "saturated_retries": 0}
+
+    def _acquire_domain(self, domain: str) -> asyncio.Semaphore:
+        if domain not in self._domains:
+            self._domains[domain] = asyncio.Semaphore(settings.BATCH_PER_DOMAIN_CONCURRENCY)
+        self._domain_users[domain] = self._domain_users.get(domain, 0) + 1
+        return self._domains[domain]
+
+    def _release_domain(self, domain: str):
+        self._domain_users[domain] -= 1
+        if not self._domain_users[domain]:
+            del self._domain_users[domain], self._domains[domain]
+
+    async def _run_one(self, url: str, domain: str,
+                       analyze: Callable[[str], Awaitable[AnalysisResponse]]) -> AnalysisResponse:
+        slot = self._acquire_domain(domain)
+        try:
+            # Domain first, so a busy domain never holds a global slot while it waits
+            async with slot, self._global:
+                for attempt in range(settings.BATCH_SATURATED_RETRIES + 1):
+                    try:
+                        return await analyze(url)
+                    except EngineSaturated as e:
+                        if attempt == settings.BATCH_SATURATED_RETRIES:
+                            return AnalysisResponse(success=False, error=str(e))
+                        self.counters["saturated_retries"] += 1
+                        await asyncio.sleep(e.retry_after)
+                    except Exception as e:
+                        return AnalysisResponse(success=False, error=f"Analysis error: {str(e)}")
+        finally:
+            self._release_domain(domain)
+
+    async def run(self, urls: List[str], analyze: Callable[[str], Awaitable[AnalysisResponse]]
+                  ) -> AsyncGenerator[Tuple[List[int], AnalysisResponse], None]:
+        """Yields (input indices, response) per canonical URL, in completion order."""
+        if self._global is None:
+            self._global = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+        self.counters["batches"] += 1
+        self.counters["urls"] += len(urls)
+
+        # Inputs that canonicalize to the same media share one analysis
+        groups: Dict[str, List[int]] = {}
+        domains: Dict[str, str] = {}
+        for i, url in enumerate(urls):
+            target = route(url)
+            groups.setdefault(target.url, []).append(i)
+            domains.setdefault(target.url, target.host)
+        self.counters["duplicates"] += len(urls) - len(groups)
+
+        tasks = {
+            asyncio.create_task(self._run_one(urls[indices[0]], domains[key], analyze)): indices
+            for key, indices in groups.items()
+        }
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield tasks[task], task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "concurrency": settings.BATCH_CONCURRENCY,
+            "per_domain_concurrency": settings.BATCH_PER_DOMAIN_CONCURRENCY,
+            "active_domains": len(self._domains),
+        }
+
+batch_runner = BatchRunner()
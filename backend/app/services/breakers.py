@@ -0,0 +1,206 @@
+import math
+import random
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Deque, Dict, Any, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+from backend.app.core.config import settings
+from backend.app.core.log import get_logger
+from backend.app.services.executor import EngineSaturated
+
+log = get_logger("breakers")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class UpstreamError(Exception):
+    """The upstream itself failed (rate limited, blocked, down), as opposed to having nothing for the URL."""
+
+class UpstreamsUnavailable(EngineSaturated):
+    """Every strategy for a URL sits behind an open circuit; retry once the first one probes again."""
+    def __init__(self, domain: str, retry_after: int):
+        super().__init__(retry_after)
+        self.args = (f"Upstreams for {domain} are failing, retry later",)
+
+@lru_cache(maxsize=16)
+def _host(url: str) -> str:
+    return urlsplit(url).hostname or url
+
+def breaker_name(strategy: str, domain: str) -> Optional[str]:
+    """The fallback node is one host shared by every domain; the other strategies call the media's own host."""
+    if strategy == "direct_file":
+        return None  # resolved locally
+    upstream = _host(settings.FALLBACK_NODE_URL) if strategy == "fallback_node" else domain
+    return f"{strategy}@{upstream}"
+
+class BreakerCall:
+    """Permit for one call through a breaker; only the first outcome reported counts."""
+    __slots__ = ("breaker", "probe", "settled")
+
+    def __init__(self, breaker: Optional["CircuitBreaker"], probe: bool):
+        self.breaker = breaker
+        self.probe = probe
+        self.settled = False
+
+    def success(self):
+        self._settle(True)
+
+    def failure(self):
+        self._settle(False)
+
+    def abandon(self):
+        """Releases the permit without an outcome: cancelled, or shed for lack of capacity."""
+        self._settle(None)
+
+    def _settle(self, ok: Optional[bool]):
+        if self.settled:
+            return
+        self.settled = True
+        if self.breaker is not None:
+            self.breaker._settle(self, ok)
+
+class CircuitBreaker:
+    """Closed until the recent failure rate crosses the threshold, then open for a jittered,
+    backed-off while; after that it is half-open and one probe call decides whether it closes."""
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        # (monotonic time, success) of calls finished while closed, within BREAKER_WINDOW
+        self.outcomes: Deque[Tuple[float, bool]] = deque()
+        self.reopen_at = 0.0
+        # Consecutive trips without a successful probe in between; drives the backoff
+        self.trips = 0
+        self.probing = False
+        self.counters = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0, "closed": 0}
+
+    def available(self, now: Optional[float] = None) -> bool:
+        """Whether a call would be let through right now, without reserving it."""
+        now = now or time.monotonic()
+        if self.state == OPEN:
+            return now >= self.reopen_at
+        return self.state == CLOSED or not self.probing
+
+    def retry_after(self, now: Optional[float] = None) -> float:
+        now = now or time.monotonic()
+        return max(0.0, self.reopen_at - now) if self.state == OPEN else 0.0
+
+    def allow(self) -> Optional[BreakerCall]:
+        now = time.monotonic()
+        if self.state == OPEN and now >= self.reopen_at:
+            self.state = HALF_OPEN
+            log.info("Circuit %s half-open, probing", self.name)
+        if self.state == OPEN or (self.state == HALF_OPEN and self.probing):
+            self.counters["rejected"] += 1
+            return None
+        probe = self.state == HALF_OPEN
+        self.probing = self.probing or probe
+        self.counters["calls"] += 1
+        return BreakerCall(self, probe)
+
+    def _settle(self, call: BreakerCall, ok: Optional[bool]):
+        if call.probe:
+            self.probing = False
+        if ok is None:
+            return
+        if not ok:
+            self.counters["failures"] += 1
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            if not call.probe:
+                return  # started before the trip; only the probe decides
+            if ok:
+                self._close()
+            else:
+                self._open(now)
+            return
+        if self.state == OPEN:
+            return
+        self.outcomes.append((now, ok))
+        while now - self.outcomes[0][0] > settings.BREAKER_WINDOW:
+            self.outcomes.popleft()
+        failures = sum(1 for _, good in self.outcomes if not good)
+        if len(self.outcomes) >= settings.BREAKER_MIN_CALLS and failures / len(self.outcomes) >= settings.BREAKER_FAILURE_RATE:
+            self._open(now)
+
+    def _open(self, now: float):
+        self.trips += 1
+        wait = min(settings.BREAKER_MAX_OPEN_SECONDS, settings.BREAKER_OPEN_SECONDS * 2 ** min(self.trips - 1, 16))
+        wait *= 1 + random.uniform(-settings.BREAKER_JITTER, settings.BREAKER_JITTER)
+        self.state, self.reopen_at = OPEN, now + wait
+        self.outcomes.clear()
+        self.counters["opened"] += 1
+        log.warning("Circuit %s open for %.1fs (trip %d)", self.name, wait, self.trips)
+
+    def _close(self):
+        self.state, self.trips = CLOSED, 0
+        self.outcomes.clear()
+        self.counters["closed"] += 1
+        log.info("Circuit %s closed, upstream recovered", self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        failures = sum(1 for _, good in self.outcomes if not good)
+        return {
+            "state": self.state,
+            "recent_calls": len(self.outcomes),
+            "recent_failure_rate": round(failures / len(self.outcomes), 4) if self.outcomes else None,
+            "retry_after": round(self.retry_after(), 2),
+            "trips": self.trips,
+            **self.counters,
+        }
+
+class BreakerBoard:
+    """Circuit breakers by name, created on first use; idle closed ones are dropped past BREAKER_MAX_TRACKED."""
+    def __init__(self):
+        self.breakers: "OrderedDict[str, CircuitBreaker]" = OrderedDict()
+        # Launches refused by an open circuit; planning-time skips are counted by the planner instead
+        self.rejected = 0
+
+    def available(self, name: Optional[str]) -> bool:
+        """Whether a launch would be let through; only allow() counts refusals."""
+        breaker = self.breakers.get(name) if name and settings.BREAKER_ENABLED else None
+        return breaker is None or breaker.available()
+
+    def retry_after(self, names: Iterable[Optional[str]]) -> int:
+        """Whole seconds until the first of these circuits lets a probe through."""
+        waits = [self.breakers[n].retry_after() for n in names if n in self.breakers]
+        return max(1, math.ceil(min(waits))) if waits else 1
+
+    def allow(self, name: Optional[str]) -> Optional[BreakerCall]:
+        """A permit for one call, or None while the circuit is open."""
+        if not name or not settings.BREAKER_ENABLED:
+            return BreakerCall(None, False)
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = self.breakers[name] = CircuitBreaker(name)
+            self._evict()
+        else:
+            self.breakers.move_to_end(name)
+        call = breaker.allow()
+        if call is None:
+            self.rejected += 1
+        return call
+
+    def _evict(self):
+        excess = len(self.breakers) - settings.BREAKER_MAX_TRACKED
+        if excess <= 0:
+            return
+        # Least recently used first; tripped circuits are kept so they keep shedding load
+        idle = [n for n, b in self.breakers.items() if b.state == CLOSED and not b.probing][:excess]
+        for name in idle:
+            del self.breakers[name]
+
+    def states(self) -> Dict[str, int]:
+        counts = {CLOSED: 0, OPEN: 0, HALF_OPEN: 0}
+        for breaker in self.breakers.values():
+            counts[breaker.state] += 1
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.BREAKER_ENABLED,
+            "states": self.states(),
+            "rejected": self.rejected,
+            "breakers": {name: b.stats() for name, b in self.breakers.items() if b.state != CLOSED or b.counters["failures"]},
+        }
+
+breaker_board = BreakerBoard()
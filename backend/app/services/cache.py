@@ -0,0 +1,195 @@
+import calendar
+import os
+import re
+import struct
+import time
+import zlib
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+from backend.app.core.config import settings
+from backend.app.core.log import get_logger
+from backend.app.models.schemas import MediaMetadata
+from backend.app.services.cache_backends import CacheBackend, MemoryBackend, SQLiteBackend, RedisBackend
+from backend.app.services.hls import HLS_SCHEME, decode_hls_url
+
+log = get_logger("cache")
+
+# googlevideo carries `expire=` either in the query or as a `/expire/<ts>/` path segment
+_EXPIRE_PATH = re.compile(r'/expire/(\d{9,11})(?:/|$)')
+# Serialized entry header: absolute expiry + flags
+_HEADER = struct.Struct('<dB')
+_FLAG_ZLIB = 1
+
+def url_expiry(url: Optional[str]) -> Optional[float]:
+    """Returns the unix expiry embedded in a signed media URL, if any."""
+    if url and url.startswith(HLS_SCHEME):
+        url = decode_hls_url(url)[0]
+    if not url or not url.startswith('http'):
+        return None
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    try:
+        if 'expire' in query:  # googlevideo
+            return float(query['expire'][0])
+        if 'Expires' in query:  # CloudFront / S3 v2 signatures
+            return float(query['Expires'][0])
+        if 'oe' in query:  # fbcdn / Instagram, hex encoded
+            return float(int(query['oe'][0], 16))
+        if 'X-Amz-Date' in query and 'X-Amz-Expires' in query:
+            signed = calendar.timegm(time.strptime(query['X-Amz-Date'][0], '%Y%m%dT%H%M%SZ'))
+            return signed + float(query['X-Amz-Expires'][0])
+    except (ValueError, OverflowError):
+        return None
+    match = _EXPIRE_PATH.search(parts.path)
+    return float(match.group(1)) if match else None
+
+def metadata_ttl(metadata: MediaMetadata, now: Optional[float] = None) -> float:
+    """Platform TTL, shortened so no cached format URL outlives its signature."""
+    now = now or time.time()
+    ttl = float(settings.CACHE_PLATFORM_TTLS.get(metadata.platform, settings.CACHE_DEFAULT_TTL))
+    for f in metadata.formats:
+        expiry = url_expiry(f.url)
+        if expiry is not None:
+            ttl = min(ttl, expiry - now - settings.CACHE_EXPIRY_MARGIN)
+    return ttl
+
+def encode_metadata(metadata: MediaMetadata, expires_at: float) -> bytes:
+    """Compact wire format: expiry header + JSON without nulls, deflated when it pays off."""
+    payload = metadata.model_dump_json(exclude_none=True).encode()
+    flags = 0
+    if len(payload) > 512:
+        payload, flags = zlib.compress(payload, 6), _FLAG_ZLIB
+    return _HEADER.pack(expires_at, flags) + payload
+
+def decode_metadata(blob: bytes) -> Tuple[MediaMetadata, float]:
+    expires_at, flags = _HEADER.unpack_from(blob)
+    payload = blob[_HEADER.size:]
+    if flags & _FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    return MediaMetadata.model_validate_json(payload), expires_at
+
+class MetadataCache:
+    """Analysis results keyed by canonical URL: a bounded in-process LRU in front of an optional shared backend."""
+    def __init__(self, local: CacheBackend, shared: Optional[CacheBackend] = None):
+        self.local = local
+        self.shared = shared
+        self.counters = {"hits": 0, "shared_hits": 0, "misses": 0, "uncacheable": 0, "errors": 0}
+
+    async def get(self, key: str) -> Optional[MediaMetadata]:
+        entry = await self.get_entry(key)
+        return entry[0] if entry else None
+
+    async def get_entry(self, key: str) -> Optional[Tuple[MediaMetadata, float]]:
+        """Like get(), but also returns when the entry expires."""
+        blob = await self.local.get(key)
+        if blob is None and self.shared is not None:
+            try:
+                blob = await self.shared.get(key)
+            except Exception as e:
+                self.counters["errors"] += 1
+                log.warning("Shared backend read failed: %s", e)
+            if blob is not None:
+                _, expires_at = decode_metadata(blob)
+                await self.local.set(key, blob, expires_at - time.time())
+                self.counters["shared_hits"] += 1
+        if blob is None:
+            self.counters["misses"] += 1
+            return None
+        metadata, expires_at = decode_metadata(blob)
+        if expires_at <= time.time():
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        return metadata, expires_at
+
+    async def set(self, key: str, metadata: MediaMetadata) -> Optional[float]:
+        """Stores an analysis; returns its expiry time, or None when it is not worth caching."""
+        ttl = metadata_ttl(metadata)
+        if ttl <= 0:
+            self.counters["uncacheable"] += 1
+            await self._keep_recent(key, metadata, ttl)
+            return None
+        expires_at = time.time() + ttl
+        blob = encode_metadata(metadata, expires_at)
+        await self.local.set(key, blob, ttl)
+        if self.shared is not None:
+            try:
+                await self.shared.set(key, blob, ttl)
+            except Exception as e:
+                self.counters["errors"] += 1
+                log.warning("Shared backend write failed: %s", e)
+        return expires_at
+
+    async def _keep_recent(self, key: str, metadata: MediaMetadata, ttl: float):
+        # The URLs still live CACHE_EXPIRY_MARGIN past `ttl`; stop REFRESH_STREAM_MARGIN short of that
+        grace = min(settings.TOKEN_UNCACHED_GRACE, ttl + settings.CACHE_EXPIRY_MARGIN - settings.REFRESH_STREAM_MARGIN)
+        if grace > 0:
+            await self.local.set("recent:" + key, encode_metadata(metadata, time.time() + grace), grace)
+
+    async def get_recent(self, key: str) -> Optional[MediaMetadata]:
+        """An analysis set() declined as too close to expiry, while its URLs are still usable (this instance only)."""
+        blob = await self.local.get("recent:" + key)
+        if blob is None:
+            return None
+        metadata, expires_at = decode_metadata(blob)
+        return metadata if expires_at > time.time() else None
+
+    async def set_alias(self, alias: str, key: str, ttl: float):
+        """Maps a short alias to a cache key, in both tiers, so any instance can resolve it."""
+        name, blob = "alias:" + alias, key.encode()
+        await self.local.set(name, blob, ttl)
+        if self.shared is not None:
+            try:
+                await self.shared.set(name, blob, ttl)
+            except Exception as e:
+                self.counters["errors"] += 1
+                log.warning("Shared backend write failed: %s", e)
+
+    async def resolve_alias(self, alias: str) -> Optional[str]:
+        name = "alias:" + alias
+        blob = await self.local.get(name)
+        if blob is None and self.shared is not None:
+            try:
+                blob = await self.shared.get(name)
+            except Exception as e:
+                self.counters["errors"] += 1
+                log.warning("Shared backend read failed: %s", e)
+        return blob.decode() if blob is not None else None
+
+    async def has_local_alias(self, alias: str) -> bool:
+        return await self.local.get("alias:" + alias) is not None
+
+    async def delete(self, key: str):
+        await self.local.delete(key)
+        if self.shared is not None:
+            try:
+                await self.shared.delete(key)
+            except Exception as e:
+                self.counters["errors"] += 1
+                log.warning("Shared backend delete failed: %s", e)
+
+    async def aclose(self):
+        if self.shared is not None:
+            await self.shared.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            "local": self.local.stats(),
+            "shared": self.shared.stats() if self.shared is not None else None,
+        }
+
+def build_shared_backend() -> Optional[CacheBackend]:
+    if settings.CACHE_BACKEND == "sqlite":
+        path = settings.CACHE_SQLITE_PATH or os.path.join(settings.DOWNLOAD_PATH, "metadata-cache.sqlite3")
+        return SQLiteBackend(path, settings.CACHE_SQLITE_MAX_ENTRIES)
+    if settings.CACHE_BACKEND == "redis":
+        return RedisBackend(settings.CACHE_REDIS_URL, settings.CACHE_KEY_PREFIX)
+    return None
+
+metadata_cache = MetadataCache(
+    MemoryBackend(settings.CACHE_MAX_ENTRIES, settings.CACHE_MAX_BYTES),
+    build_shared_backend(),
+)
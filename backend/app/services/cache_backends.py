@@ -0,0 +1,186 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+class CacheBackend:
+    """Byte-oriented key/value store with per-key TTLs. Implementations must be safe to share."""
+    name = "base"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+class MemoryBackend(CacheBackend):
+    """In-process LRU bounded by entry count and payload bytes."""
+    name = "memory"
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (value, expires_at)
+        self.entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        if ttl <= 0 or len(value) > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (value, time.time() + ttl)
+        self.bytes += len(value)
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    async def delete(self, key: str):
+        if key in self.entries:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        value, _ = self.entries.pop(key)
+        self.bytes -= len(value)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name, "entries": len(self.entries), "bytes": self.bytes,
+            "max_entries": self.max_entries, "max_bytes": self.max_bytes, "evictions": self.evictions,
+        }
+
+class SQLiteBackend(CacheBackend):
+    """Local file cache shared by every worker on the host; WAL + mmap keep reads cheap."""
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA mmap_size=67108864")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+            self._conn = conn
+        return self._conn
+
+    def _get_sync(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return bytes(row[0])
+
+    def _set_sync(self, key: str, value: bytes, ttl: float):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            self._writes += 1
+            # Sweep expired rows and trim to budget every so often rather than on each write
+            if self._writes % 100 == 0:
+                conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+                overflow = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+                if overflow > 0:
+                    conn.execute(
+                        "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                        (overflow,),
+                    )
+                    self.evictions += overflow
+
+    def _delete_sync(self, key: str):
+        with self._lock:
+            self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get_sync, key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        if ttl > 0:
+            await asyncio.to_thread(self._set_sync, key, value, ttl)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self._delete_sync, key)
+
+    async def aclose(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "path": self.path, "max_entries": self.max_entries, "evictions": self.evictions}
+
+class RedisBackend(CacheBackend):
+    """Redis-protocol store (Redis, Valkey, KeyDB, fakeredis) shared across hosts."""
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str, client=None):
+        if client is None:
+            try:
+                import redis.asyncio as redis_asyncio
+            except ImportError:
+                raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package (pip install redis)")
+            client = redis_asyncio.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        if ttl > 0:
+            await self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "prefix": self.prefix}
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+from backend.app.core.config import settings
+from backend.app.core.log import get_logger
+from backend.app.core.metrics import ANALYZE_STAGE_SECONDS
+
+log = get_logger("executor")
+
+class EngineSaturated(Exception):
+    """Raised when the extraction queue is full; callers should shed load instead of waiting."""
+    def __init__(self, retry_after: int):
+        super().__init__("Extraction engine is saturated, retry later")
+        self.retry_after = retry_after
+
+# Per-worker YoutubeDL instances keyed by their options. Threads get their own
+# (YoutubeDL is not thread-safe); in process mode each process holds one set.
+_local = threading.local()
+
+def _worker_id(in_process: bool) -> str:
+    return f"pid-{os.getpid()}" if in_process else threading.current_thread().name
+
+def _get_ydl(opts: dict):
+    instances = getattr(_local, "instances", None)
+    if instances is None:
+        instances = _local.instances = {}
+    key = repr(sorted(opts.items()))
+    ydl = instances.get(key)
+    if ydl is None:
+        # yt-dlp is imported here rather than at module load: it (and the extractor registry the
+        # first YoutubeDL builds) is the bulk of a cold start, and most requests never need it
+        import yt_dlp
+        ydl = instances[key] = yt_dlp.YoutubeDL(opts)
+    return ydl
+
+def _warm_worker(opts: dict):
+    """Process-pool initializer: build the YoutubeDL instance (and its extractor registry) up front."""
+    _get_ydl(opts)
+
+def _extract_job(url: str, opts: dict, submitted_at: float, in_process: bool) -> Tuple[Any, str, float, float]:
+    started = time.time()
+    ydl = _get_ydl(opts)
+    info = ydl.extract_info(url, download=False)
+    if in_process:
+        # Results cross a process boundary, so strip anything unpicklable
+        info = type(ydl).sanitize_info(info)
+    return info, _worker_id(in_process), started - submitted_at, time.time() - started
+
+class ExtractionEngine:
+    """Dedicated, bounded executor for yt-dlp extraction (thread or warm process pool)."""
+    def __init__(self, mode: str, max_workers: int, max_queue: int, warm_opts: Optional[dict] = None):
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.warm_opts = warm_opts or {}
+        self.executor: Optional[Executor] = None
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "cancelled": 0}
+        self.workers: Dict[str, Dict[str, float]] = {}
+        self.prewarm_seconds: Optional[float] = None
+        self._prewarm_task: Optional[asyncio.Task] = None
+
+    def _ensure_executor(self) -> Executor:
+        if self.executor is None:
+            if self.mode == "process":
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, initializer=_warm_worker, initargs=(self.warm_opts,)
+                )
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ydl")
+        return self.executor
+
+    def _release(self, future):
+        with self._lock:
+            self.in_flight -= 1
+        if future.cancelled():
+            self.counters["cancelled"] += 1
+
+    async def extract(self, url: str, opts: dict) -> Dict[str, Any]:
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.counters["rejected"] += 1
+                raise EngineSaturated(settings.EXTRACTION_RETRY_AFTER)
+            self.in_flight += 1
+        self.counters["submitted"] += 1
+
+        try:
+            future = self._ensure_executor().submit(
+                _extract_job, url, opts, time.time(), self.mode == "process"
+            )
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+        # Capacity is released when the worker actually finishes, not when the caller stops waiting
+        future.add_done_callback(self._release)
+
+        try:
+            info, worker, queue_wait, run_time = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception:
+            self.counters["failed"] += 1
+            raise
+
+        self.counters["completed"] += 1
+        ANALYZE_STAGE_SECONDS.observe(queue_wait, stage="ydl_queue_wait")
+        ANALYZE_STAGE_SECONDS.observe(run_time, stage="ydl_execution")
+        w = self.workers.setdefault(worker, {"jobs": 0, "busy_seconds": 0.0, "queue_wait_seconds": 0.0})
+        w["jobs"] += 1
+        w["busy_seconds"] += run_time
+        w["queue_wait_seconds"] += queue_wait
+        return info
+
+    async def prewarm(self):
+        """Loads yt-dlp and its extractor registry on the workers ahead of the first extraction."""
+        started = time.perf_counter()
+        executor = self._ensure_executor()
+        # One warm-up per worker, so each thread or process builds its own YoutubeDL
+        await asyncio.gather(*(
+            asyncio.wrap_future(executor.submit(_warm_worker, self.warm_opts)) for _ in range(self.max_workers)
+        ))
+        self.prewarm_seconds = time.perf_counter() - started
+        log.info("Extraction engine warmed in %.2fs", self.prewarm_seconds)
+
+    def start_prewarm(self):
+        """Warms the engine in the background after startup, without delaying readiness."""
+        if self._prewarm_task is None:
+            self._prewarm_task = asyncio.get_running_loop().create_task(self.prewarm())
+            self._prewarm_task.add_done_callback(self._prewarm_done)
+
+    @staticmethod
+    def _prewarm_done(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            log.warning("Extraction engine prewarm failed: %s", task.exception())
+
+    def shutdown(self):
+        if self._prewarm_task is not None:
+            self._prewarm_task.cancel()
+            self._prewarm_task = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        running = min(self.in_flight, self.max_workers)
+        return {
+            **self.counters,
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": running,
+            "queued": self.in_flight - running,
+            # Only meaningful in thread mode; process workers import it in their own interpreter
+            "ytdlp_loaded": "yt_dlp" in sys.modules,
+            "prewarm_seconds": round(self.prewarm_seconds, 3) if self.prewarm_seconds is not None else None,
+            "workers": {k: {**v, "busy_seconds": round(v["busy_seconds"], 3),
+                            "queue_wait_seconds": round(v["queue_wait_seconds"], 3)}
+                        for k, v in self.workers.items()},
+        }
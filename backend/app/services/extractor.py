@@ -1,74 +1,73 @@
 import asyncio
-import yt_dlp
-import httpx
-import re
+import hashlib
 import time
 from typing import Dict, Any, Optional, List
+from urllib.parse import unquote
 from backend.app.models.schemas import MediaMetadata, MediaFormat
+from backend.app.core.config import settings
+from backend.app.core.log import get_logger
+from backend.app.core.metrics import ANALYZE_SECONDS, ANALYZE_STAGE_SECONDS, STRATEGY_SECONDS
+from backend.app.services.http_pool import http_pool
+from backend.app.services.executor import ExtractionEngine, EngineSaturated
+from backend.app.services.breakers import breaker_board, breaker_name, BreakerCall, UpstreamError, UpstreamsUnavailable
+from backend.app.services.planner import StrategyPlanner
+from backend.app.services.scrape import scrape_head, scan_links
+from backend.app.services.urls import route, GOOGLE_RESULT_PATTERNS
+from backend.app.services.muxer import muxed_formats
+from backend.app.services.hls import encode_hls_url, is_hls
+from backend.app.services.jobs import emit_event
+
+log = get_logger("extractor")
+
+# yt-dlp errors that mean the site is refusing us, rather than that the URL has no media
+YDL_UPSTREAM_ERRORS = ("HTTP Error 429", "Too Many Requests", "HTTP Error 5", "confirm you", "rate-limit",
+                       "rate limit", "timed out", "Connection reset", "Connection refused")
+
+def media_id_for(url: str) -> str:
+    """Stable short ID for results that have no platform-provided ID."""
+    return hashlib.sha1(url.encode()).hexdigest()[:16]
 
 class MediaExtractor:
     def __init__(self):
         self.ua = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
-
-    def _clean_url(self, url: str) -> str:
-        if 'instagram.com' in url:
-            # Extract core reel/post ID
-            id_match = re.search(r'/(?:reels?|p|stories)/([A-Za-z0-9_-]+)', url)
-            if id_match:
-                return f"https://www.instagram.com/reel/{id_match.group(1)}/"
-        
-        # Handle Google Search Redirects
-        if 'google.' in url and '/url?' in url:
-            match = re.search(r'url=([^&]+)', url)
-            if match:
-                from urllib.parse import unquote
-                return unquote(match.group(1))
-                
-        return url
+        self.engine = ExtractionEngine(
+            settings.EXTRACTION_MODE, settings.EXTRACTION_WORKERS,
+            settings.EXTRACTION_QUEUE_LIMIT, warm_opts=self._ydl_opts()
+        )
+        self.planner = StrategyPlanner()
+        self.counters = {"hedges": 0, "deadline_exceeded": 0, "circuit_skips": 0}
+        self.strategies = {
+            "direct_file": self._strategy_direct_file,
+            "rapid_scrape": self._strategy_rapid_scrape,
+            "ydl_direct": self._strategy_ydl_direct,
+            "fallback_node": self._strategy_fallback_node,
+        }
 
     async def _resolve_google_search_content(self, url: str) -> Optional[str]:
         """Extracts the actual media link from a Google Search result page."""
         try:
             # Use Mobile UA to get cleaner HTML
             mobile_ua = "Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Mobile Safari/537.36"
-            async with httpx.AsyncClient(follow_redirects=True, verify=False) as client:
-                resp = await client.get(url, headers={'User-Agent': mobile_ua})
-                if resp.status_code == 200:
-                    text = resp.text
-                    
-                    # 1. Look for common video patterns in raw text
-                    patterns = [
-                        r'https?://(?:www\.)?youtube\.com/watch\?v=([\w-]{11})',
-                        r'https?://youtu\.be/([\w-]{11})',
-                        r'https?://(?:www\.)?instagram\.com/(?:p|reel)/([\w-]{11})',
-                        r'(https?://[^"\'<>]+\.mp4)'
-                    ]
-                    
-                    for p in patterns:
-                        match = re.search(p, text)
-                        if match:
-                            # If it's a capture group, return that, otherwise return the full match
-                            final_link = match.group(0) if p.startswith('(') else match.group(0)
-                            print(f"[+] Found resolved link in Google: {final_link}")
-                            return final_link
-                    
-                    # 2. Look for Google Video Search results encoded in URLs
-                    gv_match = re.search(r'/url\?q=(https?://[^&]+)', text)
-                    if gv_match:
-                        from urllib.parse import unquote
-                        link = unquote(gv_match.group(1))
-                        if 'youtube.com' in link or 'instagram.com' in link or link.endswith('.mp4'):
-                            print(f"[+] Found resolved link in Google URL: {link}")
-                            return link
+            client = http_pool.client_for(url, verify=False)
+            # Stream the page and stop as soon as a YouTube link shows up
+            link = await scan_links(
+                client, url, {'User-Agent': mobile_ua}, GOOGLE_RESULT_PATTERNS, settings.GOOGLE_SCAN_MAX_BYTES
+            )
+            if link:
+                link = unquote(link)
+                log.info("Found resolved link in Google: %s", link)
+                return link
         except Exception as e:
-            print(f"Error resolving Google Search: {e}")
+            log.warning("Error resolving Google Search: %s", e)
         return None
 
     async def extract_info(self, url: str) -> Optional[MediaMetadata]:
+        deadline = time.monotonic() + settings.ANALYSIS_TIMEOUT
         # Handle Data URIs (Base64 images)
         if url.startswith('data:image'):
             return MediaMetadata(
-                id="base64-img",
+                # Keyed by payload: the ID names this image in the caches and refresher
+                id=f"base64-{media_id_for(url)}",
                 title="Base64 Image Content",
                 thumbnail=url,
                 platform="Internal",
@@ -76,75 +75,152 @@ class MediaExtractor:
                 original_url=url[:100] + "..."
             )
 
-        if 'google.com/search' in url:
-            resolved = await self._resolve_google_search_content(url)
-            if resolved:
-                url = resolved
+        with ANALYZE_SECONDS.time(outcome="failed") as timing:
+            with ANALYZE_STAGE_SECONDS.time(stage="url_clean"):
+                target = route(url)
+            if target.platform == "google_search":
+                with ANALYZE_STAGE_SECONDS.time(stage="google_resolve"):
+                    resolved = await self._resolve_google_search_content(url)
+                if resolved:
+                    target = route(resolved)
 
-        clean_url = self._clean_url(url)
-        print(f"[*] Analyzing: {clean_url}")
-        
-        # Domain Helper
-        is_youtube = 'youtube.com' in clean_url or 'youtu.be' in clean_url
-        
-        # Strategy 1: YouTube Specific (Force YDL)
-        if is_youtube:
-            # Try Direct YDL
-            try:
-                print("[*] Trying Strategy: YDL-Direct")
-                res = await self._strategy_ydl_direct(clean_url)
-                if res: return res
-            except Exception as e:
-                print(f"[-] YDL-Direct failed: {e}")
-            
-            # If YouTube YDL fails (common on Vercel), fall through to Strategy 2 (Parallel)
-            print("[*] YouTube YDL failed or blocked, trying Parallel Fallbacks...")
+            clean_url = target.url
+            log.info("Analyzing %s (%s)", clean_url, target.platform)
 
-        # Strategy 2: Parallel Strategy
-        strategies = [
-            self._strategy_direct_file(clean_url),
-            self._strategy_rapid_scrape(clean_url),
-            self._strategy_ydl_direct(clean_url),
-            self._strategy_fallback_node(clean_url) # NEW: Public Node Fallback
-        ]
-        tasks = [asyncio.create_task(s) for s in strategies]
-        
+            plan = self.planner.plan(target)
+            for name, reason in plan.skipped.items():
+                log.debug("Skipping %s: %s", name, reason)
+            emit_event("planned", platform=target.platform, stages=plan.stages, skipped=plan.skipped)
+            if plan.retry_after is not None:
+                # Every upstream for this URL is failing: answer now instead of waiting out their timeouts
+                timing["outcome"] = "circuit_open"
+                raise UpstreamsUnavailable(plan.domain, plan.retry_after)
+
+            # Set when yt-dlp was skipped for lack of capacity rather than failing
+            saturated = None
+
+            for stage in plan.stages:
+                log.debug("Trying strategies: %s", ', '.join(stage))
+                result, stage_saturated = await self._race(stage, clean_url, plan.domain, deadline)
+                if result:
+                    timing["outcome"] = "success"
+                    return result
+                saturated = saturated or stage_saturated
+                if time.monotonic() >= deadline:
+                    break
+
+            if saturated:
+                # Nothing else worked and yt-dlp never ran: ask the client to back off
+                timing["outcome"] = "saturated"
+                raise saturated
+            log.warning("All extraction strategies failed for %s", clean_url)
+            return None
+
+    async def _run_strategy(self, name: str, url: str, call: BreakerCall):
+        """Runs one strategy, tagging its outcome with the strategy name and latency.
+
+        An answer, even an empty one, shows the upstream is healthy; errors count against its circuit.
+        """
+        started = time.monotonic()
+        result, error, outcome = None, None, "error"
         try:
-            for completed in asyncio.as_completed(tasks):
-                try:
-                    result = await completed
-                    if result and result.formats:
-                        print(f"[+] Strategy Success: {result.platform}")
-                        for t in tasks: 
-                            if not t.done(): t.cancel()
-                        return result
-                    else:
-                        print(f"[-] A strategy returned no result or formats.")
-                except Exception as e:
-                    print(f"[-] Strategy failed with error: {str(e)}")
-                    continue
+            result = await self.strategies[name](url)
+            outcome = "success" if result and result.formats else "empty"
+            call.success()
+        except EngineSaturated as e:
+            error, outcome = e, "saturated"
         except Exception as e:
-            print(f"[!] Extraction Timeout or Global Error: {e}")
+            call.failure()
+            log.warning("%s failed with error: %s", name, e)
         finally:
-            for t in tasks:
-                if not t.done(): t.cancel()
+            call.abandon()
+        latency = time.monotonic() - started
+        STRATEGY_SECONDS.observe(latency, strategy=name, outcome=outcome)
+        return name, result, error, latency
 
-        print(f"[!] All extraction strategies failed for: {clean_url}")
-        return None
+    async def _race(self, names: List[str], url: str, domain: str, deadline: float):
+        """Hedged race: launch strategies in order, starting the next one when the
+        running leader fails or outlives its p90 latency, until one wins or the deadline passes.
+
+        Returns the winning result (or None) and any saturation error seen.
+        """
+        saturated = None
+        queue = list(names)
+        pending: Dict[asyncio.Task, float] = {}  # task -> launch time
+        calls: Dict[asyncio.Task, BreakerCall] = {}
+        hedge_at = 0.0
+
+        def launch():
+            nonlocal hedge_at
+            while queue:
+                name = queue.pop(0)
+                # A circuit may have opened since planning, e.g. on a concurrent request's failure
+                call = breaker_board.allow(breaker_name(name, domain))
+                if call is None:
+                    self.counters["circuit_skips"] += 1
+                    log.info("Skipping %s: circuit open", name)
+                    emit_event("strategy_skipped", strategy=name, reason="circuit_open")
+                    continue
+                now = time.monotonic()
+                if pending:
+                    self.counters["hedges"] += 1
+                    log.info("Hedging with %s", name)
+                task = asyncio.create_task(self._run_strategy(name, url, call), name=name)
+                pending[task], calls[task] = now, call
+                emit_event("strategy_started", strategy=name, hedge=len(pending) > 1)
+                hedge_at = now + self.planner.hedge_delay(domain, name)
+                return
+
+        try:
+            launch()
+            while pending:
+                now = time.monotonic()
+                if now >= deadline:
+                    self.counters["deadline_exceeded"] += 1
+                    log.warning("Analysis deadline of %ss exceeded", settings.ANALYSIS_TIMEOUT)
+                    emit_event("deadline_exceeded", running=[t.get_name() for t in pending])
+                    for task, started in pending.items():
+                        # A strategy still running at the deadline counts as a slow loss
+                        self.planner.record(domain, task.get_name(), False, now - started)
+                        calls[task].failure()
+                    break
+                wake = min(deadline, hedge_at) if queue else deadline
+                done, _ = await asyncio.wait(pending, timeout=wake - now, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.pop(task)
+                    name, result, error, latency = task.result()
+                    if isinstance(error, EngineSaturated):
+                        # Capacity problems say nothing about whether the strategy works here
+                        saturated = error
+                        log.info("%s skipped: %s", name, error)
+                        emit_event("strategy_failed", strategy=name, reason="saturated")
+                        continue
+                    success = bool(result and result.formats)
+                    self.planner.record(domain, name, success, latency)
+                    if success:
+                        log.info("Strategy %s succeeded (%s) in %.2fs", name, result.platform, latency)
+                        emit_event("strategy_won", strategy=name, latency=round(latency, 3))
+                        return result, None
+                    log.info("%s returned no result or formats", name)
+                    emit_event("strategy_failed", strategy=name, latency=round(latency, 3))
+                # Launch the next strategy when nothing is left running or the leader is overdue
+                if queue and (not pending or time.monotonic() >= hedge_at):
+                    launch()
+        finally:
+            for t in pending:
+                if not t.done(): t.cancel()
+        return None, saturated
 
     async def _strategy_direct_file(self, url: str) -> Optional[MediaMetadata]:
         """Handles direct links to images or videos."""
-        image_exts = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
-        video_exts = ('.mp4', '.webm', '.ogg', '.mov', '.avi')
-        
-        lower_url = url.lower().split('?')[0]
+        target = route(url)
         
-        if lower_url.endswith(image_exts) or lower_url.endswith(video_exts):
-            ext = lower_url.split('.')[-1]
-            is_video = any(lower_url.endswith(ve) for ve in video_exts)
+        if target.platform == "direct":
+            ext = target.extension
+            is_video = target.kind == "video"
             
             return MediaMetadata(
-                id=str(int(time.time())),
+                id=media_id_for(url),
                 title=f"Direct {ext.upper()} Content",
                 thumbnail=url if not is_video else None,
                 platform="DirectLink",
@@ -160,88 +236,100 @@ class MediaExtractor:
 
     async def _strategy_rapid_scrape(self, url: str) -> Optional[MediaMetadata]:
         """Fetches via OpenGraph tags - fast and hard to block."""
-        try:
-            async with httpx.AsyncClient(follow_redirects=True) as client:
-                headers = {'User-Agent': 'facebookexternalhit/1.1'} # Mimic social crawler
-                resp = await client.get(url, headers=headers)
-                if resp.status_code == 200:
-                    text = resp.text
-                    # Extract via regex to be fast
-                    video_url = re.search(r'property="og:video(:secure_url)?" content="([^"]+)"', text)
-                    if video_url:
-                        video_link = video_url.group(2).replace('&amp;', '&')
-                        return MediaMetadata(
-                            id=str(int(time.time())),
-                            title="Media Content",
-                            platform="RapidScrape",
-                            formats=[MediaFormat(format_id="hd", extension="mp4", url=video_link)],
-                            original_url=url
-                        )
-        except Exception:
-            pass
+        client = http_pool.client_for(url)
+        headers = {'User-Agent': 'facebookexternalhit/1.1'} # Mimic social crawler
+        # Only the <head> is read; the body is never downloaded. Rate limits and outages raise.
+        head = await scrape_head(client, url, headers, settings.SCRAPE_MAX_BYTES)
+        video_link = head.tags.get('og:video') if head else None
+        if video_link:
+            ext = video_link.lower().split('?')[0].rsplit('.', 1)[-1]
+            hls = ext == 'm3u8' and settings.HLS_ENABLED
+            return MediaMetadata(
+                id=media_id_for(url),
+                title=head.tags.get('og:title') or head.title or "Media Content",
+                thumbnail=head.tags.get('og:image'),
+                duration=head.duration,
+                platform="RapidScrape",
+                formats=[MediaFormat(
+                    format_id="hd",
+                    extension=ext if ext in ('mp4', 'webm', 'mov', 'm3u8') else "mp4",
+                    url=encode_hls_url(video_link, {}) if hls else video_link,
+                    protocol="hls" if hls else None
+                )],
+                original_url=url
+            )
         return None
 
     async def _strategy_fallback_node(self, url: str) -> Optional[MediaMetadata]:
         """Uses a public media resolution node as a last resort."""
-        try:
-            # This is a public node known to work for many sites
-            api_url = f"https://api.cobalt.tools/api/json"
-            headers = {
-                "Accept": "application/json",
-                "Content-Type": "application/json",
-                "Referer": "https://cobalt.tools/"
-            }
-            async with httpx.AsyncClient(timeout=10) as client:
-                resp = await client.post(api_url, json={"url": url}, headers=headers)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    media_url = data.get('url') or data.get('stream')
-                    if media_url:
-                        return MediaMetadata(
-                            id=str(int(time.time())),
-                            title="Media Content (Resolved via Fallback)",
-                            platform="FallbackAPI",
-                            thumbnail=data.get('thumbnail'),
-                            formats=[MediaFormat(
-                                format_id="fallback",
-                                extension="mp4",
-                                resolution="HD",
-                                url=media_url
-                            )],
-                            original_url=url
-                        )
-        except Exception as e:
-            print(f"[-] Fallback Node failed: {e}")
+        # A public node known to work for many sites by default
+        api_url = settings.FALLBACK_NODE_URL
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Referer": "https://cobalt.tools/"
+        }
+        client = http_pool.client_for(api_url)
+        # Transport errors and timeouts propagate, and count against the node's circuit
+        resp = await client.post(api_url, json={"url": url}, headers=headers, timeout=10)
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise UpstreamError(f"Fallback node answered HTTP {resp.status_code}")
+        if resp.status_code == 200:
+            data = resp.json()
+            media_url = data.get('url') or data.get('stream')
+            if media_url:
+                return MediaMetadata(
+                    id=media_id_for(url),
+                    title="Media Content (Resolved via Fallback)",
+                    platform="FallbackAPI",
+                    thumbnail=data.get('thumbnail'),
+                    formats=[MediaFormat(
+                        format_id="fallback",
+                        extension="mp4",
+                        resolution="HD",
+                        url=media_url
+                    )],
+                    original_url=url
+                )
         return None
 
-    async def _strategy_ydl_direct(self, url: str) -> Optional[MediaMetadata]:
-        opts = {
+    def _ydl_opts(self) -> dict:
+        return {
             'quiet': True, 'no_warnings': True, 'skip_download': True,
             'check_formats': False, 'user_agent': self.ua, 'socket_timeout': 10,
             'nocheckcertificate': True, 'no_color': True,
             'geo_bypass': True, 'extract_flat': 'in_playlist',
             'referer': 'https://www.google.com/'
         }
-        return await self._run_ydl(url, opts, "Direct")
+
+    def playlist_opts(self) -> dict:
+        # Listing only: entries stay unresolved until someone analyzes them
+        return {**self._ydl_opts(), 'extract_flat': True, 'lazy_playlist': True}
+
+    async def _strategy_ydl_direct(self, url: str) -> Optional[MediaMetadata]:
+        return await self._run_ydl(url, self._ydl_opts(), "Direct")
 
 
     async def _run_ydl(self, url: str, opts: dict, name: str) -> Optional[MediaMetadata]:
-        loop = asyncio.get_event_loop()
         try:
-            info = await loop.run_in_executor(None, self._extract_sync, url, opts)
-            if info: return self._parse_info(info, url)
+            info = await self.engine.extract(url, opts)
+            if info:
+                with ANALYZE_STAGE_SECONDS.time(stage="parse_info"):
+                    return self._parse_info(info, url)
+        except EngineSaturated:
+            raise
         except Exception as e:
-            print(f"[!] YDL {name} Error: {str(e)}")
+            if any(marker in str(e) for marker in YDL_UPSTREAM_ERRORS):
+                raise UpstreamError(f"yt-dlp {name}: {e}") from e
+            log.warning("yt-dlp %s error: %s", name, e)
         return None
 
-    def _extract_sync(self, url: str, opts: dict):
-        with yt_dlp.YoutubeDL(opts) as ydl:
-            return ydl.extract_info(url, download=False)
-
     def _parse_info(self, info: Dict[str, Any], original_url: str) -> MediaMetadata:
         if 'entries' in info and info['entries']: info = info['entries'][0]
         
-        is_youtube = 'youtube.com' in original_url or 'youtu.be' in original_url
+        target = route(original_url)
+        # Instagram only serves browser-playable formats, so keep all of them
+        keep_all = target.is_instagram
         formats = []
         raw_formats = info.get('formats', []) or ([info] if info.get('url') else [])
         
@@ -256,28 +344,38 @@ class MediaExtractor:
             
             # YouTube often has separate video/audio. We prefer combined but will take what we can.
             is_combined = vcodec != 'none' and acodec != 'none'
+
+            # HLS is proxied playlist and all, with the headers yt-dlp says the segments need
+            protocol = None
+            if settings.HLS_ENABLED and is_hls(f):
+                url, protocol = encode_hls_url(url, f.get('http_headers')), "hls"
             
             # For YouTube, if we can't find combined, we might need to show something.
             # But for simplicity, we focus on what can be streamed directly in browser.
-            if is_combined or ext in ['mp4', 'm4a', 'mp3'] or 'instagram.com' in original_url:
+            if is_combined or ext in ['mp4', 'm4a', 'mp3'] or keep_all:
                 formats.append(MediaFormat(
                     format_id=str(f.get('format_id')), 
                     extension=ext or 'mp4',
                     resolution=f.get('resolution') or (f"{f.get('height')}p" if f.get('height') else "HD"),
                     filesize=f.get('filesize') or f.get('filesize_approx'),
-                    url=url
+                    url=url,
+                    protocol=protocol
                 ))
-            elif not is_youtube: # For other sites, be more liberal
+            elif not target.is_youtube: # For other sites, be more liberal
                 formats.append(MediaFormat(
                     format_id=str(f.get('format_id')), 
                     extension=ext or 'mp4',
                     resolution=f.get('resolution') or f.get('height') or 'HD',
                     filesize=f.get('filesize') or f.get('filesize_approx'),
-                    url=url
+                    url=url,
+                    protocol=protocol
                 ))
         
         # Sort formats: Combined MP4s first
         formats.sort(key=lambda x: (x.extension == 'mp4', x.resolution != 'HD'), reverse=True)
+        if target.is_youtube:
+            # HD on YouTube only exists as separate streams; offer them muxed, ahead of the rest
+            formats = muxed_formats(raw_formats) + formats
 
         return MediaMetadata(
             id=info.get('id', 'media'), title=info.get('title', 'Media'),
@@ -0,0 +1,403 @@
+import asyncio
+import json
+import re
+import secrets
+import time
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Callable, Deque, Dict, Any, List, Optional, Set, Tuple
+from urllib.parse import urlencode, parse_qs, urljoin, quote
+import httpx
+from fastapi.responses import Response
+from backend.app.core.config import settings
+from backend.app.core.log import get_logger
+from backend.app.core.metrics import STREAM_BYTES
+from backend.app.services.http_pool import http_pool
+from backend.app.services.streamer import stream_proxy, GeneratorResponse
+
+log = get_logger("hls")
+
+# Synthetic format URLs: the backend proxies the HLS playlist they carry, with the format's headers
+HLS_SCHEME = "hls:"
+PLAYLIST_TYPE = "application/vnd.apple.mpegurl"
+
+_URI_ATTR = re.compile(r'URI="([^"]*)"')
+_ATTR = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+# Tags whose URI names another playlist; every other URI attribute (keys, init sections) is media bytes
+_PLAYLIST_URI_TAGS = ("#EXT-X-MEDIA:", "#EXT-X-I-FRAME-STREAM-INF:", "#EXT-X-RENDITION-REPORT:")
+
+class HlsError(Exception):
+    """An HLS request that cannot be served; `status` is the HTTP status to answer with."""
+    def __init__(self, message: str, status: int = 502):
+        super().__init__(message)
+        self.status = status
+
+def encode_hls_url(url: str, headers: Optional[Dict[str, str]]) -> str:
+    return HLS_SCHEME + urlencode({"u": url, "h": json.dumps(headers or {}, separators=(",", ":"))})
+
+def decode_hls_url(url: str) -> Tuple[str, Dict[str, str]]:
+    query = parse_qs(url[len(HLS_SCHEME):])
+    return query["u"][0], json.loads(query.get("h", ["{}"])[0])
+
+def is_hls(f: Dict[str, Any]) -> bool:
+    """Whether a yt-dlp format is delivered as an HLS playlist."""
+    return (f.get("protocol") or "").startswith("m3u8") or (f.get("url") or "").split("?")[0].endswith(".m3u8")
+
+def _attrs(line: str) -> Dict[str, str]:
+    return {k: v.strip('"') for k, v in _ATTR.findall(line.partition(":")[2])}
+
+@dataclass
+class MediaPlaylist:
+    # (absolute URL, Range header or None) per segment, in playback order
+    segments: List[Tuple[str, Optional[str]]] = field(default_factory=list)
+    init: Optional[Tuple[str, Optional[str]]] = None
+    encrypted: bool = False
+    ended: bool = False
+
+def _byterange(value: str, next_offset: int) -> Tuple[str, int]:
+    length, _, offset = value.partition("@")
+    start = int(offset) if offset else next_offset
+    return f"bytes={start}-{start + int(length) - 1}", start + int(length)
+
+def parse_media_playlist(text: str, base: str) -> MediaPlaylist:
+    playlist = MediaPlaylist()
+    pending_range, offset = None, 0
+    for line in (l.strip() for l in text.splitlines()):
+        if line.startswith("#EXT-X-KEY:"):
+            playlist.encrypted = playlist.encrypted or _attrs(line).get("METHOD", "NONE") != "NONE"
+        elif line.startswith("#EXT-X-MAP:"):
+            attrs = _attrs(line)
+            rng = _byterange(attrs["BYTERANGE"], 0)[0] if "BYTERANGE" in attrs else None
+            playlist.init = (urljoin(base, attrs["URI"]), rng)
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            pending_range, offset = _byterange(line.partition(":")[2], offset)
+        elif line.startswith("#EXT-X-ENDLIST"):
+            playlist.ended = True
+        elif line and not line.startswith("#"):
+            playlist.segments.append((urljoin(base, line), pending_range))
+            pending_range = None
+    return playlist
+
+def best_variant(text: str, base: str) -> Optional[str]:
+    """Highest-bandwidth variant of a master playlist, preferring ones with audio muxed in."""
+    separate_audio = {a.get("GROUP-ID") for a in (_attrs(l) for l in text.splitlines() if l.startswith("#EXT-X-MEDIA:"))
+                      if a.get("TYPE") == "AUDIO" and a.get("URI")}
+    variants, attrs = [], None
+    for line in (l.strip() for l in text.splitlines()):
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            attrs = _attrs(line)
+        elif attrs is not None and line and not line.startswith("#"):
+            bandwidth = int(attrs.get("BANDWIDTH", "0") or 0)
+            variants.append((attrs.get("AUDIO") not in separate_audio, bandwidth, urljoin(base, line)))
+            attrs = None
+    return max(variants)[2] if variants else None
+
+def rewrite_playlist(text: str, base: str, link: Callable[[str, str], str]) -> Tuple[str, List[str], List[str]]:
+    """Points every URI of a playlist at `link(absolute URL, kind)`, kind "p" (playlist) or "s" (bytes).
+
+    Returns the rewritten text, every absolute URL it links to, and the segment URLs in order
+    (empty for byte-range playlists, whose segments share one URL).
+    """
+    master = "#EXT-X-STREAM-INF" in text
+    ranged = "#EXT-X-BYTERANGE" in text
+    out, linked, segments = [], [], []
+
+    def sub(match, kind):
+        url = urljoin(base, match.group(1))
+        linked.append(url)
+        return f'URI="{link(url, kind)}"'
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        if line.startswith("#"):
+            if 'URI="' in line:
+                kind = "p" if line.startswith(_PLAYLIST_URI_TAGS) else "s"
+                line = _URI_ATTR.sub(lambda m: sub(m, kind), line)
+            out.append(line)
+        elif line:
+            url = urljoin(base, line)
+            linked.append(url)
+            if not master and not ranged:
+                segments.append(url)
+            out.append(link(url, "p" if master else "s"))
+        else:
+            out.append(raw)
+    return "\n".join(out) + "\n", linked, segments
+
+class HlsSession:
+    """One proxied HLS stream: its upstream headers and the URLs its rewritten playlists handed out.
+
+    The ID is random, so a session is only reachable through the playlist /stream returned.
+    """
+    def __init__(self, root: str, headers: Dict[str, str]):
+        self.id = secrets.token_urlsafe(12)
+        self.root = root
+        self.headers = headers
+        self.last_used = time.monotonic()
+        # Playlist URL -> (URLs it linked to, its segments in order), from its latest fetch; least recent first
+        self.playlists: "OrderedDict[str, Tuple[List[str], List[str]]]" = OrderedDict()
+        # URL -> number of remembered playlists linking to it
+        self.links: Counter = Counter()
+        # Segment URL -> (playlist URL, index), to find what to prefetch next
+        self.positions: Dict[str, Tuple[str, int]] = {}
+
+    def allows(self, url: str) -> bool:
+        return url == self.root or url in self.links or url in self.playlists
+
+    def index(self, playlist_url: str, linked: List[str], segments: List[str]):
+        # Live playlists slide: forget what the previous version of this playlist linked to
+        self._forget(playlist_url)
+        self.playlists[playlist_url] = (linked, segments)
+        self.links.update(linked)
+        for i, url in enumerate(segments):
+            self.positions[url] = (playlist_url, i)
+        # The root (usually the master playlist) is kept: it links every rendition the player may switch to
+        while len(self.playlists) > settings.HLS_SESSION_MAX_PLAYLISTS:
+            self._forget(next(url for url in self.playlists if url != self.root))
+
+    def _forget(self, playlist_url: str):
+        old_linked, old_segments = self.playlists.pop(playlist_url, ([], []))
+        self.links.subtract(old_linked)
+        for url in set(old_linked):
+            if self.links[url] <= 0:
+                del self.links[url]
+        for url in old_segments:
+            if self.positions.get(url, (None,))[0] == playlist_url:
+                del self.positions[url]
+
+    def following(self, url: str, count: int) -> List[str]:
+        position = self.positions.get(url)
+        if position is None:
+            return []
+        segments = self.playlists[position[0]][1]
+        return segments[position[1] + 1:position[1] + 1 + count]
+
+class HlsProxy:
+    """Serves HLS through the backend: rewritten playlists, and segments fetched with the format's
+    headers, prefetched HLS_PREFETCH_SEGMENTS ahead into a bounded in-memory LRU.
+
+    Sessions live in this process; a player that lands on another instance reloads the stream.
+    """
+    def __init__(self):
+        self.sessions: "OrderedDict[str, HlsSession]" = OrderedDict()
+        self.cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self.cache_bytes = 0
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.counters = {
+            "playlists": 0, "segments": 0, "cache_hits": 0, "inflight_joins": 0, "upstream_fetches": 0,
+            "prefetched": 0, "prefetch_failures": 0, "evictions": 0, "concat_downloads": 0, "sessions_expired": 0,
+        }
+
+    def session(self, playlist_url: str, headers: Dict[str, str]) -> HlsSession:
+        session = HlsSession(playlist_url, headers)
+        self.sessions[session.id] = session
+        self._expire()
+        return session
+
+    def get_session(self, session_id: str) -> Optional[HlsSession]:
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self._touch(session)
+        return session
+
+    def _touch(self, session: HlsSession):
+        session.last_used = time.monotonic()
+        self.sessions.move_to_end(session.id)
+
+    def _expire(self):
+        now = time.monotonic()
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if len(self.sessions) <= settings.HLS_MAX_SESSIONS and now - oldest.last_used < settings.HLS_SESSION_TTL:
+                break
+            del self.sessions[oldest.id]
+            self.counters["sessions_expired"] += 1
+
+    def _link(self, session: HlsSession, url: str, kind: str) -> str:
+        return f"{settings.API_V1_STR}/hls/{session.id}/{kind}?u={quote(url, safe='')}"
+
+    async def _fetch(self, session: HlsSession, url: str, byte_range: Optional[str] = None) -> Tuple[bytes, httpx.Response]:
+        """Whole body of `url` (decoded), read up to HLS_MAX_SEGMENT_BYTES, with the upstream response."""
+        headers = {"User-Agent": stream_proxy.ua, **session.headers}
+        if byte_range:
+            headers["Range"] = byte_range
+        self.counters["upstream_fetches"] += 1
+        client = http_pool.client_for(url)
+        async with client.stream("GET", url, headers=headers, timeout=stream_proxy.timeout) as resp:
+            if resp.status_code not in (200, 206):
+                raise HlsError(f"Upstream answered HTTP {resp.status_code}", 404 if resp.status_code in (404, 410) else 502)
+            chunks, size = [], 0
+            async for chunk in resp.aiter_bytes():
+                size += len(chunk)
+                if size > settings.HLS_MAX_SEGMENT_BYTES:
+                    raise HlsError(f"HLS resource exceeds {settings.HLS_MAX_SEGMENT_BYTES} bytes")
+                chunks.append(chunk)
+        return b"".join(chunks), resp
+
+    async def _playlist_text(self, session: HlsSession, url: str) -> Tuple[str, str]:
+        body, resp = await self._fetch(session, url)
+        text = body.decode("utf-8", "replace")
+        if not text.lstrip("\ufeff \r\n").startswith("#EXTM3U"):
+            raise HlsError("Upstream did not return an HLS playlist")
+        # Relative URIs resolve against where the playlist ended up after redirects
+        return text, str(resp.url)
+
+    async def playlist(self, session: HlsSession, url: str) -> Response:
+        text, base = await self._playlist_text(session, url)
+        body, linked, segments = rewrite_playlist(text, base, lambda u, kind: self._link(session, u, kind))
+        session.index(url, linked, segments)
+        self.counters["playlists"] += 1
+        # A finished stream is played from the start: warm its first segments now
+        if segments and "#EXT-X-ENDLIST" in text:
+            self._prefetch(session, segments[:settings.HLS_PREFETCH_SEGMENTS])
+        return Response(body, media_type=PLAYLIST_TYPE,
+                        headers={"cache-control": "no-cache", "access-control-allow-origin": "*"})
+
+    async def _load(self, session: HlsSession, url: str) -> bytes:
+        try:
+            data, _ = await self._fetch(session, url)
+            self._store(url, data)
+            return data
+        finally:
+            self.inflight.pop(url, None)
+
+    def _store(self, url: str, data: bytes):
+        if len(data) > settings.HLS_CACHE_MAX_BYTES // 4:
+            return
+        self.cache[url] = data
+        self.cache_bytes += len(data)
+        while self.cache_bytes > settings.HLS_CACHE_MAX_BYTES:
+            _, evicted = self.cache.popitem(last=False)
+            self.cache_bytes -= len(evicted)
+            self.counters["evictions"] += 1
+
+    def _start(self, session: HlsSession, url: str) -> asyncio.Task:
+        task = self.inflight.get(url)
+        if task is None:
+            task = self.inflight[url] = asyncio.get_running_loop().create_task(self._load(session, url))
+            # Whoever awaits it sees the error; this only keeps an abandoned failure from being logged as unretrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    def _prefetch(self, session: HlsSession, urls: List[str]):
+        for url in urls:
+            if url in self.cache or url in self.inflight:
+                continue
+            self.counters["prefetched"] += 1
+            task = self._start(session, url)
+            self._tasks.add(task)
+            task.add_done_callback(self._prefetch_done)
+
+    def _prefetch_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.counters["prefetch_failures"] += 1
+            log.debug("Segment prefetch failed: %s", task.exception())
+
+    async def resource(self, session: HlsSession, kind: str, url: str, byte_range: Optional[str] = None) -> Response:
+        """A playlist ("p") or segment ("s") linked from one of this session's rewritten playlists."""
+        if not session.allows(url):
+            raise HlsError("URL was not handed out by this HLS session", 403)
+        if kind == "p":
+            return await self.playlist(session, url)
+        return await self.segment(session, url, byte_range)
+
+    async def segment(self, session: HlsSession, url: str, byte_range: Optional[str] = None) -> Response:
+        headers = {"access-control-allow-origin": "*", "cache-control": "private, max-age=300"}
+        self.counters["segments"] += 1
+        if byte_range:
+            # Byte-range playlists: the player picks the bytes, so pass the range through uncached
+            data, resp = await self._fetch(session, url, byte_range)
+            for name in ("content-type", "content-range"):
+                if resp.headers.get(name):
+                    headers[name] = resp.headers[name]
+            STREAM_BYTES.inc(len(data), path="hls")
+            return Response(data, status_code=resp.status_code, headers=headers)
+
+        data = self.cache.get(url)
+        if data is not None:
+            self.cache.move_to_end(url)
+            self.counters["cache_hits"] += 1
+        else:
+            if url in self.inflight:
+                self.counters["inflight_joins"] += 1
+            task = self._start(session, url)
+        # Keep the next segments coming while this one is sent
+        self._prefetch(session, session.following(url, settings.HLS_PREFETCH_SEGMENTS))
+        if data is None:
+            # Shielded: other players may be waiting on the same fetch
+            data = await asyncio.shield(task)
+        STREAM_BYTES.inc(len(data), path="hls")
+        return Response(data, media_type="video/mp4" if url.split("?")[0].endswith((".m4s", ".mp4")) else "video/mp2t",
+                        headers=headers)
+
+    async def download(self, session: HlsSession, url: str, filename: str) -> Response:
+        """The whole stream as one file: the init section and every segment, concatenated in order."""
+        text, base = await self._playlist_text(session, url)
+        if "#EXT-X-STREAM-INF" in text:
+            text, base = await self._playlist_text(session, best_variant(text, base))
+        playlist = parse_media_playlist(text, base)
+        if playlist.encrypted:
+            raise HlsError("Encrypted HLS streams can be played but not downloaded", 501)
+        if not playlist.ended:
+            raise HlsError("Live HLS streams cannot be downloaded as one file", 409)
+        parts = ([playlist.init] if playlist.init else []) + playlist.segments
+        fragmented = playlist.init is not None or parts and parts[-1][0].split("?")[0].endswith((".m4s", ".mp4"))
+        self.counters["concat_downloads"] += 1
+        headers = {
+            "content-type": "video/mp4" if fragmented else "video/mp2t",
+            "content-disposition": f'attachment; filename="{filename}"',
+            "access-control-allow-origin": "*",
+        }
+        return GeneratorResponse(self._concat(session, parts), status_code=200, headers=headers)
+
+    async def _concat(self, session: HlsSession, parts: List[Tuple[str, Optional[str]]]) -> AsyncGenerator[bytes, None]:
+        # Up to HLS_PREFETCH_SEGMENTS fetches run ahead of the segment being sent
+        loop = asyncio.get_running_loop()
+        queue = iter(parts)
+        window: Deque[asyncio.Task] = deque()
+
+        def refill():
+            while len(window) <= settings.HLS_PREFETCH_SEGMENTS:
+                part = next(queue, None)
+                if part is None:
+                    return
+                window.append(loop.create_task(self._fetch(session, *part)))
+
+        try:
+            refill()
+            while window:
+                data, _ = await window.popleft()
+                refill()
+                yield data
+        finally:
+            for task in window:
+                task.cancel()
+
+    async def open(self, url: str, filename: Optional[str] = None, trusted: bool = True) -> Response:
+        """Answers /stream for an hls: format: its rewritten playlist, or the concatenated file for downloads.
+
+        Headers are only sent upstream when `trusted` (the URL came from our own extraction); a
+        client-supplied hls: URL is fetched without them.
+        """
+        playlist_url, headers = decode_hls_url(url)
+        session = self.session(playlist_url, headers if trusted else {})
+        if filename and settings.HLS_CONCAT_ENABLED:
+            return await self.download(session, playlist_url, filename)
+        return await self.playlist(session, playlist_url)
+
+    def shutdown(self):
+        for task in list(self.inflight.values()):
+            task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "sessions": len(self.sessions),
+            "cached_segments": len(self.cache),
+            "cache_bytes": self.cache_bytes,
+            "inflight": len(self.inflight),
+        }
+
+hls_proxy = HlsProxy()
@@ -0,0 +1,102 @@
+import asyncio
+import httpx
+from collections import OrderedDict
+from http.cookiejar import CookieJar
+from typing import Dict, Any, Set, Tuple
+from urllib.parse import urlsplit
+from backend.app.core.config import settings
+
+class _CountingTransport(httpx.AsyncHTTPTransport):
+    """Transport that counts TCP connects and TLS handshakes via httpcore trace events."""
+    def __init__(self, counters: Dict[str, int], **kwargs):
+        super().__init__(**kwargs)
+        self.counters = counters
+
+    async def _trace(self, event: str, info: Dict[str, Any]):
+        if event == "connection.connect_tcp.complete":
+            self.counters["tcp_connects"] += 1
+        elif event == "connection.start_tls.complete":
+            self.counters["tls_handshakes"] += 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions = {**request.extensions, "trace": self._trace}
+        return await super().handle_async_request(request)
+
+    def connection_stats(self) -> Dict[str, int]:
+        connections = self._pool.connections
+        idle = sum(1 for c in connections if c.is_idle())
+        return {"open": len(connections), "idle": idle, "active": len(connections) - idle}
+
+class _DiscardingCookieJar(CookieJar):
+    """Never keeps a cookie: pooled clients are shared by every user, so Set-Cookie from one
+    request must not be replayed on the next. Callers pass any cookies they need per request."""
+    def extract_cookies(self, response, request):
+        pass
+
+    def set_cookie(self, cookie):
+        pass
+
+class HttpClientPool:
+    """Application-scoped pool of keep-alive HTTP/2 clients, one per upstream host."""
+    def __init__(self):
+        self.clients: "OrderedDict[Tuple[str, bool, bool], httpx.AsyncClient]" = OrderedDict()
+        self.counters = {"tcp_connects": 0, "tls_handshakes": 0, "clients_created": 0, "clients_evicted": 0}
+        # Closes of evicted clients, referenced until done so they are not garbage-collected mid-way
+        self._closing: Set[asyncio.Task] = set()
+
+    def _build_client(self, verify: bool, http2: bool) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_PER_HOST,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        transport = _CountingTransport(
+            self.counters, http2=http2, limits=limits, verify=verify
+        )
+        self.counters["clients_created"] += 1
+        return httpx.AsyncClient(transport=transport, follow_redirects=True, timeout=10,
+                                 cookies=_DiscardingCookieJar())
+
+    def client_for(self, url: str, verify: bool = True, multiplex: bool = True) -> httpx.AsyncClient:
+        """`multiplex=False` returns an HTTP/1.1 client, so concurrent requests use separate connections."""
+        key = (urlsplit(url).netloc.lower(), verify, multiplex and settings.HTTP2_ENABLED)
+        client = self.clients.get(key)
+        if client is not None and not client.is_closed:
+            self.clients.move_to_end(key)
+            return client
+
+        client = self._build_client(verify, key[2])
+        self.clients[key] = client
+        self._evict_idle()
+        return client
+
+    def _evict_idle(self):
+        """Drops least recently used host clients that have no requests in flight."""
+        overflow = len(self.clients) - settings.HTTP_MAX_HOSTS
+        for key in list(self.clients.keys())[:-1]:
+            if overflow <= 0: break
+            client = self.clients[key]
+            if client._transport.connection_stats()["active"] == 0:
+                del self.clients[key]
+                self.counters["clients_evicted"] += 1
+                task = asyncio.get_running_loop().create_task(client.aclose())
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+                overflow -= 1
+
+    async def aclose(self):
+        clients = list(self.clients.values())
+        self.clients.clear()
+        await asyncio.gather(*(c.aclose() for c in clients), *self._closing, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        hosts = {}
+        totals = {"open": 0, "idle": 0, "active": 0}
+        for (host, verify, http2), client in self.clients.items():
+            conn = client._transport.connection_stats()
+            label = host if verify else f"{host} (insecure)"
+            hosts[label if http2 or not settings.HTTP2_ENABLED else f"{label} (http/1.1)"] = conn
+            for k in totals: totals[k] += conn[k]
+        return {**totals, **self.counters, "http2": settings.HTTP2_ENABLED, "hosts": hosts}
+
+http_pool = HttpClientPool()
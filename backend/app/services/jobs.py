@@ -1,19 +1,211 @@
 import asyncio
-from typing import Dict
+import contextvars
+import heapq
+import itertools
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Any, Awaitable, Callable, List, Optional, Tuple
+from backend.app.core.config import settings
+
+# Public job whose work is running in the current context; extraction code reports progress to it
+_current_job: contextvars.ContextVar[Optional["JobRecord"]] = contextvars.ContextVar("current_job", default=None)
+
+TERMINAL_STATES = ("succeeded", "failed", "cancelled")
+
+def emit_event(kind: str, **data: Any):
+    """Records a progress event on the job this code runs for, if any."""
+    record = _current_job.get()
+    # Background work spawned by a job (e.g. prefetch) can outlive it
+    if record is not None and not record.done:
+        record.emit(kind, **data)
+
+class JobRecord:
+    """A submitted job: its state, timings, result and progress events."""
+    def __init__(self, job_id: str, url: str, priority: int):
+        self.id = job_id
+        self.url = url
+        self.priority = priority
+        # queued | running | succeeded | failed | cancelled
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.events: List[Dict[str, Any]] = []
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATES
+
+    def emit(self, kind: str, **data: Any):
+        if len(self.events) < settings.JOB_MAX_EVENTS:
+            self.events.append({"event": kind, "at": round(time.time() - self.created_at, 3), **data})
+        # Wake every subscriber, then arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_for_change(self, seen_events: int):
+        """Returns once there are events past `seen_events` or the job finished."""
+        changed = self._changed
+        if len(self.events) > seen_events or self.done:
+            return
+        await changed.wait()
+
+    def to_dict(self) -> Dict[str, Any]:
+        queued_for = (self.started_at or self.finished_at or time.time()) - self.created_at
+        return {
+            "id": self.id, "url": self.url, "status": self.status, "priority": self.priority,
+            "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at,
+            "queue_seconds": round(queued_for, 4),
+            "run_seconds": round(self.finished_at - self.started_at, 4) if self.started_at and self.finished_at else None,
+            "result": self.result,
+        }
+
+class JobQueueFull(Exception):
+    """Raised when too many submitted jobs are already waiting to run."""
 
 class JobController:
     def __init__(self):
         self.jobs: Dict[str, asyncio.Task] = {}
+        # Coalescing key -> job ID of the extraction currently in flight for it
+        self.inflight: Dict[str, str] = {}
+        # Submitted jobs, oldest first; finished ones are kept for polling until pruned
+        self.records: "OrderedDict[str, JobRecord]" = OrderedDict()
+        # (-priority, submission order, job ID): higher priority first, FIFO within a priority
+        self._queue: List[Tuple[int, int, str]] = []
+        self._runners: Dict[str, Callable[[], Awaitable[Any]]] = {}
+        self._seq = itertools.count()
+        self._running = 0
+        self.queue_waits: Deque[float] = deque(maxlen=500)
+        self.counters = {"started": 0, "coalesced": 0, "cancelled": 0, "submitted": 0, "pruned": 0}
 
-    def register_job(self, job_id: str, task: asyncio.Task):
+    def register_job(self, job_id: str, task: asyncio.Task, key: Optional[str] = None):
         self.jobs[job_id] = task
-        task.add_done_callback(lambda t: self.jobs.pop(job_id, None))
+        if key is not None:
+            self.inflight[key] = job_id
+        task.add_done_callback(lambda t: self._finish(job_id, key))
+
+    def _finish(self, job_id: str, key: Optional[str]):
+        self.jobs.pop(job_id, None)
+        if key is not None and self.inflight.get(key) == job_id:
+            self.inflight.pop(key, None)
+
+    def start_or_join(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[str, asyncio.Task, bool]:
+        """Returns the in-flight job for `key`, starting one from `factory` if there is none.
+
+        Callers should await the task through `asyncio.shield` so that one caller
+        going away does not cancel work the others are still waiting on.
+        """
+        job_id = self.inflight.get(key)
+        task = self.jobs.get(job_id) if job_id else None
+        if task is not None and not task.done():
+            self.counters["coalesced"] += 1
+            return job_id, task, False
+
+        job_id = str(uuid.uuid4())
+        task = asyncio.create_task(factory())
+        self.register_job(job_id, task, key)
+        self.counters["started"] += 1
+        return job_id, task, True
+
+    def submit(self, url: str, runner: Callable[[], Awaitable[Any]], priority: int = 0) -> JobRecord:
+        """Queues `runner` as a pollable job; it starts once a slot is free, highest priority first."""
+        self._prune()
+        if len(self._runners) >= settings.JOB_MAX_QUEUED:
+            raise JobQueueFull(f"{len(self._runners)} jobs already queued")
+        record = JobRecord(str(uuid.uuid4()), url, priority)
+        self.records[record.id] = record
+        self._runners[record.id] = runner
+        heapq.heappush(self._queue, (-priority, next(self._seq), record.id))
+        self.counters["submitted"] += 1
+        record.emit("queued", position=len(self._runners))
+        self._dispatch()
+        return record
+
+    def _dispatch(self):
+        while self._running < settings.JOBS_MAX_CONCURRENT and self._queue:
+            _, _, job_id = heapq.heappop(self._queue)
+            runner = self._runners.pop(job_id, None)
+            record = self.records.get(job_id)
+            if runner is None or record is None or record.status != "queued":
+                continue  # cancelled while queued
+            self._running += 1
+            record.status = "running"
+            record.started_at = time.time()
+            self.queue_waits.append(record.started_at - record.created_at)
+            record.emit("started")
+            # The task copies this context, so everything it starts reports to the record
+            token = _current_job.set(record)
+            try:
+                task = asyncio.create_task(self._run(record, runner))
+            finally:
+                _current_job.reset(token)
+            self.register_job(record.id, task)
+            # A callback rather than a `finally` in _run: a task cancelled before its first step never enters it
+            task.add_done_callback(lambda t, record=record: self._release(record))
+
+    async def _run(self, record: JobRecord, runner: Callable[[], Awaitable[Any]]):
+        try:
+            record.result = await runner()
+            record.status = "succeeded" if getattr(record.result, "success", True) else "failed"
+        except asyncio.CancelledError:
+            record.status = "cancelled"
+        except Exception as e:
+            record.status = "failed"
+            record.emit("error", error=str(e))
+        finally:
+            # With the terminal status, so _prune never sees a done record without a finish time
+            record.finished_at = time.time()
+
+    def _release(self, record: JobRecord):
+        """Frees a finished job's slot and starts the next queued one."""
+        if record.status == "running":
+            record.status = "cancelled"  # cancelled before _run started
+            record.finished_at = time.time()
+        self._running -= 1
+        record.emit(record.status)
+        self._dispatch()
+
+    def _prune(self):
+        """Drops finished records past their retention, and the oldest finished ones beyond the cap."""
+        cutoff = time.time() - settings.JOB_RETENTION_SECONDS
+        excess = len(self.records) - settings.JOB_MAX_RECORDS
+        for job_id, record in list(self.records.items()):
+            if record.done and record.finished_at is not None and (record.finished_at < cutoff or excess > 0):
+                del self.records[job_id]
+                self.counters["pruned"] += 1
+                excess -= 1
+
+    def get_record(self, job_id: str) -> Optional[JobRecord]:
+        return self.records.get(job_id)
 
     def cancel_job(self, job_id: str) -> bool:
+        record = self.records.get(job_id)
+        if record is not None and record.status == "queued":
+            # Never started: drop it from the queue (the heap entry is skipped on dispatch)
+            self._runners.pop(job_id, None)
+            record.status = "cancelled"
+            record.finished_at = time.time()
+            record.emit("cancelled")
+            self.counters["cancelled"] += 1
+            return True
         task = self.jobs.get(job_id)
         if task and not task.done():
             task.cancel()
+            self.counters["cancelled"] += 1
             return True
         return False
 
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.queue_waits)
+        def pct(q: float) -> Optional[float]:
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))], 4) if waits else None
+        return {
+            **self.counters, "running": len(self.jobs), "inflight_keys": len(self.inflight),
+            "jobs_running": self._running, "jobs_queued": len(self._runners), "records": len(self.records),
+            "queue_wait": {"p50": pct(0.5), "p90": pct(0.9), "max": round(waits[-1], 4) if waits else None},
+        }
+
 job_controller = JobController()
@@ -0,0 +1,177 @@
+import asyncio
+import os
+import shutil
+from functools import lru_cache
+from typing import AsyncGenerator, Dict, Any, List, Optional, Tuple
+from urllib.parse import urlencode, parse_qs
+from fastapi.responses import Response
+from backend.app.core.config import settings
+from backend.app.core.log import get_logger
+from backend.app.models.schemas import MediaFormat
+from backend.app.services.streamer import stream_proxy, GeneratorResponse
+
+log = get_logger("mux")
+
+# Synthetic format URLs: the backend muxes the video and audio URLs they carry
+MUX_SCHEME = "mux:"
+
+# Codecs the fragmented-MP4 output can carry without re-encoding, most compatible first
+VIDEO_CODECS = ("avc1", "vp09", "vp9", "av01")
+AUDIO_CODECS = ("mp4a", "opus")
+
+@lru_cache(maxsize=1)
+def ffmpeg_path() -> Optional[str]:
+    # Inputs are handed to ffmpeg as inherited pipe descriptors, which needs POSIX
+    if not settings.MUX_ENABLED or os.name != "posix":
+        return None
+    return shutil.which(settings.FFMPEG_PATH)
+
+def encode_mux_url(video_url: str, audio_url: str) -> str:
+    return MUX_SCHEME + urlencode({"v": video_url, "a": audio_url})
+
+def decode_mux_url(url: str) -> Tuple[str, str]:
+    query = parse_qs(url[len(MUX_SCHEME):])
+    return query["v"][0], query["a"][0]
+
+def _codec_rank(codec: Optional[str], preferred: Tuple[str, ...]) -> Optional[int]:
+    codec = (codec or "none").lower()
+    for rank, prefix in enumerate(preferred):
+        if codec.startswith(prefix):
+            return rank
+    return None
+
+def muxed_formats(raw_formats: List[Dict[str, Any]]) -> List[MediaFormat]:
+    """Pairs the best audio-only stream with the best video-only stream of each height
+    above what the combined formats already offer."""
+    if not ffmpeg_path():
+        return []
+    combined = [f.get('height') or 0 for f in raw_formats
+                if f.get('vcodec', 'none') != 'none' and f.get('acodec', 'none') != 'none']
+    best_combined = max(combined, default=0)
+
+    audio = [f for f in raw_formats if f.get('url') and f.get('vcodec') == 'none'
+             and _codec_rank(f.get('acodec'), AUDIO_CODECS) is not None]
+    if not audio:
+        return []
+    best_audio = min(audio, key=lambda f: (_codec_rank(f.get('acodec'), AUDIO_CODECS), -(f.get('abr') or f.get('tbr') or 0)))
+
+    by_height: Dict[int, Dict[str, Any]] = {}
+    for f in raw_formats:
+        rank = _codec_rank(f.get('vcodec'), VIDEO_CODECS)
+        height = f.get('height') or 0
+        if not f.get('url') or f.get('acodec', 'none') != 'none' or rank is None or height <= best_combined:
+            continue
+        current = by_height.get(height)
+        if current is None or (rank, -(f.get('tbr') or 0)) < (_codec_rank(current.get('vcodec'), VIDEO_CODECS), -(current.get('tbr') or 0)):
+            by_height[height] = f
+
+    formats = []
+    for height, video in sorted(by_height.items(), reverse=True):
+        sizes = [video.get('filesize') or video.get('filesize_approx'), best_audio.get('filesize') or best_audio.get('filesize_approx')]
+        formats.append(MediaFormat(
+            format_id=f"{video.get('format_id')}+{best_audio.get('format_id')}",
+            extension="mp4",
+            resolution=f"{height}p",
+            filesize=sum(sizes) if all(sizes) else None,
+            quality_label=f"{height}p (video+audio)",
+            url=encode_mux_url(video['url'], best_audio['url']),
+        ))
+    return formats
+
+class DashMuxer:
+    """Remuxes separate video and audio streams into fragmented MP4 through an ffmpeg pipe.
+
+    Both inputs are fed from concurrent upstream reads; pipe backpressure keeps memory bounded.
+    """
+    def __init__(self):
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.counters = {"started": 0, "completed": 0, "failed": 0, "active": 0, "bytes_out": 0}
+
+    async def _feed(self, url: str, fd: int):
+        """Copies an upstream body into one of ffmpeg's input pipes, closing it at the end (EOF)."""
+        loop = asyncio.get_running_loop()
+        pipe = os.fdopen(fd, "wb", buffering=0)
+        try:
+            transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, pipe)
+        except Exception:
+            pipe.close()
+            raise
+        writer = asyncio.StreamWriter(transport, protocol, None, loop)
+        try:
+            upstream = await stream_proxy.open(url, {})
+            try:
+                upstream.raise_for_status()
+                async for chunk in upstream.aiter_raw(chunk_size=1024 * 128):
+                    writer.write(chunk)
+                    await writer.drain()
+            finally:
+                await upstream.aclose()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # ffmpeg exited early; its exit status tells the real story
+        finally:
+            writer.close()
+
+    async def _body(self, video_url: str, audio_url: str) -> AsyncGenerator[bytes, None]:
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(settings.MUX_MAX_PROCESSES)
+        async with self.slots:
+            video_r, video_w = os.pipe()
+            audio_r, audio_w = os.pipe()
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    ffmpeg_path(), "-hide_banner", "-loglevel", "error",
+                    "-i", f"pipe:{video_r}", "-i", f"pipe:{audio_r}",
+                    "-map", "0:v:0", "-map", "1:a:0", "-c", "copy",
+                    "-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof", "pipe:1",
+                    stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE, pass_fds=(video_r, audio_r),
+                )
+            except Exception:
+                os.close(video_w)
+                os.close(audio_w)
+                raise
+            finally:
+                # The child holds its own copies of the read ends
+                os.close(video_r)
+                os.close(audio_r)
+
+            self.counters["started"] += 1
+            self.counters["active"] += 1
+            feeders = [asyncio.create_task(self._feed(video_url, video_w)),
+                       asyncio.create_task(self._feed(audio_url, audio_w))]
+            try:
+                while True:
+                    chunk = await proc.stdout.read(1024 * 128)
+                    if not chunk:
+                        break
+                    self.counters["bytes_out"] += len(chunk)
+                    yield chunk
+                await proc.wait()
+                if proc.returncode:
+                    error = (await proc.stderr.read()).decode(errors="replace").strip()
+                    log.error("ffmpeg exited with %s: %s", proc.returncode, error[-500:])
+                    self.counters["failed"] += 1
+                else:
+                    self.counters["completed"] += 1
+            finally:
+                self.counters["active"] -= 1
+                for task in feeders:
+                    task.cancel()
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+                await asyncio.gather(*feeders, return_exceptions=True)
+
+    def stream(self, url: str, filename: Optional[str] = None, method: str = "GET") -> Response:
+        headers = {"content-type": "video/mp4", "access-control-allow-origin": "*"}
+        if filename:
+            headers["content-disposition"] = f'attachment; filename="{filename}"'
+        if method == "HEAD":
+            return Response(status_code=200, headers=headers)
+        # Live remux output has no length and cannot be seeked
+        return GeneratorResponse(self._body(*decode_mux_url(url)), status_code=200, headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "ffmpeg": ffmpeg_path(), "max_processes": settings.MUX_MAX_PROCESSES}
+
+dash_muxer = DashMuxer()
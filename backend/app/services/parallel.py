@@ -0,0 +1,109 @@
+import asyncio
+import re
+from typing import AsyncGenerator, Dict, Any, List, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+import httpx
+from fastapi.responses import Response
+from backend.app.core.config import settings
+from backend.app.services.streamer import stream_proxy, GeneratorResponse
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+class RangeFetchError(Exception):
+    """The origin did not return the requested byte range (or the resource changed under it)."""
+
+def split_ranges(start: int, end: int, part_size: int) -> List[Tuple[int, int]]:
+    """Inclusive [start, end] cut into consecutive parts of at most `part_size` bytes."""
+    return [(lo, min(lo + part_size, end + 1) - 1) for lo in range(start, end + 1, part_size)]
+
+class ParallelDownloader:
+    """Fetches one resource over several concurrent range requests and reassembles it in order."""
+    def __init__(self):
+        self.counters = {"downloads": 0, "fallbacks": 0, "parts": 0, "retries": 0, "bytes": 0, "peak_buffered_parts": 0}
+
+    @staticmethod
+    def connections_for(url: str) -> int:
+        host = (urlsplit(url).hostname or "").lower()
+        for suffix, count in settings.PARALLEL_HOST_CONNECTIONS.items():
+            if host == suffix or host.endswith("." + suffix):
+                return max(1, count)
+        return max(1, settings.PARALLEL_CONNECTIONS)
+
+    async def _fetch_part(self, url: str, start: int, end: int, validator: Optional[str]) -> bytes:
+        headers = {"range": f"bytes={start}-{end}"}
+        if validator:
+            headers["if-range"] = validator
+        for attempt in range(settings.PARALLEL_PART_RETRIES + 1):
+            try:
+                # HTTP/1.1: throttled CDNs limit per connection, so parts must not share one
+                upstream = await stream_proxy.open(url, headers, multiplex=False)
+                try:
+                    if upstream.status_code != 206 or not upstream.headers.get("content-range", "").startswith(f"bytes {start}-"):
+                        raise RangeFetchError(f"Expected bytes {start}-{end}, got HTTP {upstream.status_code}")
+                    data = b"".join([chunk async for chunk in upstream.aiter_raw(chunk_size=1024 * 128)])
+                finally:
+                    await upstream.aclose()
+                if len(data) != end - start + 1:
+                    raise httpx.ReadError(f"Short read for bytes {start}-{end}: {len(data)} bytes")
+                self.counters["parts"] += 1
+                self.counters["bytes"] += len(data)
+                return data
+            except httpx.HTTPError:
+                if attempt == settings.PARALLEL_PART_RETRIES:
+                    raise
+                self.counters["retries"] += 1
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def iter_parts(self, url: str, parts: List[Tuple[int, int]],
+                         validator: Optional[str] = None) -> AsyncGenerator[bytes, None]:
+        """Yields each part's bytes in order while later parts download concurrently.
+
+        At most `connections_for(url)` parts are in flight or waiting to be yielded,
+        which bounds the reordering buffer.
+        """
+        window = self.connections_for(url)
+        tasks: Dict[int, asyncio.Task] = {}
+        launched = 0
+        try:
+            for i in range(len(parts)):
+                while launched < len(parts) and launched < i + window:
+                    tasks[launched] = asyncio.create_task(self._fetch_part(url, *parts[launched], validator))
+                    launched += 1
+                data = await tasks.pop(i)
+                buffered = 1 + sum(1 for t in tasks.values() if t.done())
+                self.counters["peak_buffered_parts"] = max(self.counters["peak_buffered_parts"], buffered)
+                yield data
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def download(self, url: str, request_headers: Mapping[str, str], filename: Optional[str]) -> Response:
+        """Serves a whole-file download over parallel ranges; falls back to a single stream when the origin can't."""
+        probe = await stream_proxy.open(url, {"range": "bytes=0-0"})
+        await probe.aclose()
+        match = _CONTENT_RANGE.match(probe.headers.get("content-range", ""))
+        total = int(match.group(3)) if match else 0
+        if probe.status_code != 206 or probe.headers.get("content-encoding") or total <= settings.PARALLEL_PART_SIZE:
+            self.counters["fallbacks"] += 1
+            return await stream_proxy.proxy_stream(url, request_headers, filename)
+
+        self.counters["downloads"] += 1
+        headers = {
+            "content-type": probe.headers.get("content-type") or "video/mp4",
+            "content-length": str(total),
+            "accept-ranges": "bytes",
+            "access-control-allow-origin": "*",
+        }
+        for name in ("etag", "last-modified"):
+            if probe.headers.get(name): headers[name] = probe.headers[name]
+        if filename:
+            headers["content-disposition"] = f'attachment; filename="{filename}"'
+        validator = probe.headers.get("etag") or probe.headers.get("last-modified")
+        parts = split_ranges(0, total - 1, settings.PARALLEL_PART_SIZE)
+        return GeneratorResponse(self.iter_parts(url, parts, validator), status_code=200, headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "default_connections": settings.PARALLEL_CONNECTIONS,
+                "host_connections": settings.PARALLEL_HOST_CONNECTIONS}
+
+parallel_downloader = ParallelDownloader()
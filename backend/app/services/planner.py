@@ -0,0 +1,173 @@
+import math
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Any, List, Optional, Tuple
+from backend.app.core.config import settings
+from backend.app.services.breakers import breaker_board, breaker_name
+from backend.app.services.urls import UrlDescriptor
+
+# Relative cost of each strategy; cheaper ones are preferred when success rates tie
+STRATEGY_COST = {"direct_file": 0, "rapid_scrape": 1, "fallback_node": 2, "ydl_direct": 3}
+
+# A strategy is skipped for a domain once it has this much history and a worse success rate...
+MIN_ATTEMPTS_TO_SKIP = 20
+MIN_SUCCESS_RATE = 0.05
+# ...except on every Nth attempt, so it can recover when the upstream does
+EXPLORE_EVERY = 10
+
+class RollingStats:
+    """Outcomes of the most recent runs of one strategy against one domain."""
+    def __init__(self, window: int):
+        # (success, latency seconds)
+        self.samples: Deque[Tuple[bool, float]] = deque(maxlen=window)
+        self.attempts = 0
+        self.successes = 0
+
+    def add(self, success: bool, latency: float):
+        self.samples.append((success, latency))
+        self.attempts += 1
+        self.successes += int(success)
+
+    def success_rate(self) -> float:
+        wins = sum(1 for ok, _ in self.samples if ok)
+        # Laplace smoothing keeps untried strategies at an optimistic 50%
+        return (wins + 1) / (len(self.samples) + 2)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Latency percentile of successful runs; failures don't tell us how long a win takes."""
+        latencies = sorted(lat for ok, lat in self.samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, max(0, math.ceil(q * len(latencies)) - 1))]
+
+@dataclass
+class StrategyPlan:
+    domain: str
+    # Stages run in order; within a stage each strategy is hedged in behind the one before it
+    stages: List[List[str]] = field(default_factory=list)
+    skipped: Dict[str, str] = field(default_factory=dict)
+    # Seconds until a probe is allowed, when every candidate sits behind an open circuit
+    retry_after: Optional[int] = None
+
+class StrategyPlanner:
+    """Chooses which extraction strategies to run for a URL, and in what order."""
+    def __init__(self):
+        # domain -> strategy -> stats, least recently analyzed domain first; bounded by STRATEGY_MAX_DOMAINS
+        self.outcomes: "OrderedDict[str, Dict[str, RollingStats]]" = OrderedDict()
+        # (strategy, reason) -> times skipped
+        self.skips: Dict[Tuple[str, str], int] = {}
+
+    def _get(self, domain: str, strategy: str) -> Optional[RollingStats]:
+        return self.outcomes.get(domain, {}).get(strategy)
+
+    def _stats(self, domain: str, strategy: str) -> RollingStats:
+        strategies = self.outcomes.get(domain)
+        if strategies is None:
+            strategies = self.outcomes[domain] = {}
+            while len(self.outcomes) > settings.STRATEGY_MAX_DOMAINS:
+                self.outcomes.popitem(last=False)
+        else:
+            self.outcomes.move_to_end(domain)
+        stats = strategies.get(strategy)
+        if stats is None:
+            stats = strategies[strategy] = RollingStats(settings.STRATEGY_STATS_WINDOW)
+        return stats
+
+    def record(self, domain: str, strategy: str, success: bool, latency: float):
+        self._stats(domain, strategy).add(success, latency)
+
+    def success_rate(self, domain: str, strategy: str) -> float:
+        stats = self._get(domain, strategy)
+        return stats.success_rate() if stats else 0.5
+
+    def expected_latency(self, domain: str, strategy: str, prior_rank: int = 0) -> float:
+        """Expected time to a usable result: typical win latency inflated by the odds of losing.
+
+        Without history, `prior_rank` (position in the platform's default order) stands in.
+        """
+        stats = self._get(domain, strategy)
+        p50 = stats.percentile(0.5) if stats else None
+        if p50 is None:
+            p50 = settings.STRATEGY_HEDGE_DELAY * (1 + prior_rank)
+        return p50 / self.success_rate(domain, strategy)
+
+    def hedge_delay(self, domain: str, strategy: str) -> float:
+        """How long to give a running strategy before launching the next one alongside it."""
+        stats = self._get(domain, strategy)
+        p90 = stats.percentile(0.9) if stats else None
+        if p90 is None:
+            return settings.STRATEGY_HEDGE_DELAY
+        return min(settings.STRATEGY_HEDGE_MAX_DELAY, max(settings.STRATEGY_HEDGE_MIN_DELAY, p90))
+
+    def _skip(self, plan: StrategyPlan, strategy: str, reason: str):
+        plan.skipped[strategy] = reason
+        self.skips[(strategy, reason)] = self.skips.get((strategy, reason), 0) + 1
+
+    def plan(self, target: UrlDescriptor) -> StrategyPlan:
+        plan = StrategyPlan(domain=target.host)
+
+        # Direct file links are resolved locally and deterministically: nothing else is needed
+        if target.platform == "direct":
+            plan.stages.append(["direct_file"])
+            for name in ("rapid_scrape", "ydl_direct", "fallback_node"):
+                self._skip(plan, name, "direct media link resolved locally")
+            return plan
+        self._skip(plan, "direct_file", "no direct media extension")
+
+        if target.is_youtube:
+            # YouTube pages expose no og:video, and yt-dlp runs exactly once alongside the fallback node
+            self._skip(plan, "rapid_scrape", "YouTube pages carry no og:video tag")
+            candidates = ["ydl_direct", "fallback_node"]
+        else:
+            candidates = ["rapid_scrape", "ydl_direct", "fallback_node"]
+
+        candidates = self._drop_open_circuits(plan, candidates)
+        if not candidates:
+            return plan
+        kept = self._drop_learned_failures(plan, candidates)
+        # Historically fastest winner first; the rest are hedged in behind it
+        kept.sort(key=lambda c: (self.expected_latency(plan.domain, c, candidates.index(c)), STRATEGY_COST[c]))
+        plan.stages.append(kept)
+        return plan
+
+    def _drop_open_circuits(self, plan: StrategyPlan, candidates: List[str]) -> List[str]:
+        """Strategies whose upstream is failing are skipped without a request; all open means fail fast."""
+        names = {c: breaker_name(c, plan.domain) for c in candidates}
+        tripped = [c for c in candidates if not breaker_board.available(names[c])]
+        for name in tripped:
+            self._skip(plan, name, "circuit open for upstream")
+        if len(tripped) == len(candidates):
+            plan.retry_after = breaker_board.retry_after(names.values())
+        return [c for c in candidates if c not in tripped]
+
+    def _is_learned_failure(self, domain: str, strategy: str) -> bool:
+        stats = self._get(domain, strategy)
+        if stats is None or len(stats.samples) < MIN_ATTEMPTS_TO_SKIP or stats.attempts % EXPLORE_EVERY == 0:
+            return False
+        return sum(1 for ok, _ in stats.samples if ok) / len(stats.samples) < MIN_SUCCESS_RATE
+
+    def _drop_learned_failures(self, plan: StrategyPlan, candidates: List[str]) -> List[str]:
+        failing = [c for c in candidates if self._is_learned_failure(plan.domain, c)]
+        if len(failing) == len(candidates):
+            # Never plan nothing; a long shot beats a guaranteed failure
+            return candidates
+        for name in failing:
+            self._skip(plan, name, "learned low success rate for domain")
+        return [c for c in candidates if c not in failing]
+
+    def stats(self) -> Dict[str, Any]:
+        domains: Dict[str, Dict[str, Any]] = {}
+        for domain, by_strategy in self.outcomes.items():
+            for strategy, stats in by_strategy.items():
+                recent = [ok for ok, _ in stats.samples]
+                domains.setdefault(domain, {})[strategy] = {
+                    "successes": stats.successes, "attempts": stats.attempts,
+                    "success_rate": round(sum(recent) / len(recent), 4) if recent else None,
+                    **{name: round(v, 4) if v is not None else None for name, v in (
+                        ("p50", stats.percentile(0.5)), ("p90", stats.percentile(0.9)), ("p99", stats.percentile(0.99)))},
+                    "hedge_delay": round(self.hedge_delay(domain, strategy), 4),
+                }
+        skips: Dict[str, Dict[str, int]] = {}
+        for (strategy, reason), count in self.skips.items():
+            skips.setdefault(strategy, {})[reason] = count
+        return {"domains": domains, "tracked_domains": len(self.outcomes), "skipped": skips}
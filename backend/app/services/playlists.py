@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Any, Iterator, List, Optional, Set
+from backend.app.core.config import settings
+from backend.app.core.log import get_logger
+from backend.app.models.schemas import AnalysisResponse, PlaylistEntry, PlaylistInfo
+from backend.app.services.executor import EngineSaturated
+from backend.app.services.urls import route
+
+log = get_logger("playlist")
+
+def _thumbnail(info: Dict[str, Any]) -> Optional[str]:
+    if info.get('thumbnail'):
+        return info['thumbnail']
+    thumbs = info.get('thumbnails') or []
+    return thumbs[-1].get('url') if thumbs else None
+
+def _entry_url(entry: Dict[str, Any]) -> Optional[str]:
+    url = entry.get('webpage_url') or entry.get('url')
+    if url and '://' not in url and entry.get('ie_key') == 'Youtube':
+        # Flat YouTube entries sometimes carry only the video ID
+        return f"https://www.youtube.com/watch?v={url}"
+    return url
+
+class PlaylistSession:
+    """A partially listed playlist: entries are pulled from yt-dlp's lazy generator page by page."""
+    def __init__(self, session_id: str, url: str, info: Dict[str, Any]):
+        self.id = session_id
+        self.url = url
+        self.title = info.get('title') or 'Playlist'
+        self.uploader = info.get('uploader') or info.get('channel')
+        self.thumbnail = _thumbnail(info)
+        self.platform = info.get('extractor_key') or 'Playlist'
+        self.total: Optional[int] = info.get('playlist_count')
+        self.entries: List[PlaylistEntry] = []
+        entries = info.get('entries') or []
+        # PagedList fetches pages by slice; anything else (generator, list) is iterated
+        self._paged = entries if hasattr(entries, 'getslice') else None
+        self._iter: Optional[Iterator] = None if self._paged is not None else iter(entries)
+        self.exhausted = False
+        self.prefetched: Set[int] = set()
+        # Only one pull at a time may advance the generator
+        self.lock = asyncio.Lock()
+        self.last_access = time.time()
+
+    def _add(self, raw: Dict[str, Any]):
+        url = _entry_url(raw)
+        if not url:
+            return
+        self.entries.append(PlaylistEntry(
+            index=len(self.entries), id=str(raw.get('id') or len(self.entries)),
+            title=raw.get('title') or url, url=url,
+            duration=raw.get('duration'), thumbnail=_thumbnail(raw),
+        ))
+
+    def pull(self, upto: int):
+        """Blocking: lists entries until `upto` are known or the playlist ends."""
+        while len(self.entries) < upto and not self.exhausted:
+            if self._paged is not None:
+                start = len(self.entries)
+                batch = self._paged.getslice(start, upto)
+                for raw in batch:
+                    self._add(raw)
+                self.exhausted = len(batch) < upto - start
+            else:
+                raw = next(self._iter, None)
+                if raw is None:
+                    self.exhausted = True
+                else:
+                    self._add(raw)
+        if self.exhausted:
+            self.total = len(self.entries)
+
+class PlaylistManager:
+    """Lists playlists and channels lazily on a small dedicated thread pool."""
+    def __init__(self):
+        self.sessions: "OrderedDict[str, PlaylistSession]" = OrderedDict()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._prefetch_slots: Optional[asyncio.Semaphore] = None
+        self._prefetch_tasks: Set[asyncio.Task] = set()
+        self.counters = {"opened": 0, "reused": 0, "entries_listed": 0, "prefetched": 0, "expired": 0}
+
+    @staticmethod
+    def session_id(url: str) -> str:
+        return hashlib.sha1(route(url).url.encode()).hexdigest()[:16]
+
+    def _run(self, fn, *args):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=settings.PLAYLIST_WORKERS, thread_name_prefix="playlist")
+        return asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    def _expire(self):
+        cutoff = time.time() - settings.PLAYLIST_SESSION_TTL
+        for session_id, session in list(self.sessions.items()):
+            if session.last_access < cutoff or len(self.sessions) > settings.PLAYLIST_MAX_SESSIONS:
+                del self.sessions[session_id]
+                self.counters["expired"] += 1
+
+    @staticmethod
+    def _open_sync(url: str, opts: Dict[str, Any]) -> Dict[str, Any]:
+        import yt_dlp
+        ydl = yt_dlp.YoutubeDL(opts)
+        # process=False keeps `entries` as yt-dlp's lazy generator instead of resolving every item
+        info = ydl.extract_info(url, download=False, process=False)
+        # Channel handles and similar redirect to their listing tab first
+        for _ in range(3):
+            if info.get('_type') not in ('url', 'url_transparent'):
+                break
+            info = ydl.extract_info(info['url'], download=False, process=False)
+        return info
+
+    def get(self, session_id: str) -> Optional[PlaylistSession]:
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.last_access = time.time()
+            self.sessions.move_to_end(session_id)
+        return session
+
+    async def open(self, url: str, opts: Dict[str, Any]) -> PlaylistSession:
+        self._expire()
+        session_id = self.session_id(url)
+        session = self.get(session_id)
+        if session is not None:
+            self.counters["reused"] += 1
+            return session
+        info = await self._run(self._open_sync, url, opts)
+        session = PlaylistSession(session_id, url, info)
+        self.sessions[session_id] = session
+        self.counters["opened"] += 1
+        return session
+
+    async def page(self, session: PlaylistSession, offset: int, limit: int,
+                   prefetch: Optional[Callable[[str], Awaitable[AnalysisResponse]]] = None) -> PlaylistInfo:
+        limit = max(1, min(limit, settings.PLAYLIST_MAX_PAGE_SIZE))
+        async with session.lock:
+            known = len(session.entries)
+            if known < offset + limit and not session.exhausted:
+                await self._run(session.pull, offset + limit)
+                self.counters["entries_listed"] += len(session.entries) - known
+        entries = session.entries[offset:offset + limit]
+        if prefetch:
+            self._schedule_prefetch(session, entries, prefetch)
+        more = not session.exhausted or offset + limit < len(session.entries)
+        return PlaylistInfo(
+            id=session.id, title=session.title, uploader=session.uploader, total=session.total,
+            offset=offset, entries=entries, next_offset=offset + len(entries) if more and entries else None,
+        )
+
+    def _schedule_prefetch(self, session: PlaylistSession, entries: List[PlaylistEntry],
+                           analyze: Callable[[str], Awaitable[AnalysisResponse]]):
+        """Resolves the first few entries of a page in the background so clicking them is a cache hit."""
+        if self._prefetch_slots is None:
+            self._prefetch_slots = asyncio.Semaphore(settings.PLAYLIST_PREFETCH_CONCURRENCY)
+        for entry in entries[:settings.PLAYLIST_PREFETCH]:
+            if entry.index in session.prefetched or route(entry.url).kind == "playlist":
+                continue
+            session.prefetched.add(entry.index)
+            task = asyncio.get_running_loop().create_task(self._prefetch(entry.url, analyze))
+            self._prefetch_tasks.add(task)
+            task.add_done_callback(self._prefetch_tasks.discard)
+
+    async def _prefetch(self, url: str, analyze: Callable[[str], Awaitable[AnalysisResponse]]):
+        async with self._prefetch_slots:
+            try:
+                await analyze(url)
+                self.counters["prefetched"] += 1
+            except EngineSaturated:
+                pass  # best effort: interactive requests get the workers
+            except Exception as e:
+                log.warning("Prefetch failed for %s: %s", url, e)
+
+    def shutdown(self):
+        for task in self._prefetch_tasks:
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "sessions": len(self.sessions),
+            "entries_held": sum(len(s.entries) for s in self.sessions.values()),
+            "prefetch_pending": len(self._prefetch_tasks),
+        }
+
+playlist_manager = PlaylistManager()
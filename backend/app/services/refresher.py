@@ -0,0 +1,208 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set
+from backend.app.core.config import settings
+from backend.app.core.log import get_logger
+from backend.app.models.schemas import MediaMetadata
+from backend.app.services.cache import metadata_cache, url_expiry
+from backend.app.services.executor import EngineSaturated
+from backend.app.services.extractor import extractor
+from backend.app.services.jobs import job_controller
+
+log = get_logger("refresh")
+
+async def extract_and_cache(url: str, cache_key: str) -> Optional[MediaMetadata]:
+    """Shared extraction job: runs once per canonical URL and fills the cache for every waiter."""
+    metadata = await extractor.extract_info(url)
+    if metadata:
+        expires_at = await metadata_cache.set(cache_key, metadata)
+        refresher.track(cache_key, url, metadata, expires_at)
+    return metadata
+
+class AccessStats:
+    """Decaying access count of one cached analysis, plus what is needed to re-resolve it."""
+    def __init__(self, url: str, media_id: str):
+        self.url = url
+        self.media_id = media_id
+        self.score = 0.0
+        self.last_access = time.time()
+        self.expires_at: Optional[float] = None
+        # Lifetime of the cache entry, from when this expiry was first seen
+        self.ttl: Optional[float] = None
+
+    def set_expiry(self, expires_at: Optional[float], now: float):
+        if expires_at != self.expires_at:
+            self.expires_at = expires_at
+            self.ttl = expires_at - now if expires_at is not None else None
+
+    def refresh_due(self, now: float) -> bool:
+        """Whether the entry is within its refresh lead: REFRESH_LEAD, capped at half its lifetime.
+
+        Short-lived entries (TTL at or below REFRESH_LEAD) would be due as soon as they are written,
+        so they are left to expire instead of being re-extracted on every hit.
+        """
+        if self.expires_at is None or self.ttl is None or self.ttl <= settings.REFRESH_LEAD:
+            return False
+        return self.expires_at - now <= min(settings.REFRESH_LEAD, self.ttl * 0.5)
+
+    def touch(self, now: float):
+        # Exponential decay: a hit counts half as much after REFRESH_HALF_LIFE seconds
+        self.score = self.score * math.pow(0.5, (now - self.last_access) / settings.REFRESH_HALF_LIFE) + 1
+        self.last_access = now
+
+    def current_score(self, now: float) -> float:
+        return self.score * math.pow(0.5, (now - self.last_access) / settings.REFRESH_HALF_LIFE)
+
+class BackgroundRefresher:
+    """Re-resolves popular analyses shortly before their signed format URLs expire.
+
+    Cached entries already expire CACHE_EXPIRY_MARGIN before their earliest URL does; refreshing
+    them REFRESH_LEAD before that keeps /analyze hits instant and stream URLs alive.
+    """
+    def __init__(self):
+        # Least recently tracked first; bounded by REFRESH_MAX_TRACKED even while the refresh loop is off
+        self.tracked: "OrderedDict[str, AccessStats]" = OrderedDict()
+        # media ID -> cache key, so /stream can swap an expired URL for a refreshed one
+        self.by_media: Dict[str, str] = {}
+        self.refreshing: Set[str] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.counters = {"refreshed": 0, "refresh_failed": 0, "swr_triggered": 0, "urls_swapped": 0, "stream_reresolves": 0, "forgotten": 0}
+
+    def track(self, key: str, url: str, metadata: MediaMetadata, expires_at: Optional[float]):
+        stats = self.tracked.get(key)
+        if stats is None:
+            stats = self.tracked[key] = AccessStats(url, metadata.id)
+            while len(self.tracked) > settings.REFRESH_MAX_TRACKED:
+                self._drop(next(iter(self.tracked)))
+        else:
+            self.tracked.move_to_end(key)
+            if stats.media_id != metadata.id and self.by_media.get(stats.media_id) == key:
+                del self.by_media[stats.media_id]
+            stats.media_id = metadata.id
+        stats.set_expiry(expires_at, time.time())
+        self.by_media[metadata.id] = key
+
+    def _drop(self, key: str):
+        stats = self.tracked.pop(key)
+        if self.by_media.get(stats.media_id) == key:
+            del self.by_media[stats.media_id]
+        self.counters["forgotten"] += 1
+
+    def on_hit(self, key: str, url: str, metadata: MediaMetadata, expires_at: float):
+        """Counts an /analyze cache hit; a hit on an entry about to expire refreshes it now."""
+        now = time.time()
+        self.track(key, url, metadata, expires_at)
+        stats = self.tracked[key]
+        stats.touch(now)
+        if not settings.REFRESH_ENABLED:
+            return
+        if stats.refresh_due(now) and key not in self.refreshing:
+            self.counters["swr_triggered"] += 1
+            self._launch(key)
+
+    async def fresh_url(self, media_id: Optional[str], format_id: Optional[str], url: str) -> str:
+        """Returns a live URL for the format when `url` has (nearly) expired and a refreshed copy is cached."""
+        expiry = url_expiry(url)
+        if expiry is None or expiry - time.time() > settings.REFRESH_STREAM_MARGIN or not media_id:
+            return url
+        key = self.by_media.get(media_id)
+        metadata = await metadata_cache.get(key) if key else None
+        for f in (metadata.formats if metadata else []):
+            if f.format_id == format_id and f.url and f.url != url:
+                self.counters["urls_swapped"] += 1
+                return f.url
+        return url
+
+    async def reresolve(self, media_id: str, format_id: str) -> Optional[str]:
+        """Re-extracts the media behind `media_id` now and returns the format's new URL."""
+        key = self.by_media.get(media_id)
+        stats = self.tracked.get(key) if key else None
+        if stats is None:
+            return None
+        _, task, _ = job_controller.start_or_join(key, lambda: extract_and_cache(stats.url, key))
+        metadata = await asyncio.shield(task)
+        self.counters["stream_reresolves"] += 1
+        for f in (metadata.formats if metadata else []):
+            if f.format_id == format_id:
+                return f.url
+        return None
+
+    def _launch(self, key: str):
+        self.refreshing.add(key)
+        task = asyncio.get_running_loop().create_task(self._refresh(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, key: str):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(settings.REFRESH_CONCURRENCY)
+        try:
+            async with self._slots:
+                stats = self.tracked.get(key)
+                if stats is None:
+                    return
+                # Coalesces with any /analyze of the same media that is already extracting
+                _, task, _ = job_controller.start_or_join(key, lambda: extract_and_cache(stats.url, key))
+                metadata = await asyncio.shield(task)
+                self.counters["refreshed" if metadata else "refresh_failed"] += 1
+        except EngineSaturated:
+            pass  # retried on a later tick; user requests take priority
+        except Exception as e:
+            self.counters["refresh_failed"] += 1
+            log.warning("Refresh failed for %s: %s", key, e)
+        finally:
+            self.refreshing.discard(key)
+
+    def _forget(self, now: float):
+        stale = [k for k, s in self.tracked.items() if now - s.last_access > settings.REFRESH_FORGET_AFTER]
+        overflow = len(self.tracked) - len(stale) - settings.REFRESH_MAX_TRACKED
+        if overflow > 0:
+            live = sorted((k for k in self.tracked if k not in stale), key=lambda k: self.tracked[k].current_score(now))
+            stale += live[:overflow]
+        for key in stale:
+            self._drop(key)
+
+    def tick(self):
+        """Starts refreshes for popular entries nearing expiry, most accessed first."""
+        now = time.time()
+        self._forget(now)
+        free = settings.REFRESH_CONCURRENCY - len(self.refreshing)
+        if free <= 0:
+            return
+        due = [
+            (stats.current_score(now), key) for key, stats in self.tracked.items()
+            if key not in self.refreshing and stats.refresh_due(now)
+            and stats.current_score(now) >= settings.REFRESH_MIN_SCORE
+        ]
+        for _, key in sorted(due, reverse=True)[:free]:
+            self._launch(key)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.REFRESH_INTERVAL)
+            try:
+                self.tick()
+            except Exception as e:
+                log.exception("Refresh tick failed: %s", e)
+
+    def start(self):
+        if settings.REFRESH_ENABLED and self._loop_task is None:
+            self._loop_task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        tasks = list(self._tasks) + ([self._loop_task] if self._loop_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        due = sum(1 for s in self.tracked.values() if s.refresh_due(now))
+        return {**self.counters, "tracked": len(self.tracked), "due": due, "refreshing": len(self.refreshing)}
+
+refresher = BackgroundRefresher()
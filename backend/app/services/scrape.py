@@ -0,0 +1,131 @@
+import codecs
+import html
+import re
+from typing import Dict, List, Optional, Pattern
+import httpx
+
+_META_TAG = re.compile(r'<meta\b[^>]*>', re.I)
+_ATTR = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+_TITLE = re.compile(r'<title[^>]*>([^<]*)</title\s*>', re.I)
+_HEAD_END = re.compile(r'</head\s*>|<body\b', re.I)
+_ISO_DURATION = re.compile(r'^P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?$')
+
+# Once all of these are known there is nothing left in <head> worth reading
+REQUIRED_TAGS = ('og:video', 'og:image', 'og:title')
+# Alternative property names folded onto the canonical OpenGraph key
+TAG_ALIASES = {
+    'og:video:secure_url': 'og:video', 'og:video:url': 'og:video',
+    'og:image:secure_url': 'og:image', 'og:image:url': 'og:image',
+    'twitter:title': 'og:title', 'twitter:image': 'og:image',
+    'video:duration': 'duration', 'og:video:duration': 'duration', 'duration': 'duration',
+}
+
+def parse_duration(value: str) -> Optional[float]:
+    """Accepts plain seconds or an ISO 8601 duration (PT1M30S)."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    match = _ISO_DURATION.match(value.strip().upper())
+    if not match or not any(match.groups()):
+        return None
+    days, hours, minutes, seconds = (float(g) if g else 0.0 for g in match.groups())
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
+
+class HeadScanner:
+    """Incremental <head> parser that collects OpenGraph meta tags chunk by chunk."""
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.text = ''
+        self.pos = 0
+        self.tags: Dict[str, str] = {}
+        self.title: Optional[str] = None
+        self.done = False
+
+    def feed(self, chunk: bytes) -> bool:
+        """Consumes a chunk; returns True once the rest of the document can be skipped."""
+        self.text += self.decoder.decode(chunk)
+        for match in _META_TAG.finditer(self.text, self.pos):
+            self._add_meta(match.group(0))
+            self.pos = match.end()
+        if self.title is None:
+            title = _TITLE.search(self.text)
+            if title:
+                self.title = html.unescape(title.group(1)).strip() or None
+        head_end = _HEAD_END.search(self.text, self.pos)
+        # Only an incomplete tag can still straddle the next chunk
+        self.pos = max(self.pos, self.text.rfind('<', self.pos))
+        self.done = bool(head_end) or all(t in self.tags for t in REQUIRED_TAGS)
+        return self.done
+
+    def _add_meta(self, tag: str):
+        attrs = {m.group(1).lower(): m.group(2) if m.group(2) is not None else m.group(3)
+                 for m in _ATTR.finditer(tag)}
+        key = (attrs.get('property') or attrs.get('name') or attrs.get('itemprop') or '').lower()
+        content = attrs.get('content')
+        if not key or content is None:
+            return
+        key = TAG_ALIASES.get(key, key)
+        # First occurrence wins, matching how crawlers read OpenGraph
+        self.tags.setdefault(key, html.unescape(content))
+
+    @property
+    def duration(self) -> Optional[float]:
+        value = self.tags.get('duration')
+        return parse_duration(value) if value else None
+
+async def scrape_head(client: httpx.AsyncClient, url: str, headers: Dict[str, str], max_bytes: int) -> Optional[HeadScanner]:
+    """Streams a page only until its <head> metadata is known (or `max_bytes` were read)."""
+    scanner = HeadScanner()
+    read = 0
+    async with client.stream("GET", url, headers=headers) as resp:
+        # Rate limits and server errors are the site failing, not a page without tags
+        if resp.status_code == 429 or resp.status_code >= 500:
+            resp.raise_for_status()
+        if resp.status_code != 200:
+            return None
+        async for chunk in resp.aiter_bytes():
+            read += len(chunk)
+            if scanner.feed(chunk) or read >= max_bytes:
+                break
+    return scanner
+
+class LinkScanner:
+    """Streams text through prioritized patterns, keeping the first match of each.
+
+    A pattern with a `link` group contributes that group instead of the whole match.
+    """
+    def __init__(self, patterns: List[Pattern], overlap: int = 2048):
+        self.patterns = patterns
+        self.overlap = overlap
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.window = ''
+        self.matches: Dict[int, str] = {}
+
+    def feed(self, chunk: bytes) -> bool:
+        """Returns True once the top-priority pattern matched; nothing later can beat it."""
+        self.window += self.decoder.decode(chunk)
+        for i, pattern in enumerate(self.patterns):
+            if i not in self.matches:
+                match = pattern.search(self.window)
+                if match:
+                    self.matches[i] = match.group('link') if 'link' in pattern.groupindex else match.group(0)
+        # Keep a tail so matches spanning chunk boundaries are still found
+        self.window = self.window[-self.overlap:]
+        return 0 in self.matches
+
+    def best(self) -> Optional[str]:
+        return self.matches[min(self.matches)] if self.matches else None
+
+async def scan_links(client: httpx.AsyncClient, url: str, headers: Dict[str, str],
+                     patterns: List[Pattern], max_bytes: int) -> Optional[str]:
+    scanner = LinkScanner(patterns)
+    read = 0
+    async with client.stream("GET", url, headers=headers) as resp:
+        if resp.status_code != 200:
+            return None
+        async for chunk in resp.aiter_bytes():
+            read += len(chunk)
+            if scanner.feed(chunk) or read >= max_bytes:
+                break
+    return scanner.best()
@@ -0,0 +1,387 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from typing import AsyncGenerator, AsyncIterator, Dict, Any, Mapping, Optional, Set, Tuple
+import httpx
+from fastapi.responses import FileResponse, Response
+from backend.app.core.config import settings
+from backend.app.core.log import get_logger
+from backend.app.services.parallel import parallel_downloader, RangeFetchError
+from backend.app.services.streamer import (
+    stream_proxy, body_range, GeneratorResponse, Resolver, ResumeFailed, EXPIRED_STATUSES,
+)
+
+log = get_logger("segments")
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+class NotCacheable(Exception):
+    """The origin cannot serve byte ranges of a fixed-size resource."""
+
+class SegmentEntry:
+    """One cached media file: a sparse data file plus the set of segments present in it."""
+    def __init__(self, key: str, root: str, total: int, segment_size: int, content_type: str,
+                 etag: Optional[str] = None, last_modified: Optional[str] = None, present: Optional[Set[int]] = None):
+        self.key = key
+        self.data_path = os.path.join(root, f"{key}.data")
+        self.meta_path = os.path.join(root, f"{key}.json")
+        self.total = total
+        self.segment_size = segment_size
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.present: Set[int] = present or set()
+        self.last_access = time.time()
+        self.readers = 0
+
+    @property
+    def segment_count(self) -> int:
+        return (self.total + self.segment_size - 1) // self.segment_size
+
+    @property
+    def complete(self) -> bool:
+        return len(self.present) == self.segment_count
+
+    def bounds(self, index: int) -> Tuple[int, int]:
+        """Inclusive byte range covered by a segment."""
+        start = index * self.segment_size
+        return start, min(start + self.segment_size, self.total) - 1
+
+    @property
+    def stored_bytes(self) -> int:
+        return sum(self.bounds(i)[1] - self.bounds(i)[0] + 1 for i in self.present)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "total": self.total, "segment_size": self.segment_size, "content_type": self.content_type,
+            "etag": self.etag, "last_modified": self.last_modified, "present": sorted(self.present),
+        }
+
+class SegmentCache:
+    """Disk cache of proxied media in fixed-size byte-range segments, with an LRU disk budget."""
+    def __init__(self, root: str, segment_size: int, max_bytes: int):
+        self.root = root
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.entries: Dict[str, SegmentEntry] = {}
+        self._loaded = False
+        self._io_lock = asyncio.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+        self.counters = {
+            "segment_hits": 0, "segment_misses": 0, "bytes_from_disk": 0, "bytes_from_upstream": 0,
+            "evictions": 0, "uncacheable": 0, "invalidations": 0,
+        }
+
+    @staticmethod
+    def key_for(media_id: str, format_id: str) -> str:
+        # Callers pass server-resolved IDs only: the key is trusted to name the bytes behind it
+        return hashlib.sha1(f"{media_id}\x00{format_id}".encode()).hexdigest()
+
+    # --- disk I/O (runs in worker threads) -------------------------------------------------
+
+    def _load_index_sync(self):
+        os.makedirs(self.root, exist_ok=True)
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-5]
+            try:
+                with open(os.path.join(self.root, name)) as fh:
+                    meta = json.load(fh)
+                entry = SegmentEntry(key, self.root, meta["total"], meta["segment_size"], meta["content_type"],
+                                     meta.get("etag"), meta.get("last_modified"), set(meta["present"]))
+                entry.last_access = os.path.getmtime(os.path.join(self.root, name))
+                self.entries[key] = entry
+            except (OSError, ValueError, KeyError):
+                continue
+
+    def _write_segment_sync(self, entry: SegmentEntry, index: int, data: bytes):
+        mode = "r+b" if os.path.exists(entry.data_path) else "wb"
+        with open(entry.data_path, mode) as fh:
+            fh.seek(index * entry.segment_size)
+            fh.write(data)
+        entry.present.add(index)
+        with open(entry.meta_path, "w") as fh:
+            json.dump(entry.to_json(), fh)
+
+    def _read_segment_sync(self, entry: SegmentEntry, index: int) -> bytes:
+        start, end = entry.bounds(index)
+        with open(entry.data_path, "rb") as fh:
+            fh.seek(start)
+            return fh.read(end - start + 1)
+
+    def _delete_sync(self, entry: SegmentEntry):
+        for path in (entry.data_path, entry.meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def _ensure_loaded(self):
+        if not self._loaded:
+            self._loaded = True
+            await asyncio.to_thread(self._load_index_sync)
+
+    # --- bookkeeping ------------------------------------------------------------------------
+
+    async def _store(self, entry: SegmentEntry, index: int, data: bytes):
+        async with self._io_lock:
+            if entry.key not in self.entries:
+                return  # invalidated or evicted while we were downloading
+            await asyncio.to_thread(self._write_segment_sync, entry, index, data)
+        await self._evict()
+
+    async def _evict(self):
+        used = sum(e.stored_bytes for e in self.entries.values())
+        for entry in sorted(self.entries.values(), key=lambda e: e.last_access):
+            if used <= self.max_bytes:
+                break
+            if entry.readers:
+                continue
+            used -= entry.stored_bytes
+            await self._drop(entry)
+            self.counters["evictions"] += 1
+
+    async def _drop(self, entry: SegmentEntry):
+        self.entries.pop(entry.key, None)
+        async with self._io_lock:
+            await asyncio.to_thread(self._delete_sync, entry)
+
+    # --- upstream ---------------------------------------------------------------------------
+
+    async def _open_range(self, url: str, entry_etag: Optional[str], start: int, end: int) -> httpx.Response:
+        headers = {"range": f"bytes={start}-{end}"}
+        if entry_etag:
+            headers["if-range"] = entry_etag
+        return await stream_proxy.open(url, headers)
+
+    async def _probe(self, key: str, url: str, first_segment: int) -> Tuple[SegmentEntry, httpx.Response]:
+        """Fetches the first needed segment and learns the resource size from Content-Range."""
+        start = first_segment * self.segment_size
+        upstream = await self._open_range(url, None, start, start + self.segment_size - 1)
+        match = _CONTENT_RANGE.match(upstream.headers.get("content-range", ""))
+        if upstream.status_code != 206 or not match or upstream.headers.get("content-encoding"):
+            await upstream.aclose()
+            raise NotCacheable()
+        entry = SegmentEntry(
+            key, self.root, int(match.group(3)), self.segment_size,
+            upstream.headers.get("content-type", "video/mp4"),
+            upstream.headers.get("etag"), upstream.headers.get("last-modified"),
+        )
+        self.entries[key] = entry
+        return entry, upstream
+
+    async def _keep_probe(self, entry: SegmentEntry, probe: httpx.Response):
+        """Stores a probed segment the request turned out not to need (suffix ranges probe segment 0)."""
+        try:
+            index = body_range(probe)[0] // entry.segment_size
+            seg_start, seg_end = entry.bounds(index)
+            data = await probe.aread()
+            if len(data) == seg_end - seg_start + 1:
+                await self._store(entry, index, data)
+        except httpx.HTTPError as e:
+            log.debug("Probe segment for %s not kept: %s", entry.key, e)
+        finally:
+            await probe.aclose()
+
+    async def _consume_run(self, entry: SegmentEntry, chunks: AsyncIterator[bytes], run_start: int,
+                           start: int, end: int, run_last: int) -> AsyncGenerator[bytes, None]:
+        """Streams an upstream range response: yields the client's slice, stores whole segments.
+
+        Raises ResumeFailed when the upstream ends before `run_last`: the response already
+        promised those bytes, so it is aborted rather than continued from the wrong offset.
+        """
+        pos = entry.bounds(run_start)[0]
+        index, buffer = run_start, bytearray()
+        async for chunk in chunks:
+            chunk_end = pos + len(chunk) - 1
+            lo, hi = max(start, pos), min(end, chunk_end)
+            if lo <= hi:
+                yield chunk[lo - pos:hi - pos + 1]
+            self.counters["bytes_from_upstream"] += len(chunk)
+            buffer += chunk
+            pos = chunk_end + 1
+            # Persist every segment that is now complete
+            while index < entry.segment_count:
+                seg_start, seg_end = entry.bounds(index)
+                seg_len = seg_end - seg_start + 1
+                if len(buffer) < seg_len:
+                    break
+                await self._store(entry, index, bytes(buffer[:seg_len]))
+                del buffer[:seg_len]
+                index += 1
+            if pos > end and not buffer:
+                break
+        if pos <= min(end, run_last):
+            raise ResumeFailed(f"Upstream ended at byte {pos} of a run ending at {run_last}")
+
+    async def _invalidate(self, entry: SegmentEntry):
+        # If-Range failed: the origin now serves different bytes under this key
+        self.counters["invalidations"] += 1
+        await self._drop(entry)
+        log.info("Origin content changed for %s, entry dropped", entry.key)
+
+    async def _body(self, entry: SegmentEntry, url: str, start: int, end: int,
+                    probe: Optional[httpx.Response], parallel: bool = False,
+                    resolve: Optional[Resolver] = None) -> AsyncGenerator[bytes, None]:
+        entry.readers += 1
+        upstream = probe
+        try:
+            index, last = start // entry.segment_size, end // entry.segment_size
+            while index <= last:
+                if upstream is None and index in entry.present:
+                    data = await asyncio.to_thread(self._read_segment_sync, entry, index)
+                    seg_start, _ = entry.bounds(index)
+                    piece = data[max(start, seg_start) - seg_start:end - seg_start + 1]
+                    self.counters["segment_hits"] += 1
+                    self.counters["bytes_from_disk"] += len(piece)
+                    yield piece
+                    index += 1
+                    continue
+
+                run_end = index
+                while run_end + 1 <= last and run_end + 1 not in entry.present:
+                    run_end += 1
+                validator = entry.etag or entry.last_modified
+                if parallel and upstream is None and run_end > index:
+                    # Downloads fetch the missing run as concurrent per-segment ranges
+                    self.counters["segment_misses"] += run_end - index + 1
+                    parts = parallel_downloader.iter_parts(url, [entry.bounds(i) for i in range(index, run_end + 1)], validator)
+                    try:
+                        async for data in parts:
+                            self.counters["bytes_from_upstream"] += len(data)
+                            seg_start, seg_end = entry.bounds(index)
+                            if len(data) != seg_end - seg_start + 1:
+                                raise ResumeFailed(f"Segment {index} came back with {len(data)} bytes")
+                            await self._store(entry, index, data)
+                            yield data[max(start, seg_start) - seg_start:end - seg_start + 1]
+                            index += 1
+                    except RangeFetchError:
+                        await self._invalidate(entry)
+                        return
+                    finally:
+                        await parts.aclose()
+                    continue
+
+                # Fetch the whole run of missing segments with one upstream range request
+                if upstream is None:
+                    run_bounds = entry.bounds(index)[0], entry.bounds(run_end)[1]
+                    upstream = await self._open_range(url, validator, *run_bounds)
+                    if upstream.status_code in EXPIRED_STATUSES and resolve is not None:
+                        # Signed URL expired while the player was paused: continue on a fresh one
+                        await upstream.aclose()
+                        url = await resolve() or url
+                        stream_proxy.counters["reresolved"] += 1
+                        upstream = await self._open_range(url, None, *run_bounds)
+                    if upstream.status_code in EXPIRED_STATUSES:
+                        raise ResumeFailed(f"Upstream URL expired (HTTP {upstream.status_code})")
+                    if upstream.status_code != 206:
+                        await self._invalidate(entry)
+                        return
+                else:
+                    run_end = index  # the probe covers exactly one segment
+                self.counters["segment_misses"] += run_end - index + 1
+                run_first, run_last, _ = body_range(upstream)
+                chunks = stream_proxy.resume_chunks(url, upstream, run_first, run_last, resolve)
+                try:
+                    async for piece in self._consume_run(entry, chunks, index, start, end, entry.bounds(run_end)[1]):
+                        yield piece
+                finally:
+                    # Closes whichever upstream response the resume logic ended up on
+                    await chunks.aclose()
+                    await upstream.aclose()
+                    upstream = None
+                index = run_end + 1
+        finally:
+            entry.readers -= 1
+            if upstream is not None:
+                await upstream.aclose()
+
+    # --- public API -------------------------------------------------------------------------
+
+    @staticmethod
+    def _parse_range(header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+        match = _RANGE.match(header or "")
+        if not match or match.groups() == ("", ""):
+            return None
+        first, last = match.groups()
+        if first == "":
+            return max(0, total - int(last)), total - 1
+        return int(first), min(int(last), total - 1) if last else total - 1
+
+    async def serve(self, media_id: str, format_id: str, url: str, request_headers: Mapping[str, str],
+                    filename: Optional[str] = None, parallel: bool = False,
+                    resolve: Optional[Resolver] = None) -> Response:
+        """Serves a GET from cached segments, fetching missing ones (concurrently when `parallel`)."""
+        await self._ensure_loaded()
+        key = self.key_for(media_id, format_id)
+        range_header = request_headers.get("range")
+        if range_header and not _RANGE.match(range_header):
+            # Multi-range and other exotic requests go straight to the origin
+            return await stream_proxy.proxy_stream(url, request_headers, filename, resolve=resolve)
+
+        entry = self.entries.get(key)
+        probe = None
+        if entry is None:
+            first = 0
+            match = _RANGE.match(range_header or "")
+            if match and match.group(1):
+                first = int(match.group(1)) // self.segment_size
+            try:
+                entry, probe = await self._probe(key, url, first)
+            except NotCacheable:
+                self.counters["uncacheable"] += 1
+                return await stream_proxy.proxy_stream(url, request_headers, filename, resolve=resolve)
+        entry.last_access = time.time()
+
+        headers = {"Access-Control-Allow-Origin": "*", "Accept-Ranges": "bytes"}
+        if entry.etag: headers["ETag"] = entry.etag
+        if entry.last_modified: headers["Last-Modified"] = entry.last_modified
+
+        byte_range = self._parse_range(range_header, entry.total)
+        if byte_range and not byte_range[0] <= byte_range[1] < entry.total:
+            if probe is not None: await probe.aclose()
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{entry.total}"})
+        start, end = byte_range or (0, entry.total - 1)
+
+        if entry.complete and probe is None:
+            # Fully cached: let the server send the file itself (pathsend / zero-copy when available)
+            self.counters["segment_hits"] += end // entry.segment_size - start // entry.segment_size + 1
+            self.counters["bytes_from_disk"] += end - start + 1
+            return FileResponse(entry.data_path, headers=headers, media_type=entry.content_type,
+                                filename=filename, content_disposition_type="attachment")
+        if probe is not None and start // entry.segment_size != int(_CONTENT_RANGE.match(
+                probe.headers["content-range"]).group(1)) // entry.segment_size:
+            # Not the segment this request starts in, but worth keeping: finish it in the background
+            task = asyncio.get_running_loop().create_task(self._keep_probe(entry, probe))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            probe = None
+
+        headers["Content-Type"] = entry.content_type
+        headers["Content-Length"] = str(end - start + 1)
+        if byte_range:
+            headers["Content-Range"] = f"bytes {start}-{end}/{entry.total}"
+        if filename:
+            headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        body = self._body(entry, url, start, end, probe, parallel, resolve)
+        return GeneratorResponse(body, status_code=206 if byte_range else 200, headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        served = self.counters["bytes_from_disk"] + self.counters["bytes_from_upstream"]
+        return {
+            **self.counters,
+            "entries": len(self.entries),
+            "stored_bytes": sum(e.stored_bytes for e in self.entries.values()),
+            "max_bytes": self.max_bytes,
+            "segment_size": self.segment_size,
+            "byte_hit_ratio": round(self.counters["bytes_from_disk"] / served, 4) if served else 0.0,
+        }
+
+segment_cache = SegmentCache(
+    os.path.join(settings.DOWNLOAD_PATH, "segments"), settings.SEGMENT_SIZE, settings.SEGMENT_CACHE_MAX_BYTES
+)
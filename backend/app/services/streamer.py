@@ -1,45 +1,216 @@
+import asyncio
+import re
+import time
 import httpx
-from fastapi.responses import StreamingResponse
-from typing import AsyncGenerator
+from fastapi.responses import Response, StreamingResponse
+from typing import AsyncGenerator, Awaitable, Callable, Dict, Any, Mapping, Optional, Tuple
+from backend.app.core.config import settings
+from backend.app.core.log import get_logger
+from backend.app.core.metrics import STREAM_BYTES, STREAM_THROUGHPUT, STREAM_TTFB_SECONDS
+from backend.app.services.http_pool import http_pool
+
+log = get_logger("stream")
+
+# Conditional/range headers forwarded from the player to the origin
+FORWARD_REQUEST_HEADERS = ('range', 'if-range', 'if-none-match', 'if-modified-since')
+# Origin headers the player needs for seeking and revalidation
+FORWARD_RESPONSE_HEADERS = (
+    'content-type', 'content-length', 'content-range', 'content-encoding',
+    'accept-ranges', 'etag', 'last-modified',
+)
+# Statuses a signed URL answers with once its signature has expired
+EXPIRED_STATUSES = (401, 403, 404, 410)
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+# Streams shorter than this say more about latency than throughput
+THROUGHPUT_MIN_BYTES = 256 * 1024
+
+# Returns a fresh URL for the same media format, or None when it can't be re-resolved
+Resolver = Callable[[], Awaitable[Optional[str]]]
+
+class ResumeFailed(Exception):
+    """The upstream dropped mid-transfer and could not be resumed at the right offset."""
+
+def body_range(upstream: httpx.Response) -> Tuple[int, Optional[int], Optional[int]]:
+    """(first byte, last byte, total size) of the resource carried by a 200/206 body, where known."""
+    match = _CONTENT_RANGE.match(upstream.headers.get("content-range", ""))
+    if match:
+        total = None if match.group(3) == "*" else int(match.group(3))
+        return int(match.group(1)), int(match.group(2)), total
+    length = upstream.headers.get("content-length")
+    if length and length.isdigit():
+        return 0, int(length) - 1, int(length)
+    return 0, None, None
+
+async def _metered(body: AsyncGenerator[bytes, None], path: str, started: float) -> AsyncGenerator[bytes, None]:
+    """Passes `body` through, recording time to first byte, bytes sent and throughput."""
+    sent, first = 0, None
+    try:
+        async for chunk in body:
+            if first is None:
+                first = time.perf_counter()
+                STREAM_TTFB_SECONDS.observe(first - started, path=path)
+            sent += len(chunk)
+            yield chunk
+    finally:
+        STREAM_BYTES.inc(sent, path=path)
+        if sent >= THROUGHPUT_MIN_BYTES:
+            STREAM_THROUGHPUT.observe(sent / max(time.perf_counter() - first, 1e-3), path=path)
+
+class UpstreamStreamingResponse(StreamingResponse):
+    """Streams an already-open upstream response and always releases it, even on client disconnect."""
+    def __init__(self, upstream: httpx.Response, content, **kwargs):
+        super().__init__(content, **kwargs)
+        self.upstream = upstream
+        self.meter: Optional[Tuple[str, float]] = None
+
+    async def __call__(self, scope, receive, send):
+        if self.meter:
+            self.body_iterator = _metered(self.body_iterator, *self.meter)
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.meter:
+                await self.body_iterator.aclose()
+            # Closing here (not via GC of the generator) frees the upstream connection promptly
+            await self.upstream.aclose()
 
 class StreamProxy:
-    async def proxy_stream(self, url: str, range_header: str = None, filename: str = None) -> StreamingResponse:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        }
-        if range_header: headers['Range'] = range_header
-        
-        client = httpx.AsyncClient(follow_redirects=True)
-        
-        async def stream_generator() -> AsyncGenerator[bytes, None]:
-            try:
-                async with client.stream("GET", url, headers=headers, timeout=30) as response:
-                    async for chunk in response.aiter_bytes(chunk_size=1024 * 128):
-                        yield chunk
-            except Exception as e:
-                print(f"Streaming error: {e}")
-            finally:
-                await client.aclose()
-
-        async with client.stream("GET", url, headers=headers) as initial_res:
-            res_headers = {
-                "Content-Type": initial_res.headers.get("Content-Type", "video/mp4"),
-                "Accept-Ranges": "bytes",
-                "Content-Length": initial_res.headers.get("Content-Length", ""),
-                "Content-Range": initial_res.headers.get("Content-Range", ""),
-                "Access-Control-Allow-Origin": "*",
-            }
-            
-            if filename:
-                res_headers["Content-Disposition"] = f'attachment; filename="{filename}"'
-
-            # Remove empty values
-            res_headers = {k: v for k, v in res_headers.items() if v}
-
-            return StreamingResponse(
-                stream_generator(),
-                status_code=initial_res.status_code,
-                headers=res_headers
+    def __init__(self):
+        self.ua = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+        self.timeout = httpx.Timeout(30, connect=10)
+        self.counters = {"streams": 0, "resumes": 0, "resume_failures": 0, "reresolved": 0}
+
+    def _upstream_headers(self, request_headers: Mapping[str, str]) -> Dict[str, str]:
+        headers = {'User-Agent': self.ua}
+        for name in FORWARD_REQUEST_HEADERS:
+            value = request_headers.get(name)
+            if value: headers[name] = value
+        return headers
+
+    def _response_headers(self, upstream: httpx.Response, filename: Optional[str]) -> Dict[str, str]:
+        res_headers = {name: upstream.headers.get(name, "") for name in FORWARD_RESPONSE_HEADERS}
+        res_headers["content-type"] = res_headers["content-type"] or "video/mp4"
+        res_headers["accept-ranges"] = res_headers["accept-ranges"] or "bytes"
+        res_headers["access-control-allow-origin"] = "*"
+
+        if filename:
+            res_headers["content-disposition"] = f'attachment; filename="{filename}"'
+
+        # Remove empty values
+        return {k: v for k, v in res_headers.items() if v}
+
+    async def open(self, url: str, request_headers: Mapping[str, str], method: str = "GET",
+                   multiplex: bool = True) -> httpx.Response:
+        """Opens the upstream once; the body is left unread for the caller to stream."""
+        client = http_pool.client_for(url, multiplex=multiplex)
+        headers = self._upstream_headers(request_headers)
+        upstream = await client.send(
+            client.build_request(method, url, headers=headers, timeout=self.timeout), stream=True
+        )
+        if method == "HEAD" and upstream.status_code in (403, 405, 501):
+            # Some CDNs refuse HEAD; a GET whose body we never read answers the same question
+            await upstream.aclose()
+            upstream = await client.send(
+                client.build_request("GET", url, headers=headers, timeout=self.timeout), stream=True
             )
+        return upstream
+
+    async def _reopen(self, url: str, pos: int, end: Optional[int], validator: Optional[str],
+                      total: Optional[int], resolve: Optional[Resolver]) -> Tuple[httpx.Response, str, Optional[str]]:
+        """Reissues the request from byte `pos`, re-resolving the URL if its signature expired."""
+        headers = {"range": f"bytes={pos}-{'' if end is None else end}"}
+        if validator:
+            headers["if-range"] = validator
+        upstream = await self.open(url, headers)
+        if upstream.status_code in EXPIRED_STATUSES and resolve is not None:
+            await upstream.aclose()
+            fresh = await resolve()
+            if not fresh:
+                raise ResumeFailed(f"URL expired (HTTP {upstream.status_code}) and could not be re-resolved")
+            self.counters["reresolved"] += 1
+            url = fresh
+            # A new signed URL may be served by another node with its own validators
+            upstream = await self.open(url, {"range": headers["range"]})
+            validator = upstream.headers.get("etag") or upstream.headers.get("last-modified")
+        first, _, resumed_total = body_range(upstream)
+        if upstream.status_code != 206 or first != pos or (total and resumed_total and resumed_total != total):
+            await upstream.aclose()
+            raise ResumeFailed(f"Resume at byte {pos} got HTTP {upstream.status_code} {upstream.headers.get('content-range')}")
+        return upstream, url, validator
+
+    async def resume_chunks(self, url: str, upstream: httpx.Response, start: int, end: Optional[int],
+                            resolve: Optional[Resolver] = None) -> AsyncGenerator[bytes, None]:
+        """Yields the raw body of `upstream` (bytes `start`..`end` of the resource).
+
+        When the connection drops mid-transfer, the rest is requested again with a Range from
+        the last byte delivered (If-Range on the original validator), with bounded retries and
+        backoff. Takes ownership of `upstream` and closes whichever response is current.
+        """
+        validator = upstream.headers.get("etag") or upstream.headers.get("last-modified")
+        total = body_range(upstream)[2]
+        # Offsets of an encoded body don't map onto the resource's byte ranges
+        resumable = not upstream.headers.get("content-encoding")
+        pos, attempt = start, 0
+        try:
+            while True:
+                try:
+                    async for chunk in upstream.aiter_raw(chunk_size=1024 * 128):
+                        pos += len(chunk)
+                        attempt = 0
+                        yield chunk
+                    return
+                except httpx.TransportError as e:
+                    if end is not None and pos > end:
+                        return
+                    if not resumable or attempt >= settings.STREAM_RESUME_RETRIES:
+                        self.counters["resume_failures"] += 1
+                        raise
+                    attempt += 1
+                    self.counters["resumes"] += 1
+                    log.warning("Upstream dropped at byte %d (%r); resuming, attempt %d", pos, e, attempt)
+                    await upstream.aclose()
+                    await asyncio.sleep(settings.STREAM_RESUME_BACKOFF * 2 ** (attempt - 1))
+                    try:
+                        upstream, url, validator = await self._reopen(url, pos, end, validator, total, resolve)
+                    except (ResumeFailed, httpx.HTTPError):
+                        self.counters["resume_failures"] += 1
+                        raise
+        finally:
+            await upstream.aclose()
+
+    async def proxy_stream(self, url: str, request_headers: Mapping[str, str], filename: str = None,
+                           method: str = "GET", resolve: Optional[Resolver] = None) -> Response:
+        upstream = await self.open(url, request_headers, method)
+        res_headers = self._response_headers(upstream, filename)
+
+        if method == "HEAD":
+            await upstream.aclose()
+            return Response(status_code=upstream.status_code, headers=res_headers)
+
+        self.counters["streams"] += 1
+        if upstream.status_code in (200, 206):
+            # Raw bytes: Content-Length/Content-Encoding are forwarded verbatim
+            start, end, _ = body_range(upstream)
+            body = self.resume_chunks(url, upstream, start, end, resolve)
+        else:
+            body = upstream.aiter_raw()
+        return UpstreamStreamingResponse(upstream, body, status_code=upstream.status_code, headers=res_headers)
+
+    @staticmethod
+    def metered(response: Response, path: str, started: float) -> Response:
+        """Records TTFB/bytes/throughput of a streamed /stream response under `path`, from `started`."""
+        if isinstance(response, UpstreamStreamingResponse):
+            response.meter = (path, started)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counters)
+
+class GeneratorResponse(UpstreamStreamingResponse):
+    """Streams an async generator and closes it (and whatever upstream it holds) on disconnect."""
+    def __init__(self, body: AsyncGenerator[bytes, None], **kwargs):
+        super().__init__(body, body, **kwargs)
 
 stream_proxy = StreamProxy()
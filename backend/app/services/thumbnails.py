@@ -0,0 +1,343 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Any, Optional, Tuple
+from urllib.parse import quote
+from backend.app.core.config import settings
+from backend.app.core.log import get_logger
+from backend.app.models.schemas import MediaMetadata, PlaylistInfo
+from backend.app.services.http_pool import http_pool
+
+log = get_logger("thumbs")
+
+# Output encodings, best compression first; JPEG is what every browser accepts
+FORMATS = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+# Magic numbers of the source images served as-is when Pillow is unavailable
+_SIGNATURES = ((b"\xff\xd8\xff", "image/jpeg"), (b"\x89PNG", "image/png"), (b"GIF8", "image/gif"),
+               (b"RIFF", "image/webp"))
+# Widths used in API responses: the result card and list rows (2x for high-DPI screens)
+CARD_WIDTH = 640
+ROW_WIDTH = 160
+
+try:
+    from PIL import Image, ImageOps, features as _pil_features
+    Image.MAX_IMAGE_PIXELS = 50_000_000  # refuse decompression bombs early
+except ImportError:
+    Image = None
+
+class ThumbnailError(Exception):
+    """The source image could not be fetched or decoded."""
+
+def _sniff(data: bytes) -> str:
+    for magic, media_type in _SIGNATURES:
+        if data.startswith(magic):
+            return media_type
+    return "application/octet-stream"
+
+def supported_formats() -> Tuple[str, ...]:
+    if Image is None:
+        return ()
+    return tuple(f for f in FORMATS if f == "jpeg" or (_pil_features.check(f) and (f != "avif" or settings.THUMB_AVIF)))
+
+def negotiate(accept: str, requested: Optional[str]) -> Optional[str]:
+    """Explicit ?fmt= wins; otherwise the smallest encoding the browser's Accept header allows."""
+    available = supported_formats()
+    if requested:
+        return requested if requested in available else None
+    for fmt in available:
+        if fmt == "jpeg" or FORMATS[fmt] in accept:
+            return fmt
+    return None
+
+def snap_width(width: int) -> int:
+    """Rounds a requested width up to a configured size, so arbitrary widths can't flood the cache."""
+    for allowed in sorted(settings.THUMB_WIDTHS):
+        if width <= allowed:
+            return allowed
+    return max(settings.THUMB_WIDTHS)
+
+def _render_sync(source_path: str, width: int, fmt: str, out_path: str):
+    with Image.open(source_path) as img:
+        if img.format == "JPEG":
+            # Lets libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full size
+            img.draft("RGB", (width, width * 4))
+        img = ImageOps.exif_transpose(img)
+        if img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+        if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA", "L"):
+            img = img.convert("RGBA" if "A" in img.getbands() or img.mode == "P" else "RGB")
+        buf = io.BytesIO()
+        if fmt == "jpeg":
+            img.save(buf, "JPEG", quality=settings.THUMB_QUALITY, optimize=True, progressive=True)
+        elif fmt == "webp":
+            img.save(buf, "WEBP", quality=settings.THUMB_QUALITY, method=4)
+        else:
+            img.save(buf, "AVIF", quality=settings.THUMB_QUALITY - 20, speed=8)
+    tmp = out_path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(buf.getvalue())
+    os.replace(tmp, out_path)
+
+class ThumbnailCache:
+    """Resized thumbnails in a content-addressed disk cache with an LRU byte budget.
+
+    Sources are stored under the SHA-256 of their bytes, so the same image reached through
+    different (or expiring, signed) URLs is fetched once per URL but stored and resized once.
+    """
+    def __init__(self, root: str, max_bytes: int, max_refs: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_refs = max_refs
+        # file name -> size, least recently used first
+        self.files: "OrderedDict[str, int]" = OrderedDict()
+        self.used = 0
+        # sha1(url) -> source digest, least recently used first; each is mirrored by a .ref file
+        self.refs: "OrderedDict[str, str]" = OrderedDict()
+        self._loaded = False
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.counters = {"hits": 0, "renders": 0, "fetches": 0, "fetch_failed": 0, "passthrough": 0,
+                         "evictions": 0, "source_bytes": 0, "output_bytes": 0}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _run(self, fn, *args):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=settings.THUMB_WORKERS, thread_name_prefix="thumb")
+        return asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    def _load_sync(self):
+        os.makedirs(self.root, exist_ok=True)
+        entries, refs = [], []
+        for name in os.listdir(self.root):
+            path = self._path(name)
+            if name.endswith(".ref"):
+                refs.append((os.stat(path).st_mtime, name[:-4]))
+            elif not name.endswith(".tmp"):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self.files[name] = size
+            self.used += size
+        refs.sort()
+        cut = max(0, len(refs) - self.max_refs)
+        for i, (_, ref) in enumerate(refs):
+            digest = None
+            if i >= cut:
+                with open(self._path(f"{ref}.ref")) as fh:
+                    digest = fh.read().strip()
+            # Beyond the cap, or naming a source that is gone
+            if digest is None or f"{digest}.src" not in self.files:
+                self._unlink(f"{ref}.ref")
+            else:
+                self.refs[ref] = digest
+
+    async def _ensure_loaded(self):
+        if not self._loaded:
+            self._loaded = True
+            await self._run(self._load_sync)
+
+    def _touch(self, name: str) -> bool:
+        if name in self.files:
+            self.files.move_to_end(name)
+            return True
+        return False
+
+    def _add(self, name: str, size: int):
+        self.files[name] = size
+        self.used += size
+        while self.used > self.max_bytes and len(self.files) > 1:
+            victim, victim_size = self.files.popitem(last=False)
+            self.used -= victim_size
+            self.counters["evictions"] += 1
+            self._unlink(victim)
+
+    def _unlink(self, name: str):
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+    def _add_ref(self, ref: str, digest: str):
+        self.refs[ref] = digest
+        self.refs.move_to_end(ref)
+        while len(self.refs) > self.max_refs:
+            self._drop_ref(next(iter(self.refs)))
+
+    def _drop_ref(self, ref: str):
+        del self.refs[ref]
+        self._unlink(f"{ref}.ref")
+
+    async def _once(self, key: str, factory: Callable[[], Awaitable[Any]]):
+        """Runs `factory` once per key at a time; concurrent callers share the result."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.get_running_loop().create_task(factory())
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def _store_source_sync(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(f"{digest}.src")
+        if not os.path.exists(path):
+            with open(path + ".tmp", "wb") as fh:
+                fh.write(data)
+            os.replace(path + ".tmp", path)
+        return digest
+
+    async def _store_source(self, data: bytes) -> str:
+        digest = await self._run(self._store_source_sync, data)
+        if not self._touch(f"{digest}.src"):
+            self._add(f"{digest}.src", len(data))
+        return digest
+
+    async def _fetch(self, url: str) -> bytes:
+        client = http_pool.client_for(url)
+        self.counters["fetches"] += 1
+        try:
+            async with client.stream("GET", url, headers={"User-Agent": "Mozilla/5.0", "Accept": "image/*"},
+                                     timeout=settings.THUMB_FETCH_TIMEOUT) as response:
+                if response.status_code != 200:
+                    raise ThumbnailError(f"Upstream answered HTTP {response.status_code}")
+                data = bytearray()
+                async for chunk in response.aiter_bytes():
+                    data += chunk
+                    if len(data) > settings.THUMB_MAX_SOURCE_BYTES:
+                        raise ThumbnailError("Source image is too large")
+                return bytes(data)
+        except ThumbnailError:
+            self.counters["fetch_failed"] += 1
+            raise
+        except Exception as e:
+            self.counters["fetch_failed"] += 1
+            log.info("Thumbnail fetch failed for %s: %r", url, e)
+            raise ThumbnailError(f"Fetching the source image failed: {e}")
+
+    async def source_for_url(self, url: str) -> str:
+        """Digest of the image at `url`, fetching it through the pooled client on first use."""
+        await self._ensure_loaded()
+        ref = hashlib.sha1(url.encode()).hexdigest()
+        digest = self.refs.get(ref)
+        if digest:
+            if self._touch(f"{digest}.src"):
+                self.refs.move_to_end(ref)
+                return digest
+            self._drop_ref(ref)  # its source was evicted
+
+        async def fetch() -> str:
+            data = await self._fetch(url)
+            digest = await self._store_source(data)
+            await self._run(self._write_ref_sync, ref, digest)
+            self._add_ref(ref, digest)
+            return digest
+        return await self._once(f"ref:{ref}", fetch)
+
+    def _write_ref_sync(self, ref: str, digest: str):
+        with open(self._path(f"{ref}.ref"), "w") as fh:
+            fh.write(digest)
+
+    async def source_for_data_uri(self, uri: str) -> str:
+        """Stores an inline base64 image and returns its digest."""
+        try:
+            data = base64.b64decode(uri.split(",", 1)[1], validate=False)
+        except (IndexError, binascii.Error):
+            raise ThumbnailError("Malformed data URI")
+        await self._ensure_loaded()
+        return await self._store_source(data)
+
+    def has_source(self, digest: str) -> bool:
+        return f"{digest}.src" in self.files
+
+    async def render(self, digest: str, width: int, fmt: Optional[str]) -> Tuple[str, str, str]:
+        """(path, strong ETag, media type) of `digest` resized to `width` in `fmt`.
+
+        With no usable encoder (Pillow missing), the source itself is returned.
+        """
+        await self._ensure_loaded()
+        source = f"{digest}.src"
+        if not self._touch(source):
+            raise ThumbnailError("Unknown thumbnail")
+        if fmt is None:
+            self.counters["passthrough"] += 1
+            data_head = await self._run(self._read_head_sync, self._path(source))
+            return self._path(source), f'"{digest[:32]}"', _sniff(data_head)
+
+        name = f"{digest}-{width}.{fmt}"
+        etag = f'"{digest[:32]}-{width}-{fmt}"'
+        if self._touch(name):
+            self.counters["hits"] += 1
+            return self._path(name), etag, FORMATS[fmt]
+
+        async def render() -> None:
+            try:
+                await self._run(_render_sync, self._path(source), width, fmt, self._path(name))
+            except Exception as e:
+                raise ThumbnailError(f"Could not decode the source image: {e}")
+            size = os.path.getsize(self._path(name))
+            self.counters["renders"] += 1
+            self.counters["source_bytes"] += self.files.get(source, 0)
+            self.counters["output_bytes"] += size
+            self._add(name, size)
+        await self._once(name, render)
+        return self._path(name), etag, FORMATS[fmt]
+
+    @staticmethod
+    def _read_head_sync(path: str) -> bytes:
+        with open(path, "rb") as fh:
+            return fh.read(16)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "files": len(self.files),
+            "refs": len(self.refs),
+            "stored_bytes": self.used,
+            "max_bytes": self.max_bytes,
+            "formats": list(supported_formats()),
+            "size_ratio": round(self.counters["output_bytes"] / self.counters["source_bytes"], 4)
+            if self.counters["source_bytes"] else None,
+        }
+
+thumbnail_cache = ThumbnailCache(
+    os.path.join(settings.DOWNLOAD_PATH, "thumbs"), settings.THUMB_CACHE_MAX_BYTES, settings.THUMB_MAX_REFS
+)
+
+async def thumb_url(src: Optional[str], width: int) -> Optional[str]:
+    """URL of the cached, resized copy of `src` that API responses hand to the browser."""
+    if not src or not settings.THUMB_ENABLED:
+        return src
+    if src.startswith("data:image"):
+        try:
+            digest = await thumbnail_cache.source_for_data_uri(src)
+        except ThumbnailError:
+            return None
+        return f"{settings.API_V1_STR}/thumb?id={digest}&w={width}"
+    if src.startswith(("http://", "https://")):
+        return f"{settings.API_V1_STR}/thumb?src={quote(src, safe='')}&w={width}"
+    return src
+
+async def playlist_with_thumbnails(page: PlaylistInfo) -> PlaylistInfo:
+    entries = [e.model_copy(update={"thumbnail": await thumb_url(e.thumbnail, ROW_WIDTH)}) for e in page.entries]
+    return page.model_copy(update={"entries": entries})
+
+async def with_thumbnails(metadata: MediaMetadata) -> MediaMetadata:
+    """Copy of `metadata` whose thumbnails point at /thumb instead of the origin."""
+    if not settings.THUMB_ENABLED:
+        return metadata
+    update: Dict[str, Any] = {"thumbnail": await thumb_url(metadata.thumbnail, CARD_WIDTH)}
+    if metadata.playlist:
+        update["playlist"] = await playlist_with_thumbnails(metadata.playlist)
+    return metadata.model_copy(update=update)
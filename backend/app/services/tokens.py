@@ -0,0 +1,111 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+from typing import Dict, Any, Tuple
+from backend.app.core.config import settings
+from backend.app.core.log import get_logger
+from backend.app.models.schemas import MediaMetadata, MediaFormat, LeanMetadata, LeanFormat, LeanAnalysisResponse, AnalysisResponse
+from backend.app.services.cache import metadata_cache, metadata_ttl
+from backend.app.services.jobs import job_controller
+from backend.app.services.refresher import refresher, extract_and_cache
+
+log = get_logger("tokens")
+
+class TokenError(Exception):
+    """A format token that cannot be resolved; `status` is the HTTP status to answer with."""
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def media_alias(cache_key: str) -> str:
+    """Short, stable handle for a cache key (96 bits of its SHA-256)."""
+    return _b64(hashlib.sha256(cache_key.encode()).digest()[:12])
+
+def make_token(alias: str, format_id: str) -> str:
+    return f"{alias}.{_b64(format_id.encode())}"
+
+def parse_token(token: str) -> Tuple[str, str]:
+    alias, _, encoded = token.partition(".")
+    try:
+        format_id = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        format_id = ""
+    if len(alias) != 16 or not format_id:
+        raise TokenError("Malformed format token", 400)
+    return alias, format_id
+
+class FormatTokens:
+    """Lean analyses: format URLs are swapped for tokens that /stream resolves against the metadata cache.
+
+    A token names the cache entry (through an alias record that outlives it by TOKEN_TTL) and the
+    format, so a stream always starts from the newest cached or refreshed URL, never a stale one.
+    """
+    def __init__(self):
+        # reextracted_uncacheable: re-extractions whose result was again too close to expiry to cache
+        self.counters = {"issued": 0, "resolved": 0, "reextracted": 0, "reextracted_uncacheable": 0,
+                         "recent_hits": 0, "expired": 0, "invalid": 0}
+
+    async def lean(self, response: AnalysisResponse, cache_key: str) -> LeanAnalysisResponse:
+        data = response.data
+        if data is None:
+            return LeanAnalysisResponse(success=response.success, error=response.error)
+        alias = media_alias(cache_key)
+        if data.formats and not await metadata_cache.has_local_alias(alias):
+            await metadata_cache.set_alias(alias, cache_key, settings.TOKEN_TTL)
+        self.counters["issued"] += len(data.formats)
+        return LeanAnalysisResponse(success=response.success, error=response.error, data=LeanMetadata(
+            id=data.id, title=data.title, thumbnail=data.thumbnail, duration=data.duration,
+            uploader=data.uploader, platform=data.platform, playlist=data.playlist,
+            formats=[LeanFormat(
+                format_id=f.format_id, token=make_token(alias, f.format_id), extension=f.extension,
+                resolution=f.resolution, filesize=f.filesize, quality_label=f.quality_label, protocol=f.protocol,
+            ) for f in data.formats],
+        ))
+
+    async def resolve(self, token: str) -> Tuple[MediaMetadata, MediaFormat]:
+        """Current metadata and format behind a token, re-extracting when the cache entry has expired."""
+        try:
+            alias, format_id = parse_token(token)
+            key = await metadata_cache.resolve_alias(alias)
+            if key is None:
+                raise TokenError("Format token expired; analyze the URL again", 410)
+        except TokenError as e:
+            self.counters["invalid" if e.status == 400 else "expired"] += 1
+            raise
+
+        entry = await metadata_cache.get_entry(key)
+        metadata = None
+        if entry:
+            metadata, expires_at = entry
+            # Streams count toward refresh priority like /analyze hits do
+            refresher.on_hit(key, key, metadata, expires_at)
+        else:
+            metadata = await metadata_cache.get_recent(key)
+            if metadata is not None:
+                self.counters["recent_hits"] += 1
+        if metadata is None:
+            # Canonical URLs (and data: URIs) are their own extraction input
+            _, task, _ = job_controller.start_or_join(key, lambda: extract_and_cache(key, key))
+            metadata = await asyncio.shield(task)
+            self.counters["reextracted"] += 1
+            if metadata is None:
+                self.counters["expired"] += 1
+                raise TokenError("Media is no longer available; analyze the URL again", 410)
+            if metadata_ttl(metadata) <= 0:
+                self.counters["reextracted_uncacheable"] += 1
+
+        for f in metadata.formats:
+            if f.format_id == format_id and f.url:
+                self.counters["resolved"] += 1
+                return metadata, f
+        self.counters["invalid"] += 1
+        raise TokenError("Format not found for this token", 404)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counters)
+
+format_tokens = FormatTokens()
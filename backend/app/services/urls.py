@@ -0,0 +1,135 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+DIRECT_IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+DIRECT_VIDEO_EXTS = ('.mp4', '.webm', '.ogg', '.mov', '.avi')
+
+# Longer inputs (data: URIs, giant query strings) are parsed on every call rather than memoized
+MAX_MEMO_URL_LENGTH = 2048
+
+# Share/tracking parameters that never change which media a YouTube/Instagram URL points to
+TRACKING_PARAMS = frozenset({'si', 'igsh', 'igshid', 'fbclid', 'gclid', 'feature', 'pp', 'ref_src'})
+
+YOUTUBE_HOSTS = frozenset({'youtube.com', 'music.youtube.com', 'youtube-nocookie.com', 'youtu.be'})
+INSTAGRAM_HOSTS = frozenset({'instagram.com', 'instagr.am'})
+
+_YT_ID = re.compile(r'^[\w-]{11}$')
+_YT_PATH = re.compile(r'^/(?:shorts|embed|live|v)/([\w-]{11})')
+# Optionally behind the author's username: /<user>/p/<id>/, /<user>/reel/<id>/
+_IG_POST = re.compile(r'^/(?:[^/]+/)?(?:reels?|p|tv)/([A-Za-z0-9_-]+)')
+_IG_STORY = re.compile(r'^/stories/([^/]+)/(\d+)')
+_GOOGLE_HOST = re.compile(r'^(?:[\w-]+\.)*google\.(?:com|[a-z]{2}|co\.[a-z]{2}|com\.[a-z]{2})$')
+
+# Media links in a Google result page, best first
+GOOGLE_RESULT_PATTERNS = [
+    re.compile(r'https?://(?:www\.)?youtube\.com/watch\?v=([\w-]{11})'),
+    re.compile(r'https?://youtu\.be/([\w-]{11})'),
+    re.compile(r'https?://(?:www\.)?instagram\.com/(?:p|reel)/([\w-]{11})'),
+    re.compile(r'(https?://[^"\'<>]+\.mp4)'),
+    # Google Video Search results encoded in redirect URLs
+    re.compile(r'/url\?q=(?P<link>https?://[^&"]*(?:youtube\.com|instagram\.com)[^&"]*|https?://[^&"]+\.mp4)(?=[&"])'),
+]
+
+@dataclass(frozen=True)
+class UrlDescriptor:
+    """A classified, canonicalized media URL."""
+    raw: str
+    # Canonical form: the cache key and the URL strategies are run against. Only known platforms
+    # are rewritten; other URLs keep their query byte-for-byte so signed links still verify
+    url: str
+    # youtube | instagram | google_search | direct | data | generic
+    platform: str
+    # Host without www./m. prefixes, used for per-domain statistics
+    host: str
+    media_id: Optional[str] = None
+    # video | image | playlist | story | page
+    kind: str = "page"
+    extension: Optional[str] = None
+
+    @property
+    def is_youtube(self) -> bool:
+        return self.platform == "youtube"
+
+    @property
+    def is_instagram(self) -> bool:
+        return self.platform == "instagram"
+
+def _short_host(netloc: str) -> str:
+    host = netloc.lower().rsplit('@', 1)[-1].split(':', 1)[0]
+    for prefix in ('www.', 'm.', 'mobile.'):
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+def _strip_tracking(parts, host_netloc: str) -> str:
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k not in TRACKING_PARAMS and not k.startswith('utm_')]
+    return urlunsplit((parts.scheme, host_netloc, parts.path, urlencode(query), ''))
+
+def route(url: str) -> UrlDescriptor:
+    """Classifies a URL, memoizing all but data: URIs and over-long inputs."""
+    if url.startswith('data:') or len(url) > MAX_MEMO_URL_LENGTH:
+        return classify(url)
+    return _memo_route(url)
+
+def classify(url: str) -> UrlDescriptor:
+    """Parses a URL and classifies platform, media ID and canonical form."""
+    if url.startswith('data:'):
+        kind = "image" if url.startswith('data:image') else "page"
+        return UrlDescriptor(raw=url, url=url, platform="data", host="", kind=kind)
+
+    parts = urlsplit(url.strip())
+    host = _short_host(parts.netloc)
+
+    if _GOOGLE_HOST.match(host):
+        if parts.path == '/url':
+            query = dict(parse_qsl(parts.query))
+            target = query.get('url') or query.get('q')
+            if target:
+                resolved = route(target)  # parse_qsl already decoded it
+                return UrlDescriptor(**{**resolved.__dict__, "raw": url})
+        if parts.path == '/search':
+            return UrlDescriptor(raw=url, url=url, platform="google_search", host=host)
+
+    if host in YOUTUBE_HOSTS:
+        query = dict(parse_qsl(parts.query))
+        if host == 'youtu.be':
+            video_id = parts.path.lstrip('/')[:11]
+        else:
+            match = _YT_PATH.match(parts.path)
+            video_id = match.group(1) if match else query.get('v', '')
+        if _YT_ID.match(video_id or ''):
+            return UrlDescriptor(raw=url, url=f"https://www.youtube.com/watch?v={video_id}",
+                                 platform="youtube", host="youtube.com", media_id=video_id, kind="video")
+        if query.get('list'):
+            return UrlDescriptor(raw=url, url=f"https://www.youtube.com/playlist?list={query['list']}",
+                                 platform="youtube", host="youtube.com", media_id=query['list'], kind="playlist")
+        # Channels, handles and other pages keep their path
+        return UrlDescriptor(raw=url, url=_strip_tracking(parts, "www.youtube.com"),
+                             platform="youtube", host="youtube.com", kind="playlist")
+
+    if host in INSTAGRAM_HOSTS:
+        match = _IG_POST.match(parts.path)
+        if match:
+            return UrlDescriptor(raw=url, url=f"https://www.instagram.com/reel/{match.group(1)}/",
+                                 platform="instagram", host="instagram.com", media_id=match.group(1), kind="video")
+        match = _IG_STORY.match(parts.path)
+        if match:
+            return UrlDescriptor(raw=url, url=f"https://www.instagram.com/stories/{match.group(1)}/{match.group(2)}/",
+                                 platform="instagram", host="instagram.com", media_id=match.group(2), kind="story")
+        return UrlDescriptor(raw=url, url=_strip_tracking(parts, "www.instagram.com"),
+                             platform="instagram", host="instagram.com")
+
+    # Only the fragment goes: it never reaches the server
+    canonical = url.strip().split('#', 1)[0]
+    path = parts.path.lower()
+    if path.endswith(DIRECT_IMAGE_EXTS) or path.endswith(DIRECT_VIDEO_EXTS):
+        ext = path.rsplit('.', 1)[-1]
+        kind = "video" if path.endswith(DIRECT_VIDEO_EXTS) else "image"
+        return UrlDescriptor(raw=url, url=canonical, platform="direct", host=host, kind=kind, extension=ext)
+    return UrlDescriptor(raw=url, url=canonical, platform="generic", host=host)
+
+_memo_route = lru_cache(maxsize=4096)(classify)
@@ -0,0 +1,86 @@
+"""Cold-start cost of the serverless entrypoint (api/index.py), measured in fresh interpreters.
+
+Each run reports the app import time, the first /api/health request, whether yt-dlp was
+loaded, whether anything was written to disk, and what warming yt-dlp afterwards costs.
+
+Run from the repository root: python -m benchmarks.cold_start [--runs N] [--top N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the fresh interpreter; prints one JSON line
+_PROBE = r"""
+import asyncio, json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, os.environ["MEDIAFLOW_ROOT"])
+from api.index import app
+imported = time.perf_counter() - started
+ytdlp_at_import = "yt_dlp" in sys.modules
+
+import httpx
+async def first_request():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://cold") as client:
+        t = time.perf_counter()
+        r = await client.get("/api/health")
+        assert r.status_code == 200, r.status_code
+        return time.perf_counter() - t
+health = asyncio.run(first_request())
+wrote = os.listdir(os.getcwd())
+
+from backend.app.services.extractor import extractor
+async def warm():
+    await extractor.engine.prewarm()
+    extractor.engine.shutdown()
+asyncio.run(warm())
+print(json.dumps({"import": imported, "health": health, "ytdlp_at_import": ytdlp_at_import,
+                  "files_written": wrote, "prewarm": extractor.engine.prewarm_seconds}))
+"""
+
+def probe() -> dict:
+    with tempfile.TemporaryDirectory(prefix="mediaflow-cold-") as cwd:
+        env = {**os.environ, "MEDIAFLOW_ROOT": ROOT, "DOWNLOAD_PATH": os.path.join(cwd, "downloads"),
+               "EXTRACTION_MODE": "thread", "EXTRACTION_WORKERS": "1", "LOG_LEVEL": "ERROR"}
+        out = subprocess.run([sys.executable, "-c", _PROBE], cwd=cwd, env=env, capture_output=True, text=True, check=True)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+def top_imports(limit: int) -> list:
+    """Slowest modules (cumulative microseconds) from one `-X importtime` run."""
+    env = {**os.environ, "LOG_LEVEL": "ERROR"}
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import api.index"],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list (0 to skip)")
+    args = parser.parse_args()
+
+    runs = [probe() for _ in range(args.runs)]
+    for label, key in (("import app", "import"), ("first /api/health", "health"), ("yt-dlp prewarm", "prewarm")):
+        values = [r[key] * 1000 for r in runs]
+        print(f"{label:<18} median {statistics.median(values):>8.1f} ms   min {min(values):>8.1f} ms   max {max(values):>8.1f} ms")
+    print(f"{'yt-dlp at import':<18} {'yes' if any(r['ytdlp_at_import'] for r in runs) else 'no'}")
+    written = sorted({name for r in runs for name in r["files_written"]})
+    print(f"{'files written':<18} {', '.join(written) if written else 'none'}")
+
+    if args.top:
+        print(f"\nSlowest imports (cumulative):")
+        for micros, name in top_imports(args.top):
+            print(f"  {micros / 1000:>8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
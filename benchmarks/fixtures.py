@@ -0,0 +1,87 @@
+"""Canned yt-dlp info dicts, shaped like real extractor output, with media URLs on the fake origin."""
+import copy
+import time
+from typing import Any, Dict, List, Optional
+
+def _fmt(base: str, format_id: str, ext: str, vcodec: str, acodec: str, height: Optional[int] = None,
+         tbr: float = 0, filesize: Optional[int] = None, **extra) -> Dict[str, Any]:
+    return {
+        "format_id": format_id, "ext": ext, "vcodec": vcodec, "acodec": acodec,
+        "height": height, "width": height * 16 // 9 if height else None,
+        "resolution": f"{height * 16 // 9}x{height}" if height else "audio only",
+        "tbr": tbr, "filesize": filesize, "protocol": "https",
+        "url": f"{base}/media/{format_id}.{ext}?size={filesize or 1024 * 1024}",
+        "http_headers": {"User-Agent": "Mozilla/5.0"}, **extra,
+    }
+
+def youtube_info(base: str, video_id: str = "dQw4w9WgXcQ") -> Dict[str, Any]:
+    """A YouTube watch page: storyboards, one combined format, DASH video ladders and audio."""
+    formats: List[Dict[str, Any]] = [
+        _fmt(base, f"sb{i}", "mhtml", "none", "none", 45 * (i + 1), format_note="storyboard") for i in range(4)
+    ]
+    formats += [
+        _fmt(base, "139", "m4a", "none", "mp4a.40.5", tbr=48, filesize=1_200_000, abr=48),
+        _fmt(base, "140", "m4a", "none", "mp4a.40.2", tbr=129, filesize=3_400_000, abr=129),
+        _fmt(base, "249", "webm", "none", "opus", tbr=53, filesize=1_300_000, abr=53),
+        _fmt(base, "251", "webm", "none", "opus", tbr=135, filesize=3_500_000, abr=135),
+        _fmt(base, "18", "mp4", "avc1.42001E", "mp4a.40.2", 360, tbr=500, filesize=13_000_000),
+    ]
+    for height, avc, vp9, av1 in ((144, "160", "278", "394"), (240, "133", "242", "395"), (360, "134", "243", "396"),
+                                  (480, "135", "244", "397"), (720, "136", "247", "398"), (1080, "137", "248", "399")):
+        scale = height / 1080
+        formats += [
+            _fmt(base, avc, "mp4", "avc1.640028", "none", height, tbr=4400 * scale, filesize=int(110_000_000 * scale)),
+            _fmt(base, vp9, "webm", "vp9", "none", height, tbr=2600 * scale, filesize=int(70_000_000 * scale)),
+            _fmt(base, av1, "mp4", "av01.0.08M.08", "none", height, tbr=2100 * scale, filesize=int(60_000_000 * scale)),
+        ]
+    return {
+        "id": video_id, "title": "Benchmark video", "extractor_key": "Youtube", "extractor": "youtube",
+        "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+        "thumbnail": f"{base}/media/{video_id}.jpg?size=40000",
+        "thumbnails": [{"url": f"{base}/media/{video_id}-{i}.jpg?size=40000", "preference": -i} for i in range(40)],
+        "duration": 212, "uploader": "Benchmark Channel", "view_count": 1_000_000,
+        "description": "lorem ipsum " * 200, "tags": [f"tag{i}" for i in range(30)],
+        "formats": formats,
+        "subtitles": {}, "automatic_captions": {f"lang{i}": [{"ext": "vtt", "url": f"{base}/subs/{i}.vtt"}] for i in range(100)},
+    }
+
+def instagram_info(base: str, shortcode: str = "C2xYzAbCdEf") -> Dict[str, Any]:
+    """An Instagram reel: a handful of progressive and DASH formats, all of which are kept."""
+    formats = [
+        _fmt(base, f"dash-{h}v", "mp4", "avc1.64001F", "none", h, tbr=h * 2.5, filesize=h * 8000) for h in (360, 540, 720, 1080)
+    ] + [
+        _fmt(base, "dash-audio", "m4a", "none", "mp4a.40.2", tbr=128, filesize=900_000),
+        _fmt(base, "8", "mp4", "avc1.64001F", "mp4a.40.2", 720, tbr=1800, filesize=6_000_000),
+    ]
+    return {
+        "id": shortcode, "title": "Benchmark reel", "extractor_key": "Instagram",
+        "thumbnail": f"{base}/media/{shortcode}.jpg?size=40000",
+        "duration": 30, "uploader": "benchmark", "formats": formats,
+    }
+
+def generic_info(base: str, name: str = "clip") -> Dict[str, Any]:
+    """A generic-extractor hit: no format list, just the media URL on the info dict itself."""
+    return {
+        "id": name, "title": f"Generic {name}", "extractor_key": "Generic", "ext": "mp4",
+        "url": f"{base}/media/{name}.mp4", "vcodec": "avc1", "acodec": "mp4a",
+    }
+
+class CannedYoutubeDL:
+    """Stands in for yt_dlp.YoutubeDL inside extraction workers: answers from the fixtures
+    after blocking for `latency` seconds, like a real extraction would."""
+    def __init__(self, infos: Dict[str, Dict[str, Any]], latency: float):
+        self.infos = infos
+        self.latency = latency
+
+    def extract_info(self, url: str, download: bool = False) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        info = self.infos.get(url)
+        if info is None:
+            raise RuntimeError(f"Unsupported URL: {url}")
+        return copy.deepcopy(info)
+
+def install_canned_ytdlp(infos: Dict[str, Dict[str, Any]], latency: float = 0.2):
+    """Points the extraction engine's workers at the canned extractor (thread mode only)."""
+    from backend.app.services import executor
+    canned = CannedYoutubeDL(infos, latency)
+    executor._get_ydl = lambda opts: canned
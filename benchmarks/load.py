@@ -0,0 +1,241 @@
+"""Load scenarios for /analyze and /stream, driven through the ASGI app in-process.
+
+Every upstream is the local fake origin (benchmarks.origin) and yt-dlp answers from canned
+info dicts (benchmarks.fixtures), so runs are reproducible and need no network access.
+
+Run from the repository root:
+    python -m benchmarks.load                       # every scenario
+    python -m benchmarks.load stream_proxy -n 50 -c 8
+    python -m benchmarks.load --json > before.json  # machine-readable, for comparing runs
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Settings are read at import time: isolate the run before the backend is imported
+_WORKDIR = tempfile.mkdtemp(prefix="mediaflow-bench-")
+os.environ.update({
+    "DOWNLOAD_PATH": _WORKDIR,
+    "CACHE_BACKEND": "memory",
+    "EXTRACTION_MODE": "thread",
+    "REFRESH_ENABLED": "false",
+    # Scenarios fail strategies on purpose; only real errors are worth printing
+    "LOG_LEVEL": "ERROR",
+})
+
+import httpx
+from benchmarks.fixtures import install_canned_ytdlp, youtube_info
+from benchmarks.origin import FakeOrigin
+from backend.app.core.config import settings
+from backend.app.main import app
+from backend.app.services.http_pool import http_pool
+
+MiB = 1024 * 1024
+
+@dataclass
+class Result:
+    scenario: str
+    requests: int
+    concurrency: int
+    errors: int = 0
+    seconds: float = 0.0
+    p50_ms: float = 0.0
+    p99_ms: float = 0.0
+    max_ms: float = 0.0
+    req_per_s: float = 0.0
+    mib_per_s: float = 0.0
+    rss_mib: float = 0.0
+    origin_connections: int = 0
+    origin_requests: int = 0
+    pool_tcp_connects: int = 0
+    notes: List[str] = field(default_factory=list)
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(q * len(sorted_values) + 0.5) - 1))]
+
+def rss_mib() -> float:
+    """Current resident set size; falls back to the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MiB
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (MiB if sys.platform == "darwin" else 1024)
+
+# One request of a scenario: given its index, returns the number of body bytes received
+Request = Callable[[int], Awaitable[int]]
+
+async def drive(name: str, origin: FakeOrigin, request: Request, n: int, concurrency: int) -> Result:
+    """Runs `n` requests with at most `concurrency` in flight and collects latency and upstream usage."""
+    result = Result(scenario=name, requests=n, concurrency=concurrency)
+    latencies: List[float] = []
+    received = 0
+    slots = asyncio.Semaphore(concurrency)
+    conns, reqs = origin.connections, origin.requests
+    connects = http_pool.stats()["tcp_connects"]
+
+    async def one(i: int):
+        nonlocal received
+        async with slots:
+            started = time.perf_counter()
+            try:
+                received += await request(i)
+            except Exception as e:
+                result.errors += 1
+                if len(result.notes) < 3:
+                    result.notes.append(f"request {i}: {e!r}")
+            latencies.append(time.perf_counter() - started)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    result.seconds = round(time.perf_counter() - began, 3)
+
+    latencies.sort()
+    result.p50_ms = round(_percentile(latencies, 0.5) * 1000, 2)
+    result.p99_ms = round(_percentile(latencies, 0.99) * 1000, 2)
+    result.max_ms = round(latencies[-1] * 1000, 2) if latencies else 0.0
+    result.req_per_s = round(n / result.seconds, 1) if result.seconds else 0.0
+    result.mib_per_s = round(received / MiB / result.seconds, 1) if result.seconds else 0.0
+    result.rss_mib = round(rss_mib(), 1)
+    result.origin_connections = origin.connections - conns
+    result.origin_requests = origin.requests - reqs
+    result.pool_tcp_connects = http_pool.stats()["tcp_connects"] - connects
+    return result
+
+class Scenarios:
+    """Each scenario returns (default request count, request function) for the shared driver."""
+    def __init__(self, client: httpx.AsyncClient, origin: FakeOrigin):
+        self.client = client
+        self.origin = origin
+
+    async def _analyze(self, url: str) -> int:
+        r = await self.client.post("/api/v1/analyze", json={"url": url})
+        body = r.json()
+        if r.status_code != 200 or not body.get("success"):
+            raise RuntimeError(f"HTTP {r.status_code}: {body.get('error') or body.get('detail')}")
+        return len(r.content)
+
+    async def _token(self, url: str) -> str:
+        """Format token of the first format of a lean analysis."""
+        r = await self.client.post("/api/v1/analyze", params={"lean": "1"}, json={"url": url})
+        body = r.json()
+        if r.status_code != 200 or not body.get("success"):
+            raise RuntimeError(f"HTTP {r.status_code}: {body.get('error') or body.get('detail')}")
+        return body["data"]["formats"][0]["token"]
+
+    async def _stream(self, params: Dict[str, str], headers: Optional[Dict[str, str]] = None,
+                      expect: Optional[int] = None) -> int:
+        r = await self.client.get("/api/v1/stream", params=params, headers=headers or {})
+        if r.status_code not in (200, 206):
+            raise RuntimeError(f"HTTP {r.status_code}")
+        if expect is not None and len(r.content) != expect:
+            raise RuntimeError(f"short body: {len(r.content)} of {expect} bytes")
+        return len(r.content)
+
+    def analyze_scrape(self):
+        """Cold /analyze of distinct OpenGraph pages (rapid_scrape wins)."""
+        return 200, lambda i: self._analyze(self.origin.url(f"/page/scrape-{i}.html"))
+
+    def analyze_cached(self):
+        """Repeated /analyze of one page: metadata cache hits after the first."""
+        return 1000, lambda i: self._analyze(self.origin.url("/page/cached.html"))
+
+    def analyze_ytdlp(self):
+        """Cold /analyze of distinct YouTube videos through the extraction engine (canned yt-dlp, 200 ms each)."""
+        return 100, lambda i: self._analyze(f"https://www.youtube.com/watch?v=bench{i:06d}")
+
+    def analyze_fallback(self):
+        """Pages with no og:video that yt-dlp rejects: only the cobalt-style fallback node resolves them."""
+        return 100, lambda i: self._analyze(self.origin.url(f"/page/fallback-{i}.html?bare=1"))
+
+    def stream_proxy(self):
+        """Whole 4 MiB files through the plain proxy."""
+        url = self.origin.url(f"/media/proxy.mp4?size={4 * MiB}")
+        return 100, lambda i: self._stream({"url": url}, expect=4 * MiB)
+
+    def stream_segments(self):
+        """Random 1 MiB ranges of one analyzed 8 MiB format, by token, through the segment cache (fills, then disk hits)."""
+        token = None
+        async def request(i: int):
+            nonlocal token
+            token = token or await self._token(self.origin.url("/page/segments.html"))
+            start = (i * 7 % 8) * MiB
+            return await self._stream({"token": token}, {"Range": f"bytes={start}-{start + MiB - 1}"}, expect=MiB)
+        return 200, request
+
+    def stream_flaky(self):
+        """4 MiB files whose upstream drops every other connection after 1 MiB (resume path)."""
+        def request(i: int):
+            url = self.origin.url(f"/flaky/flaky-{i}.mp4?size={4 * MiB}&drop={MiB}")
+            return self._stream({"url": url}, expect=4 * MiB)
+        return 50, request
+
+    def download_parallel(self):
+        """8 MiB downloads from an origin throttled to 4 MiB/s per connection (parallel ranges)."""
+        def request(i: int):
+            url = self.origin.url(f"/slow/dl-{i}.mp4?size={8 * MiB}&rate={4 * MiB}")
+            return self._stream({"url": url, "filename": f"dl-{i}.mp4"}, expect=8 * MiB)
+        return 8, request
+
+SCENARIOS = [name for name in vars(Scenarios) if not name.startswith("_")]
+
+def print_table(results: List[Result]):
+    header = f"{'scenario':<18} {'reqs':>5} {'conc':>4} {'err':>4} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>8} {'MiB/s':>7} {'RSS MiB':>8} {'conns':>6} {'upstream':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r.scenario:<18} {r.requests:>5} {r.concurrency:>4} {r.errors:>4} {r.p50_ms:>9.2f} {r.p99_ms:>9.2f}"
+              f" {r.req_per_s:>8.1f} {r.mib_per_s:>7.1f} {r.rss_mib:>8.1f} {r.origin_connections:>6} {r.origin_requests:>8}")
+        for note in r.notes:
+            print(f"    ! {note}")
+
+async def main(names: List[str], requests: Optional[int], concurrency: int, ytdlp_latency: float) -> List[Result]:
+    results = []
+    with FakeOrigin() as origin:
+        settings.FALLBACK_NODE_URL = origin.url("/api/json")
+        install_canned_ytdlp({
+            f"https://www.youtube.com/watch?v=bench{i:06d}": youtube_info(origin.base, f"bench{i:06d}")
+            for i in range(1000)
+        }, latency=ytdlp_latency)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            scenarios = Scenarios(client, origin)
+            for name in names:
+                default_n, request = getattr(scenarios, name)()
+                results.append(await drive(name, origin, request, requests or default_n, concurrency))
+        await http_pool.aclose()
+    return results
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"one or more of: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("-n", "--requests", type=int, help="requests per scenario (default: per scenario)")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("--ytdlp-latency", type=float, default=0.2, help="seconds each canned extraction blocks a worker")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    try:
+        results = asyncio.run(main(args.scenarios or SCENARIOS, args.requests, args.concurrency, args.ytdlp_latency))
+    finally:
+        shutil.rmtree(_WORKDIR, ignore_errors=True)
+    if args.json:
+        print(json.dumps([asdict(r) for r in results], indent=2))
+    else:
+        print_table(results)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,208 @@
+"""Local stand-in for the upstreams the backend talks to, so benchmarks need no network access.
+
+Routes (all on 127.0.0.1, random port):
+  GET  /page/<id>.html          OpenGraph page whose og:video is /media/<id>.mp4 (?bare=1: no og:video)
+  GET  /media/<name>.<ext>      Range-capable media, deterministic bytes (?size=N, default 8 MiB)
+  GET  /slow/<name>.<ext>       As /media, after ?delay=seconds and throttled to ?rate=bytes/s
+  GET  /flaky/<name>.<ext>      As /media, but every other request (starting with the first) drops after ?drop=N bytes
+  POST /api/json                Cobalt-style resolver: {"url": ...} -> {"status": "stream", "url": /media/...}
+
+Run standalone to poke at it: python -m benchmarks.origin
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_SIZE = 8 * 1024 * 1024
+CHUNK = 64 * 1024
+# Media bodies repeat this block; seeded so every run serves the same bytes
+_BLOCK = random.Random(1337).randbytes(1024 * 1024)
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_MEDIA_PATH = re.compile(r'^/(media|slow|flaky)/([\w.-]+)\.(\w+)$')
+_PAGE_PATH = re.compile(r'^/page/([\w-]+)\.html$')
+
+CONTENT_TYPES = {"mp4": "video/mp4", "m4a": "audio/mp4", "webm": "video/webm", "jpg": "image/jpeg", "mp3": "audio/mpeg"}
+
+def media_bytes(start: int, end: int) -> bytes:
+    """Bytes start..end (inclusive) of every media file the origin serves."""
+    out = bytearray()
+    pos = start
+    while pos <= end:
+        offset = pos % len(_BLOCK)
+        take = min(len(_BLOCK) - offset, end - pos + 1)
+        out += _BLOCK[offset:offset + take]
+        pos += take
+    return bytes(out)
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, *args):
+        pass
+
+    def _query(self) -> Tuple[str, Dict[str, str]]:
+        parts = urlsplit(self.path)
+        return parts.path, {k: v[-1] for k, v in parse_qs(parts.query).items()}
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        self.server.count("requests")
+        path, query = self._query()
+        page = _PAGE_PATH.match(path)
+        if page:
+            return self._page(page.group(1), bool(query.get("bare")))
+        media = _MEDIA_PATH.match(path)
+        if media:
+            return self._media(media.group(1), media.group(2), media.group(3), query)
+        self._send(404, b"not found", "text/plain")
+
+    def do_POST(self):
+        self.server.count("requests")
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self._query()[0] != "/api/json":
+            return self._send(404, b"not found", "text/plain")
+        try:
+            url = json.loads(body)["url"]
+        except (ValueError, KeyError):
+            return self._send(400, b'{"status":"error"}', "application/json")
+        name = hashlib.sha1(url.encode()).hexdigest()[:12]
+        answer = {"status": "stream", "url": f"{self.server.base}/media/{name}.mp4"}
+        self._send(200, json.dumps(answer).encode(), "application/json")
+
+    def _page(self, page_id: str, bare: bool):
+        base = self.server.base
+        video = "" if bare else f'<meta property="og:video" content="{base}/media/{page_id}.mp4">'
+        html = (
+            "<!doctype html><html><head>"
+            f"<title>Page {page_id}</title>"
+            f'<meta property="og:title" content="Benchmark clip {page_id}">'
+            f'<meta property="og:image" content="{base}/media/{page_id}.jpg?size=20000">'
+            f'{video}<meta property="video:duration" content="42">'
+            "</head><body>" + "<p>filler</p>" * 2000 + "</body></html>"
+        )
+        self._send(200, html.encode(), "text/html; charset=utf-8")
+
+    def _media(self, mode: str, name: str, ext: str, query: Dict[str, str]):
+        size = int(query.get("size") or DEFAULT_SIZE)
+        if mode == "slow":
+            time.sleep(float(query.get("delay") or 0))
+        start, end, status = 0, size - 1, 200
+        match = _RANGE.match(self.headers.get("Range", ""))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start >= size:
+                return self._send(416, b"", "text/plain", {"Content-Range": f"bytes */{size}"})
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", CONTENT_TYPES.get(ext, "application/octet-stream"))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", f'"{name}-{size}"')
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+
+        drop_after = None
+        if mode == "flaky" and self.server.count(f"flaky:{name}") % 2 == 0:
+            drop_after = int(query.get("drop") or CHUNK)
+        rate = float(query.get("rate") or 0) if mode == "slow" else 0
+        pos, sent, began = start, 0, time.monotonic()
+        while pos <= end:
+            chunk = media_bytes(pos, min(end, pos + CHUNK - 1))
+            if drop_after is not None and sent + len(chunk) > drop_after:
+                self.wfile.write(chunk[:max(0, drop_after - sent)])
+                self.wfile.flush()
+                self.close_connection = True
+                self.connection.shutdown(2)
+                return
+            self.wfile.write(chunk)
+            pos += len(chunk)
+            sent += len(chunk)
+            if rate:
+                # Sleep off whatever we are ahead of the configured rate
+                ahead = sent / rate - (time.monotonic() - began)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address):
+        super().__init__(address, _Handler)
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.base = f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, name: str) -> int:
+        """Increments a counter and returns its previous value."""
+        with self._lock:
+            value = self.counters.get(name, 0)
+            self.counters[name] = value + 1
+        return value
+
+    def process_request(self, request, client_address):
+        self.count("connections")
+        super().process_request(request, client_address)
+
+class FakeOrigin:
+    """Runs the stand-in origin on a background thread for the lifetime of a `with` block."""
+    def __init__(self):
+        self.server = _Server(("127.0.0.1", 0))
+        self.base = self.server.base
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-origin", daemon=True)
+
+    def __enter__(self) -> "FakeOrigin":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def url(self, path: str) -> str:
+        return self.base + path
+
+    @property
+    def connections(self) -> int:
+        return self.server.counters.get("connections", 0)
+
+    @property
+    def requests(self) -> int:
+        return self.server.counters.get("requests", 0)
+
+if __name__ == "__main__":
+    with FakeOrigin() as origin:
+        print(f"Fake origin on {origin.base} (Ctrl+C to stop)")
+        print(f"  {origin.url('/page/demo.html')}")
+        print(f"  {origin.url('/media/demo.mp4?size=1048576')}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
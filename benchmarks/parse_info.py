@@ -0,0 +1,28 @@
+"""Micro-benchmark for turning yt-dlp info dicts into API metadata.
+
+Run from the repository root: python -m benchmarks.parse_info
+"""
+import time
+from benchmarks.fixtures import generic_info, instagram_info, youtube_info
+from backend.app.services.extractor import extractor
+
+BASE = "http://127.0.0.1:9"
+
+CASES = [
+    ("youtube", youtube_info(BASE), "https://www.youtube.com/watch?v=dQw4w9WgXcQ"),
+    ("instagram", instagram_info(BASE), "https://www.instagram.com/reel/C2xYzAbCdEf/"),
+    ("generic", generic_info(BASE), "https://example.com/watch/clip"),
+]
+
+def main(rounds: int = 2000) -> None:
+    for label, info, url in CASES:
+        metadata = extractor._parse_info(info, url)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            extractor._parse_info(info, url)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<10} {len(info.get('formats') or []):>3} raw -> {len(metadata.formats):>2} formats"
+              f"  {elapsed * 1e6 / rounds:>8.1f} us/call")
+
+if __name__ == "__main__":
+    main()
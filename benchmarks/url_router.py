@@ -0,0 +1,51 @@
+"""Micro-benchmark for the URL router over real-world URL shapes.
+
+Run from the repository root: python -m benchmarks.url_router
+"""
+import time
+from backend.app.services.urls import classify, route
+
+CORPUS = [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PLFgquLnL59alCl_2TQvOiD5Vgm1hCaGSI&index=2&pp=iAQB",
+    "https://youtu.be/dQw4w9WgXcQ?si=Xk3_abcdEFGhij12",
+    "https://m.youtube.com/shorts/aqz-KE-bpKQ?feature=share",
+    "https://music.youtube.com/watch?v=dQw4w9WgXcQ&feature=share",
+    "https://www.youtube.com/embed/dQw4w9WgXcQ?autoplay=1",
+    "https://www.youtube.com/playlist?list=PLFgquLnL59alCl_2TQvOiD5Vgm1hCaGSI",
+    "https://www.youtube.com/@LinusTechTips/videos",
+    "https://www.instagram.com/reel/C2xYzAbCdEf/?igsh=MWQ1ZGUxMzBkMA==",
+    "https://www.instagram.com/p/C2xYzAbCdEf/?utm_source=ig_web_copy_link",
+    "https://instagram.com/reels/C2xYzAbCdEf/",
+    "https://www.instagram.com/stories/natgeo/3301234567890123456/?utm_source=ig_story_item_share",
+    "https://www.google.com/url?sa=t&rct=j&url=https%3A%2F%2Fyoutu.be%2FdQw4w9WgXcQ&ved=2ahUKE",
+    "https://www.google.com/search?q=never+gonna+give+you+up&tbm=vid",
+    "https://www.tiktok.com/@scout2015/video/6718335390845095173?is_from_webapp=1&sender_device=pc",
+    "https://twitter.com/SpaceX/status/1719000000000000000?s=20&t=abcdef",
+    "https://vimeo.com/76979871?utm_campaign=share&utm_medium=social",
+    "https://cdn.example.com/media/clip.mp4?token=abc123&expires=1700000000",
+    "https://images.example.org/photos/cat.JPG",
+    "https://www.reddit.com/r/videos/comments/abc123/some_title/?utm_source=share&utm_medium=web2x",
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==",
+]
+
+def bench(label: str, fn, rounds: int) -> None:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for url in CORPUS:
+            fn(url)
+    elapsed = time.perf_counter() - start
+    calls = rounds * len(CORPUS)
+    print(f"{label:<12} {calls:>8} calls  {elapsed * 1e9 / calls:>9.0f} ns/call")
+
+def main(rounds: int = 2000) -> None:
+    for url in CORPUS:
+        d = route(url)
+        print(f"{d.platform:<14} {d.kind:<9} {str(d.media_id):<20} {d.url[:80]}")
+    print()
+    # Cold: bypass the memo so every call parses and classifies from scratch
+    bench("cold", classify, rounds)
+    bench("memoized", route, rounds)
+
+if __name__ == "__main__":
+    main()
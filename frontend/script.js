@@ -6,6 +6,11 @@ const API_BASE = (isLocal || isFile) ? 'http://127.0.0.1:8000/api/v1' : '/api/v1
 
 console.log(`Using API Base: ${API_BASE}`);
 
+// Thumbnails come back as /api/v1/thumb paths; resolve them against the backend actually in use
+function apiAsset(url) {
+    return url && url.startsWith('/api/v1/') ? API_BASE + url.slice('/api/v1'.length) : url;
+}
+
 const urlInput = document.getElementById('media-url');
 const analyzeBtn = document.getElementById('analyze-btn');
 const resultsSection = document.getElementById('results-section');
@@ -22,6 +27,7 @@ const clearHistoryBtn = document.getElementById('clear-history');
 
 let timerId = null;
 let currentAnalysisData = null;
+let activeHls = null;
 
 analyzeBtn.addEventListener('click', () => {
     const url = urlInput.value.trim();
@@ -64,7 +70,8 @@ async function startAnalysis(url) {
     resetTimer();
 
     try {
-        const response = await fetch(`${API_BASE}/analyze`, {
+        // Lean: formats carry stream tokens instead of signed upstream URLs
+        const response = await fetch(`${API_BASE}/analyze?lean=1`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ url })
@@ -74,6 +81,8 @@ async function startAnalysis(url) {
         stopTimer();
 
         if (result.success) {
+            // Lean responses leave out the URL we already have
+            result.data.original_url = url;
             currentAnalysisData = result.data;
             addToHistory(result.data);
             displayResults(result.data);
@@ -93,10 +102,15 @@ function displayResults(data) {
     skeletonSection.classList.add('hidden');
     resultsSection.classList.remove('hidden');
 
+    if (data.playlist) {
+        displayPlaylist(data);
+        return;
+    }
+
     // Filter formats to show useful ones (prioritize those with resolution or quality label)
     const videoFormats = data.formats.filter(f => f.resolution || f.quality_label);
     const bestFormat = videoFormats[0] || data.formats[0] || { format_id: 'best' };
-    const isImage = data.formats.some(f => ['jpg', 'jpeg', 'png', 'gif', 'webp'].includes(f.extension.toLowerCase())) || data.id === 'base64-img';
+    const isImage = data.formats.some(f => ['jpg', 'jpeg', 'png', 'gif', 'webp'].includes(f.extension.toLowerCase())) || data.id.startsWith('base64-');
 
     // Group formats by resolution to avoid duplicates if necessary, or just show top ones
     const uniqueFormats = [];
@@ -115,7 +129,7 @@ function displayResults(data) {
 
     resultsSection.innerHTML = `
         <div class="media-card glass-card">
-            <img src="${data.thumbnail || 'https://via.placeholder.com/350x200'}" class="media-thumb">
+            <img src="${apiAsset(data.thumbnail) || 'https://via.placeholder.com/350x200'}" class="media-thumb">
             <div class="info-content">
                 <span class="platform-tag">${data.platform.toUpperCase()}</span>
                 <h2>${data.title}</h2>
@@ -148,6 +162,52 @@ function displayResults(data) {
     `;
 }
 
+// Playlists arrive as a first page of entries; each entry is analyzed when clicked
+function displayPlaylist(data) {
+    resultsSection.innerHTML = `
+        <div class="media-card glass-card">
+            <img src="${apiAsset(data.thumbnail) || 'https://via.placeholder.com/350x200'}" class="media-thumb">
+            <div class="info-content">
+                <span class="platform-tag">${data.platform.toUpperCase()}</span>
+                <h2>${data.title}</h2>
+                <div class="quality-selector">
+                    <h3>Playlist${data.playlist.total ? ` • ${data.playlist.total} items` : ''}</h3>
+                    <div id="playlistEntries"></div>
+                    <button id="playlistMore" class="action-btn preview-btn hidden">
+                        <i class="fas fa-plus"></i>
+                        <span>Load More</span>
+                    </button>
+                </div>
+            </div>
+        </div>
+    `;
+    appendPlaylistPage(data.playlist);
+}
+
+function appendPlaylistPage(page) {
+    const list = document.getElementById('playlistEntries');
+    list.insertAdjacentHTML('beforeend', page.entries.map(entry => `
+        <div class="history-item" onclick="loadFromHistory('${entry.url}')">
+            <img src="${apiAsset(entry.thumbnail) || 'https://via.placeholder.com/80x60'}" class="history-thumb" loading="lazy">
+            <div class="history-info">
+                <h4>${entry.title}</h4>
+                <p>#${entry.index + 1}${entry.duration ? ` • ${Math.round(entry.duration / 60)} min` : ''}</p>
+            </div>
+        </div>
+    `).join(''));
+
+    const more = document.getElementById('playlistMore');
+    more.classList.toggle('hidden', page.next_offset === null);
+    more.onclick = async () => {
+        const response = await fetch(`${API_BASE}/playlist/${page.id}?offset=${page.next_offset}`);
+        if (response.ok) {
+            appendPlaylistPage(await response.json());
+        } else {
+            showToast('Playlist listing expired. Analyze the link again.', 'error');
+        }
+    };
+}
+
 function addToHistory(data) {
     if (!data || !data.title) return;
     let history = JSON.parse(localStorage.getItem('mediaHistory') || '[]');
@@ -181,7 +241,7 @@ function renderHistory() {
 
     historyList.innerHTML = history.map(item => `
         <div class="history-item" onclick="loadFromHistory('${item.url}')">
-            <img src="${item.thumbnail || 'https://via.placeholder.com/80x60'}" class="history-thumb">
+            <img src="${apiAsset(item.thumbnail) || 'https://via.placeholder.com/80x60'}" class="history-thumb" loading="lazy">
             <div class="history-info">
                 <h4>${item.title}</h4>
                 <p>${item.platform} • ${new Date(item.timestamp).toLocaleDateString()}</p>
@@ -197,23 +257,29 @@ function loadFromHistory(url) {
     startAnalysis(url);
 }
 
+// The backend resolves the token to a live URL and caches segments per media/format
+function streamParams(format) {
+    return `token=${encodeURIComponent(format.token)}`;
+}
+
 function openPreview(format_id, isImage = false) {
     if (!currentAnalysisData) return;
     const format = currentAnalysisData.formats.find(f => f.format_id === format_id) || currentAnalysisData.formats[0];
-    const streamUrl = `${API_BASE}/stream?url=${encodeURIComponent(format.url)}`;
+    const streamUrl = `${API_BASE}/stream?${streamParams(format)}`;
 
     let content = '';
 
-    if (currentAnalysisData.id === 'base64-img') {
+    if (currentAnalysisData.id.startsWith('base64-')) {
         const thumb = document.querySelector('.media-thumb').src;
         content = `<img src="${thumb}" style="width: 100%; border-radius: 18px; box-shadow: 0 40px 100px rgba(0,0,0,0.9);">`;
     } else if (isImage) {
         content = `<img src="${streamUrl}" style="width: 100%; border-radius: 18px; box-shadow: 0 40px 100px rgba(0,0,0,0.9);">`;
     } else {
+        const source = format.protocol === 'hls' ? '' : `<source src="${streamUrl}" type="video/mp4">`;
         content = `
             <div class="video-wrapper">
                 <video id="preview-video" controls autoplay playsinline preload="metadata">
-                    <source src="${streamUrl}" type="video/mp4">
+                    ${source}
                     Your browser does not support the video tag.
                 </video>
                 <button class="fullscreen-toggle" onclick="toggleFullscreen()">
@@ -227,7 +293,30 @@ function openPreview(format_id, isImage = false) {
     previewModal.classList.remove('hidden');
 
     const video = document.getElementById('preview-video');
-    if (video) video.load();
+    if (video && format.protocol === 'hls') {
+        attachHls(video, streamUrl);
+    } else if (video) {
+        video.load();
+    }
+}
+
+// HLS formats stream as a playlist: Safari plays it natively, elsewhere hls.js is loaded on first use
+function attachHls(video, src) {
+    if (video.canPlayType('application/vnd.apple.mpegurl')) {
+        video.src = src;
+        return;
+    }
+    const start = () => {
+        activeHls = new Hls();
+        activeHls.loadSource(src);
+        activeHls.attachMedia(video);
+    };
+    if (window.Hls) return start();
+    const script = document.createElement('script');
+    script.src = 'https://cdn.jsdelivr.net/npm/hls.js@1/dist/hls.min.js';
+    script.onload = start;
+    script.onerror = () => showToast('Could not load the HLS player.', 'error');
+    document.head.appendChild(script);
 }
 
 function toggleFullscreen() {
@@ -270,6 +359,10 @@ function closePreview() {
         document.exitFullscreen().catch(() => { });
     }
     previewModal.classList.add('hidden');
+    if (activeHls) {
+        activeHls.destroy();
+        activeHls = null;
+    }
     playerContainer.innerHTML = '';
 }
 
@@ -277,7 +370,7 @@ function downloadVideo(formatId) {
     if (!currentAnalysisData) return;
     const format = currentAnalysisData.formats.find(f => f.format_id === formatId) || currentAnalysisData.formats[0];
     const filename = `MediaFlow_${currentAnalysisData.id}.${format.extension || 'mp4'}`;
-    const downloadUrl = `${API_BASE}/stream?url=${encodeURIComponent(format.url)}&filename=${encodeURIComponent(filename)}`;
+    const downloadUrl = `${API_BASE}/stream?${streamParams(format)}&filename=${encodeURIComponent(filename)}`;
 
     const a = document.createElement('a');
     a.href = downloadUrl;
@@ -0,0 +1,64 @@
+"""Shared fixtures: the benchmark harness's fake origin and canned yt-dlp, driven in-process.
+
+Run from the repository root: python -m pytest tests
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+
+# Settings are read at import time: isolate the run before the backend is imported
+_WORKDIR = tempfile.mkdtemp(prefix="mediaflow-test-")
+os.environ.update({
+    "DOWNLOAD_PATH": _WORKDIR,
+    "CACHE_BACKEND": "memory",
+    "EXTRACTION_MODE": "thread",
+    "REFRESH_ENABLED": "false",
+    "LOG_LEVEL": "ERROR",
+})
+
+import httpx
+import pytest
+from benchmarks.fixtures import install_canned_ytdlp, youtube_info
+from benchmarks.origin import FakeOrigin
+
+CANNED_VIDEOS = 50
+
+@pytest.fixture(scope="session")
+def loop():
+    """One loop for the whole run: pooled HTTP clients are bound to the loop that created them."""
+    loop = asyncio.new_event_loop()
+    yield loop
+    from backend.app.services.http_pool import http_pool
+    loop.run_until_complete(http_pool.aclose())
+    loop.close()
+    shutil.rmtree(_WORKDIR, ignore_errors=True)
+
+@pytest.fixture(scope="session")
+def run(loop):
+    return loop.run_until_complete
+
+@pytest.fixture(scope="session")
+def origin():
+    with FakeOrigin() as origin:
+        from backend.app.core.config import settings
+        settings.FALLBACK_NODE_URL = origin.url("/api/json")
+        install_canned_ytdlp({
+            f"https://www.youtube.com/watch?v=test{i:07d}": youtube_info(origin.base, f"test{i:07d}")
+            for i in range(CANNED_VIDEOS)
+        }, latency=0.2)
+        yield origin
+
+@pytest.fixture(scope="session")
+def client(run, origin):
+    from backend.app.main import app
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", timeout=30)
+    yield client
+    run(client.aclose())
+
+async def lean_token(client: httpx.AsyncClient, url: str, index: int = 0) -> str:
+    """Format token of one format of a lean analysis."""
+    r = await client.post("/api/v1/analyze", params={"lean": "1"}, json={"url": url})
+    body = r.json()
+    assert r.status_code == 200 and body["success"], body
+    return body["data"]["formats"][index]["token"]
@@ -0,0 +1,29 @@
+"""/analyze: single-flight coalescing of concurrent requests and metadata cache hits."""
+import asyncio
+from backend.app.services.jobs import job_controller
+
+def test_concurrent_analyses_of_one_video_share_one_extraction(run, client):
+    async def go():
+        started = job_controller.counters["started"]
+        # Different shapes of the same video canonicalize to one key
+        urls = ["https://www.youtube.com/watch?v=test0000001", "https://youtu.be/test0000001?si=share",
+                "https://m.youtube.com/watch?v=test0000001&feature=share"] * 4
+        responses = await asyncio.gather(*(client.post("/api/v1/analyze", json={"url": u}) for u in urls))
+        bodies = [r.json() for r in responses]
+        assert all(r.status_code == 200 and b["success"] for r, b in zip(responses, bodies))
+        assert {b["data"]["id"] for b in bodies} == {"test0000001"}
+        assert job_controller.counters["started"] == started + 1
+
+        # Later requests are cache hits and start nothing
+        again = await client.post("/api/v1/analyze", json={"url": urls[0]})
+        assert again.json()["success"] and job_controller.counters["started"] == started + 1
+    run(go())
+
+def test_distinct_videos_are_not_coalesced(run, client):
+    async def go():
+        started = job_controller.counters["started"]
+        urls = [f"https://www.youtube.com/watch?v=test000001{i}" for i in range(3)]
+        responses = await asyncio.gather(*(client.post("/api/v1/analyze", json={"url": u}) for u in urls))
+        assert [r.json()["data"]["id"] for r in responses] == [f"test000001{i}" for i in range(3)]
+        assert job_controller.counters["started"] == started + 3
+    run(go())
@@ -0,0 +1,53 @@
+"""Circuit breaker state transitions."""
+import pytest
+from backend.app.core.config import settings
+from backend.app.services import breakers
+from backend.app.services.breakers import BreakerBoard, CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(breakers.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(settings, "BREAKER_JITTER", 0.0)
+    return now
+
+def _fail(breaker: CircuitBreaker, times: int):
+    for _ in range(times):
+        breaker.allow().failure()
+
+def test_trips_after_enough_failures_and_closes_on_a_good_probe(clock):
+    breaker = CircuitBreaker("ydl_direct@example.com")
+    _fail(breaker, settings.BREAKER_MIN_CALLS - 1)
+    assert breaker.state == CLOSED  # not enough calls yet
+    _fail(breaker, 1)
+    assert breaker.state == OPEN and breaker.allow() is None
+
+    clock[0] += settings.BREAKER_OPEN_SECONDS
+    probe = breaker.allow()
+    assert breaker.state == HALF_OPEN and probe.probe
+    assert breaker.allow() is None  # one probe at a time
+    probe.success()
+    assert breaker.state == CLOSED and breaker.trips == 0
+
+def test_failed_probe_reopens_with_backoff(clock):
+    breaker = CircuitBreaker("ydl_direct@example.com")
+    _fail(breaker, settings.BREAKER_MIN_CALLS)
+    clock[0] += settings.BREAKER_OPEN_SECONDS
+    breaker.allow().failure()
+    assert breaker.state == OPEN and breaker.trips == 2
+    assert breaker.retry_after() == pytest.approx(2 * settings.BREAKER_OPEN_SECONDS)
+
+def test_abandoned_probe_frees_the_half_open_slot(clock):
+    breaker = CircuitBreaker("ydl_direct@example.com")
+    _fail(breaker, settings.BREAKER_MIN_CALLS)
+    clock[0] += settings.BREAKER_OPEN_SECONDS
+    breaker.allow().abandon()
+    assert breaker.state == HALF_OPEN and breaker.allow() is not None
+
+def test_board_counts_each_refusal_once(clock):
+    board = BreakerBoard()
+    for _ in range(settings.BREAKER_MIN_CALLS):
+        board.allow("rapid_scrape@example.com").failure()
+    assert not board.available("rapid_scrape@example.com")
+    assert board.allow("rapid_scrape@example.com") is None
+    assert board.rejected == 1
@@ -0,0 +1,77 @@
+"""Shared cache tier against an in-process Redis (fakeredis).
+
+Run from the repository root: python -m pytest tests
+"""
+import asyncio
+import pytest
+from backend.app.models.schemas import MediaMetadata, MediaFormat
+from backend.app.services.cache import MetadataCache
+from backend.app.services.cache_backends import MemoryBackend, RedisBackend
+
+fakeredis = pytest.importorskip("fakeredis")
+
+def _metadata() -> MediaMetadata:
+    return MediaMetadata(
+        id="abc123", title="Clip", platform="Generic", original_url="https://example.com/clip",
+        formats=[MediaFormat(format_id="best", extension="mp4", url="https://cdn.example.com/clip.mp4")],
+    )
+
+def _redis() -> RedisBackend:
+    return RedisBackend("redis://unused", "test:", client=fakeredis.FakeAsyncRedis())
+
+def test_redis_backend_round_trip():
+    async def run():
+        backend = _redis()
+        assert await backend.get("k") is None
+        await backend.set("k", b"value", 60)
+        assert await backend.get("k") == b"value"
+        assert await backend.client.get("test:k") == b"value"  # stored under the prefix
+        assert 0 < await backend.client.pttl("test:k") <= 60_000
+        await backend.set("skipped", b"value", 0)
+        assert await backend.get("skipped") is None
+        await backend.delete("k")
+        assert await backend.get("k") is None
+        await backend.aclose()
+    asyncio.run(run())
+
+def test_metadata_cache_over_redis():
+    async def run():
+        shared = _redis()
+        writer = MetadataCache(MemoryBackend(100, 1 << 20), shared)
+        reader = MetadataCache(MemoryBackend(100, 1 << 20), shared)
+        key = "https://example.com/clip"
+
+        assert await writer.set(key, _metadata()) is not None
+        # Another instance with a cold local tier reads it from Redis
+        assert (await reader.get(key)).id == "abc123"
+        assert reader.counters["shared_hits"] == 1
+
+        await writer.set_alias("alias0123456789a", key, 60)
+        assert await reader.resolve_alias("alias0123456789a") == key
+        assert await reader.resolve_alias("missing") is None
+
+        await writer.delete(key)
+        assert await shared.get(key) is None
+        assert await MetadataCache(MemoryBackend(100, 1 << 20), shared).get(key) is None
+    asyncio.run(run())
+
+class _BrokenBackend(MemoryBackend):
+    async def get(self, key):
+        raise ConnectionError("down")
+
+    async def set(self, key, value, ttl):
+        raise ConnectionError("down")
+
+    async def delete(self, key):
+        raise ConnectionError("down")
+
+def test_shared_backend_errors_are_not_fatal():
+    async def run():
+        cache = MetadataCache(MemoryBackend(100, 1 << 20), _BrokenBackend(100, 1 << 20))
+        key = "https://example.com/clip"
+        await cache.set(key, _metadata())
+        assert (await cache.get(key)).id == "abc123"  # served from the local tier
+        await cache.delete(key)
+        assert await cache.get(key) is None
+        assert cache.counters["errors"] == 3  # write, delete, and the read after the local miss
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+"""HLS playlist parsing and rewriting."""
+from backend.app.services.hls import best_variant, parse_media_playlist, rewrite_playlist, encode_hls_url, decode_hls_url
+
+BASE = "https://cdn.example.com/stream/master.m3u8"
+
+MASTER = """#EXTM3U
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="en",URI="audio/en.m3u8"
+#EXT-X-STREAM-INF:BANDWIDTH=800000,AUDIO="aud"
+low/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=2400000,AUDIO="aud"
+high/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=1200000
+muxed/index.m3u8
+"""
+
+MEDIA = """#EXTM3U
+#EXT-X-TARGETDURATION:4
+#EXT-X-MAP:URI="init.mp4"
+#EXTINF:4,
+seg0.m4s
+#EXTINF:4,
+https://other.example.com/seg1.m4s?sig=a%2Bb
+#EXT-X-ENDLIST
+"""
+
+def _link(url, kind):
+    return f"/hls/x/{kind}?u={url}"
+
+def test_master_links_point_at_playlists():
+    body, linked, segments = rewrite_playlist(MASTER, BASE, _link)
+    assert 'URI="/hls/x/p?u=https://cdn.example.com/stream/audio/en.m3u8"' in body
+    assert "/hls/x/p?u=https://cdn.example.com/stream/high/index.m3u8" in body.splitlines()
+    assert len(linked) == 4 and segments == []
+
+def test_media_links_point_at_segments_in_order():
+    body, linked, segments = rewrite_playlist(MEDIA, "https://cdn.example.com/stream/high/index.m3u8", _link)
+    assert 'URI="/hls/x/s?u=https://cdn.example.com/stream/high/init.mp4"' in body
+    assert segments == ["https://cdn.example.com/stream/high/seg0.m4s", "https://other.example.com/seg1.m4s?sig=a%2Bb"]
+    assert "#EXT-X-ENDLIST" in body
+
+def test_best_variant_prefers_muxed_audio():
+    assert best_variant(MASTER, BASE) == "https://cdn.example.com/stream/muxed/index.m3u8"
+
+def test_media_playlist_for_concatenation():
+    playlist = parse_media_playlist(MEDIA, "https://cdn.example.com/stream/high/index.m3u8")
+    assert playlist.ended and not playlist.encrypted
+    assert playlist.init == ("https://cdn.example.com/stream/high/init.mp4", None)
+    assert [url for url, _ in playlist.segments][1].endswith("seg1.m4s?sig=a%2Bb")
+
+def test_hls_url_round_trip():
+    headers = {"Referer": "https://example.com/", "Cookie": "a=b"}
+    assert decode_hls_url(encode_hls_url(BASE + "?x=1&y=2", headers)) == (BASE + "?x=1&y=2", headers)
@@ -0,0 +1,43 @@
+"""Job controller: coalescing, slots, cancellation and record pruning."""
+import asyncio
+from backend.app.services.jobs import JobController
+
+def test_submit_right_after_a_job_finishes(run):
+    async def go():
+        jobs = JobController()
+        release = asyncio.get_running_loop().create_future()
+
+        async def runner():
+            return await release
+
+        first = jobs.submit("https://example.com/a", runner)
+        await asyncio.sleep(0)
+        # Wakes the runner, then submits before the finished task's done callbacks have run
+        release.set_result(None)
+        loop = asyncio.get_running_loop()
+        submitted = loop.create_future()
+        def submit():
+            try:
+                submitted.set_result(jobs.submit("https://example.com/b", runner))
+            except Exception as e:
+                submitted.set_exception(e)
+        loop.call_soon(submit)
+        second = await submitted
+        await asyncio.sleep(0.01)
+        assert first.status == "succeeded" and first.finished_at is not None
+        assert second.status == "succeeded" and jobs._running == 0
+    run(go())
+
+def test_cancel_before_first_step_frees_the_slot(run):
+    async def go():
+        jobs = JobController()
+
+        async def runner():
+            await asyncio.sleep(0.01)
+
+        records = [jobs.submit(f"https://example.com/{i}", runner) for i in range(3)]
+        assert jobs.cancel_job(records[0].id)  # its task has not run a single step yet
+        await asyncio.sleep(0.1)
+        assert [r.status for r in records] == ["cancelled", "succeeded", "succeeded"]
+        assert jobs._running == 0
+    run(go())
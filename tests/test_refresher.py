@@ -0,0 +1,49 @@
+"""Background refresher: which cache hits and ticks re-extract an entry."""
+import time
+import pytest
+from backend.app.core.config import settings
+from backend.app.models.schemas import MediaMetadata
+from backend.app.services.refresher import BackgroundRefresher
+
+@pytest.fixture
+def refresher(monkeypatch):
+    monkeypatch.setattr(settings, "REFRESH_ENABLED", True)
+    monkeypatch.setattr(settings, "REFRESH_LEAD", 600)
+    monkeypatch.setattr(settings, "REFRESH_MIN_SCORE", 0.0)
+    refresher = BackgroundRefresher()
+    refresher.launched = []
+    monkeypatch.setattr(refresher, "_launch", refresher.launched.append)
+    return refresher
+
+def _metadata(media_id: str) -> MediaMetadata:
+    return MediaMetadata(id=media_id, title="t", platform="FallbackAPI", original_url="https://example.com")
+
+def test_entry_living_no_longer_than_the_lead_is_not_refreshed_on_every_hit(refresher):
+    expires_at = time.time() + 600  # the FallbackAPI TTL
+    refresher.track("k", "https://example.com/a", _metadata("a"), expires_at)
+    for _ in range(5):
+        refresher.on_hit("k", "https://example.com/a", _metadata("a"), expires_at)
+    refresher.tick()
+    assert refresher.launched == []
+
+def test_lead_is_capped_at_half_the_lifetime(refresher):
+    now = time.time()
+    refresher.track("k", "https://example.com/a", _metadata("a"), now + 900)
+    stats = refresher.tracked["k"]
+    assert not stats.refresh_due(now + 300)  # 600s left: inside REFRESH_LEAD, not inside half of 900s
+    assert stats.refresh_due(now + 460)
+
+def test_hit_near_expiry_of_a_long_lived_entry_refreshes_once(refresher):
+    now = time.time()
+    refresher.track("k", "https://example.com/a", _metadata("a"), now + 3600)
+    refresher.tracked["k"].expires_at = now + 300  # time has passed
+    refresher.on_hit("k", "https://example.com/a", _metadata("a"), now + 300)
+    assert refresher.launched == ["k"]
+
+def test_hits_do_not_refresh_when_disabled(refresher, monkeypatch):
+    monkeypatch.setattr(settings, "REFRESH_ENABLED", False)
+    now = time.time()
+    refresher.track("k", "https://example.com/a", _metadata("a"), now + 3600)
+    refresher.tracked["k"].expires_at = now + 300
+    refresher.on_hit("k", "https://example.com/a", _metadata("a"), now + 300)
+    assert refresher.launched == [] and "a" in refresher.by_media
@@ -0,0 +1,50 @@
+"""Segment cache: range assembly from disk and upstream, probes, and short upstream reads."""
+import asyncio
+import pytest
+from benchmarks.origin import media_bytes
+from backend.app.services.segments import SegmentEntry, segment_cache
+from backend.app.services.streamer import ResumeFailed
+from tests.conftest import lean_token
+
+MiB = 1024 * 1024
+SIZE = 8 * MiB  # what the fake origin serves for /page/<id>.html's og:video
+
+def test_ranges_match_origin_bytes_from_upstream_and_disk(run, client, origin):
+    async def go():
+        token = await lean_token(client, origin.url("/page/seg-ranges.html"))
+        for _ in range(2):  # cold (upstream), then warm (disk)
+            for start, end in ((0, 99), (MiB - 10, MiB + 9), (3 * MiB + 5, 5 * MiB), (SIZE - 7, SIZE - 1)):
+                r = await client.get("/api/v1/stream", params={"token": token}, headers={"Range": f"bytes={start}-{end}"})
+                assert r.status_code == 206
+                assert r.headers["content-range"] == f"bytes {start}-{end}/{SIZE}"
+                assert r.content == media_bytes(start, end)
+        full = await client.get("/api/v1/stream", params={"token": token})
+        assert full.status_code == 200 and full.content == media_bytes(0, SIZE - 1)
+    run(go())
+
+def test_suffix_range_keeps_the_probed_segment(run, client, origin):
+    async def go():
+        token = await lean_token(client, origin.url("/page/seg-suffix.html"))
+        before = dict(segment_cache.entries)
+        r = await client.get("/api/v1/stream", params={"token": token}, headers={"Range": "bytes=-100"})
+        assert r.status_code == 206 and r.content == media_bytes(SIZE - 100, SIZE - 1)
+        entry = next(e for k, e in segment_cache.entries.items() if k not in before)
+        for _ in range(50):
+            if 0 in entry.present:
+                break
+            await asyncio.sleep(0.02)
+        assert entry.present == {0, entry.segment_count - 1}
+    run(go())
+
+def test_short_upstream_run_aborts_instead_of_skipping(run, tmp_path):
+    async def chunks():
+        yield b"x" * 1000  # the run should have been two whole segments
+
+    async def go():
+        entry = SegmentEntry("short", str(tmp_path), 4096, 1024, "video/mp4")
+        received = bytearray()
+        with pytest.raises(ResumeFailed):
+            async for piece in segment_cache._consume_run(entry, chunks(), 0, 0, 2047, 2047):
+                received += piece
+        assert bytes(received) == b"x" * 1000 and not entry.present
+    run(go())
@@ -0,0 +1,25 @@
+"""/stream?url=: the plain proxy's range pass-through and resume after upstream drops."""
+from benchmarks.origin import media_bytes
+
+MiB = 1024 * 1024
+
+def test_ranges_pass_through(run, client, origin):
+    async def go():
+        url = origin.url(f"/media/proxy-range.mp4?size={2 * MiB}")
+        r = await client.get("/api/v1/stream", params={"url": url}, headers={"Range": "bytes=1000-1999"})
+        assert r.status_code == 206
+        assert r.headers["content-range"] == f"bytes 1000-1999/{2 * MiB}"
+        assert r.content == media_bytes(1000, 1999)
+        r = await client.get("/api/v1/stream", params={"url": url}, headers={"Range": "bytes=-10"})
+        assert r.status_code == 206 and r.content == media_bytes(2 * MiB - 10, 2 * MiB - 1)
+        r = await client.get("/api/v1/stream", params={"url": url})
+        assert r.status_code == 200 and r.content == media_bytes(0, 2 * MiB - 1)
+    run(go())
+
+def test_dropped_transfer_resumes_at_the_right_offset(run, client, origin):
+    async def go():
+        # The origin drops the first connection after 300 KiB; the proxy resumes from there
+        url = origin.url(f"/flaky/proxy-resume.mp4?size={MiB}&drop={300 * 1024}")
+        r = await client.get("/api/v1/stream", params={"url": url})
+        assert r.status_code == 200 and r.content == media_bytes(0, MiB - 1)
+    run(go())
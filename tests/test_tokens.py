@@ -0,0 +1,43 @@
+"""Format tokens: lean analyses, /stream?token= resolution and its fallbacks."""
+import time
+from benchmarks.origin import media_bytes
+from backend.app.models.schemas import MediaMetadata, MediaFormat
+from backend.app.services.cache import metadata_cache
+from backend.app.services.tokens import format_tokens, media_alias, make_token
+
+def test_uncacheable_analysis_is_reused_instead_of_reextracted(run):
+    async def go():
+        key = "https://example.com/expiring"
+        url = f"https://cdn.example.com/v.mp4?expire={int(time.time()) + 200}"  # inside CACHE_EXPIRY_MARGIN
+        metadata = MediaMetadata(id="expiring", title="t", platform="Generic", original_url=key,
+                                 formats=[MediaFormat(format_id="best", extension="mp4", url=url)])
+        assert await metadata_cache.set(key, metadata) is None
+        alias = media_alias(key)
+        await metadata_cache.set_alias(alias, key, 60)
+        before = dict(format_tokens.counters)
+        for _ in range(3):
+            _, fmt = await format_tokens.resolve(make_token(alias, "best"))
+            assert fmt.url == url
+        assert format_tokens.counters["reextracted"] == before["reextracted"]
+        assert format_tokens.counters["recent_hits"] == before["recent_hits"] + 3
+    run(go())
+
+def test_lean_token_round_trip(run, client, origin):
+    async def go():
+        r = await client.post("/api/v1/analyze", params={"lean": "1"},
+                              json={"url": "https://www.youtube.com/watch?v=test0000020"})
+        data = r.json()["data"]
+        assert "original_url" not in data and all("url" not in f for f in data["formats"])
+        fmt = next(f for f in data["formats"] if f["format_id"] == "140")
+        r = await client.get("/api/v1/stream", params={"token": fmt["token"]}, headers={"Range": "bytes=0-4095"})
+        assert r.status_code == 206 and r.content == media_bytes(0, 4095)
+    run(go())
+
+def test_bad_tokens(run, client):
+    async def go():
+        alias = media_alias("https://www.youtube.com/watch?v=test0000020")
+        cases = {"garbage": 400, make_token("A" * 16, "140"): 410, make_token(alias, "nope"): 404}
+        for token, status in cases.items():
+            r = await client.get("/api/v1/stream", params={"token": token})
+            assert r.status_code == status, (token, r.text)
+    run(go())
@@ -0,0 +1,34 @@
+"""URL router: classification and canonical forms (the cache and coalescing key)."""
+import pytest
+from backend.app.services.urls import route
+
+REEL = "https://www.instagram.com/reel/C2xYzAbCdEf/"
+
+@pytest.mark.parametrize("url", [
+    "https://www.instagram.com/reel/C2xYzAbCdEf/?igsh=MWQ1ZGUxMzBkMA==",
+    "https://www.instagram.com/p/C2xYzAbCdEf/?utm_source=ig_web_copy_link",
+    "https://instagram.com/reels/C2xYzAbCdEf/",
+    "https://www.instagram.com/natgeo/p/C2xYzAbCdEf/",
+    "https://www.instagram.com/natgeo/reel/C2xYzAbCdEf/?igsh=abc",
+])
+def test_instagram_post_shapes_share_one_key(url):
+    target = route(url)
+    assert (target.platform, target.media_id, target.url) == ("instagram", "C2xYzAbCdEf", REEL)
+
+def test_instagram_profile_is_not_a_post():
+    assert route("https://www.instagram.com/natgeo/").media_id is None
+
+@pytest.mark.parametrize("url", [
+    "https://youtu.be/dQw4w9WgXcQ?si=Xk3_abcdEFGhij12",
+    "https://m.youtube.com/shorts/dQw4w9WgXcQ?feature=share",
+    "https://www.google.com/url?sa=t&url=https%3A%2F%2Fyoutu.be%2FdQw4w9WgXcQ",
+])
+def test_youtube_shapes_share_one_key(url):
+    assert route(url).url == "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+def test_generic_query_is_kept_verbatim():
+    url = "https://s3.example.com/a.mp4?X-Amz-Signature=a%2Bb&utm_source=x&blank="
+    assert route(url + "#t=10").url == url
+
+def test_google_lookalike_hosts_are_not_unwrapped():
+    assert route("https://google.evil.com/url?q=https%3A%2F%2Fyoutu.be%2FdQw4w9WgXcQ").platform == "generic"